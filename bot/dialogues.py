@@ -132,7 +132,7 @@ async def followup_callback_handler(update: Update, context: ContextTypes.DEFAUL
     await query.message.reply_text(f"{prefix}{selected_text}")
 
     user_id = update.effective_user.id
-    response, confidence = process_user_query(selected_text, user_id, language=language)
+    response, confidence = await process_user_query(selected_text, user_id, language=language)
     await query.message.reply_text(truncate_message(response))
 
     if confidence < CONFIDENCE_THRESHOLD:
@@ -151,8 +151,9 @@ async def followup_callback_handler(update: Update, context: ContextTypes.DEFAUL
 
     followups = get_followup_suggestions(selected_text, response, language, context_low_conf)
 
-    if len(followups) == 1 and (
-        "can't provide" in followups[0].lower() or "не могу предложить" in followups[0].lower()
+    first_followup = followups[0].lower() if len(followups) == 1 else ""
+    if first_followup and (
+        "can't provide" in first_followup or "не могу предложить" in first_followup
     ):
         reply_markup = None
     elif followups:
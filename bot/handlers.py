@@ -155,7 +155,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     await thinking_indicator.start(update, context, language)
 
     # Собственно обработка запроса
-    rag_answer, confidence = process_user_query(sanitized_text, user_id, language)
+    rag_answer, confidence = await process_user_query(sanitized_text, user_id, language)
 
     # Сохраняем историю уровней уверенности
     USER_CONFIDENCE_HISTORY.setdefault(user_id, []).append(confidence)
@@ -181,9 +181,10 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                 language,
                 context_low_confidence
             )
-            if len(followups) == 1 and (
-                "can't provide" in followups[0].lower()
-                or "не могу предложить" in followups[0].lower()
+            first_followup = followups[0].lower() if len(followups) == 1 else ""
+            if first_followup and (
+                "can't provide" in first_followup
+                or "не могу предложить" in first_followup
             ):
                 reply_markup = None
             elif followups:
@@ -4,6 +4,7 @@
 """
 import os
 import warnings
+from urllib.parse import quote
 
 from dotenv import load_dotenv
 from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
@@ -42,6 +43,10 @@ class Settings(BaseModel):
     REDIS_PORT: int = Field(default=6379)
     REDIS_DB: int = Field(default=0)
     REDIS_PASSWORD: str = Field(default="")
+    REDIS_POOL_SIZE: int = Field(
+        default=64,
+        description="Максимальное количество соединений в пуле Redis для rate-limiting"
+    )
 
     # Настройки для контекстной памяти (Redis)
     CONTEXT_MEMORY_ENABLED: bool = Field(
@@ -72,6 +77,10 @@ class Settings(BaseModel):
     # Настройки для JWT
     JWT_SECRET_KEY: str = Field(default="super-secret-key-change-in-production")
     JWT_ACCESS_TOKEN_EXPIRES: int = Field(default=21600)  # 6 часов в секундах
+    BCRYPT_ROUNDS: int = Field(
+        default=12,
+        description="Стоимость bcrypt (log2 числа раундов) для новых хешей паролей"
+    )
 
     # Настройки для CRM
     CRM_ENABLED: bool = Field(default=False)
@@ -95,6 +104,11 @@ class Settings(BaseModel):
     WEB_HOST: str = Field(default="0.0.0.0")
     WEB_PORT: int = Field(default=5000)
     WEB_DEBUG: bool = Field(default=False)
+    WEB_THREADS: int = Field(default=16)
+    DOCUMENTS_ACCEL_REDIRECT_PREFIX: str = Field(
+        default="",
+        description="Internal-location nginx для отдачи документов через X-Accel-Redirect; пусто - отдаёт Flask"
+    )
 
     # Настройки для операторов
     ADMIN_IDS: list[int] = Field(default_factory=lambda: [123456789])
@@ -139,6 +153,7 @@ class Settings(BaseModel):
         "MAX_MESSAGE_LENGTH",
         "ESCALATION_COOLDOWN_MINUTES",
         "WEB_PORT",
+        "WEB_THREADS",
         "PG_PORT",
         "CONTEXT_MEMORY_MAX_MESSAGES",
         "CONTEXT_MEMORY_TTL_DAYS",
@@ -170,6 +185,13 @@ class Settings(BaseModel):
             raise ValueError("CONTEXT_MEMORY_REDIS_DB должен быть в диапазоне от 0 до 15")
         return value
 
+    @field_validator("BCRYPT_ROUNDS")
+    @classmethod
+    def bcrypt_rounds_range(cls, value: int):
+        if not 4 <= value <= 31:
+            raise ValueError("BCRYPT_ROUNDS должен быть в диапазоне от 4 до 31")
+        return value
+
     @model_validator(mode="after")
     def warn_on_insecure_defaults(self):
         if self.JWT_SECRET_KEY == "super-secret-key-change-in-production":
@@ -200,6 +222,7 @@ def _collect_env() -> dict[str, str]:
         "REDIS_PORT",
         "REDIS_DB",
         "REDIS_PASSWORD",
+        "REDIS_POOL_SIZE",
         # Настройки контекстной памяти
         "CONTEXT_MEMORY_ENABLED",
         "CONTEXT_MEMORY_MAX_MESSAGES",
@@ -214,6 +237,7 @@ def _collect_env() -> dict[str, str]:
         "WEB_RATE_LIMIT_MINUTES",
         "JWT_SECRET_KEY",
         "JWT_ACCESS_TOKEN_EXPIRES",
+        "BCRYPT_ROUNDS",
         "CRM_ENABLED",
         "CRM_ENDPOINT",
         "CRM_LOG_PATH",
@@ -229,6 +253,8 @@ def _collect_env() -> dict[str, str]:
         "WEB_HOST",
         "WEB_PORT",
         "WEB_DEBUG",
+        "WEB_THREADS",
+        "DOCUMENTS_ACCEL_REDIRECT_PREFIX",
         "ADMIN_IDS",
         "OPERATOR_ID",
         "ESCALATION_COOLDOWN_MINUTES",
@@ -273,8 +299,10 @@ REDIS_HOST = SETTINGS.REDIS_HOST
 REDIS_PORT = SETTINGS.REDIS_PORT
 REDIS_DB = SETTINGS.REDIS_DB
 REDIS_PASSWORD = SETTINGS.REDIS_PASSWORD
+REDIS_POOL_SIZE = SETTINGS.REDIS_POOL_SIZE
 if REDIS_PASSWORD:
-    REDIS_URL = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
+    # Пароль экранируется, чтобы "/", "#", "%" и "@" не ломали разбор URL
+    REDIS_URL = f"redis://:{quote(REDIS_PASSWORD, safe='')}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
 else:
     REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
 
@@ -295,6 +323,7 @@ WEB_RATE_LIMIT_MINUTES = SETTINGS.WEB_RATE_LIMIT_MINUTES
 # Настройки для JWT
 JWT_SECRET_KEY = SETTINGS.JWT_SECRET_KEY
 JWT_ACCESS_TOKEN_EXPIRES = SETTINGS.JWT_ACCESS_TOKEN_EXPIRES  # 6 часов в секундах
+BCRYPT_ROUNDS = SETTINGS.BCRYPT_ROUNDS
 
 # Настройки для CRM
 CRM_ENABLED = SETTINGS.CRM_ENABLED
@@ -318,6 +347,10 @@ RERANKING_INITIAL_CHUNKS = SETTINGS.RERANKING_INITIAL_CHUNKS
 WEB_HOST = SETTINGS.WEB_HOST
 WEB_PORT = SETTINGS.WEB_PORT
 WEB_DEBUG = SETTINGS.WEB_DEBUG
+# Число потоков WSGI-сервера waitress; не больше pool_size + max_overflow движка БД
+WEB_THREADS = SETTINGS.WEB_THREADS
+# Префикс internal-location nginx для X-Accel-Redirect (например, /protected-docs/)
+DOCUMENTS_ACCEL_REDIRECT_PREFIX = SETTINGS.DOCUMENTS_ACCEL_REDIRECT_PREFIX
 
 # Настройки для операторов
 ADMIN_IDS = SETTINGS.ADMIN_IDS
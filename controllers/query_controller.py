@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from typing import Dict, Any, Optional, Tuple
@@ -5,7 +6,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 from config import CONFIDENCE_THRESHOLD, CHROMA_DB_PATH, CONTEXT_MEMORY_ENABLED
-from utils.openai_client import OpenAIClient
+from utils.openai_client import get_wrapped_client
 from storage.database_unified import save_message
 from retrieval.retriever import retrieve_relevant_docs
 
@@ -20,9 +21,9 @@ from utils.context_memory import (
 logger = logging.getLogger(__name__)
 
 # Инициализируем клиент OpenAI
-openai_client = OpenAIClient()
+openai_client = get_wrapped_client()
 
-def process_user_query(user_text: str, user_id: int, language: str = 'ru') -> Tuple[str, float]:
+async def process_user_query(user_text: str, user_id: int, language: str = 'ru') -> Tuple[str, float]:
     """
     Обрабатывает запрос пользователя через RAG-пайплайн.
     
@@ -55,7 +56,8 @@ def process_user_query(user_text: str, user_id: int, language: str = 'ru') -> Tu
         
         # Получаем релевантные документы из базы знаний
         # Используем query_for_rag (может быть переформулирован с контекстом)
-        relevant_docs = retrieve_relevant_docs(query_for_rag, top_k=3)
+        # Поиск и переранжирование синхронные, поэтому выполняются в потоке
+        relevant_docs = await asyncio.to_thread(retrieve_relevant_docs, query_for_rag, top_k=3)
         logger.info(f"Retrieved {len(relevant_docs)} relevant documents for query: {user_text[:50]}...")
         
         # Формируем контекст из найденных документов
@@ -113,7 +115,7 @@ def process_user_query(user_text: str, user_id: int, language: str = 'ru') -> Tu
             """
         
         # Получаем ответ от модели
-        response, confidence = openai_client.get_completion(
+        response, confidence = await openai_client.aget_completion(
             system_prompt=system_prompt,
             user_message=user_text,
             user_id=user_id,
@@ -0,0 +1,23 @@
+"""Миграция для хеша содержимого загруженных документов."""
+
+from alembic import op
+import sqlalchemy as sa
+
+# --- Метаданные Миграции ---
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+# ---------------------------
+
+# Версия миграции: 0006
+# Описание: Колонка documents.content_sha (SHA-256 содержимого), по которой
+# повторная загрузка того же файла не индексируется заново
+
+
+def upgrade():
+    op.add_column('documents', sa.Column('content_sha', sa.String(64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('documents', 'content_sha')
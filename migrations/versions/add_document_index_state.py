@@ -0,0 +1,29 @@
+"""Миграция для таблицы отпечатков проиндексированных файлов."""
+
+from alembic import op
+import sqlalchemy as sa
+
+# --- Метаданные Миграции ---
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+# ---------------------------
+
+# Версия миграции: 0004
+# Описание: Таблица document_index_state с (mtime, size) файлов на момент индексации,
+# чтобы переиндексация пропускала неизменённые файлы
+
+
+def upgrade():
+    op.create_table(
+        'document_index_state',
+        sa.Column('path', sa.String(1024), primary_key=True),
+        sa.Column('mtime', sa.Float(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('indexed_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('document_index_state')
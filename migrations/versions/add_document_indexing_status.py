@@ -0,0 +1,23 @@
+"""Миграция для статуса фоновой индексации документов."""
+
+from alembic import op
+import sqlalchemy as sa
+
+# --- Метаданные Миграции ---
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+# ---------------------------
+
+# Версия миграции: 0005
+# Описание: Колонка documents.indexing_status (pending/indexed/failed) для
+# индексации загруженных документов в фоне
+
+
+def upgrade():
+    op.add_column('documents', sa.Column('indexing_status', sa.String(20), nullable=True))
+
+
+def downgrade():
+    op.drop_column('documents', 'indexing_status')
@@ -0,0 +1,27 @@
+"""Миграция для уникального индекса по пути документа."""
+
+from alembic import op
+
+# --- Метаданные Миграции ---
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+# ---------------------------
+
+# Версия миграции: 0007
+# Описание: Уникальный индекс documents.path для загрузки через
+# INSERT ... ON CONFLICT (path) DO UPDATE. Дубликаты путей, если они есть,
+# удаляются с сохранением самой ранней записи
+
+
+def upgrade():
+    op.execute(
+        "DELETE FROM documents a USING documents b "
+        "WHERE a.path = b.path AND a.id > b.id"
+    )
+    op.create_index('ux_documents_path', 'documents', ['path'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ux_documents_path', table_name='documents')
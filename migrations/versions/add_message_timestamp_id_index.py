@@ -0,0 +1,27 @@
+"""Миграция для индекса курсорной пагинации истории сообщений."""
+
+from alembic import op
+import sqlalchemy as sa
+
+# --- Метаданные Миграции ---
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+# ---------------------------
+
+# Версия миграции: 0008
+# Описание: Составной индекс messages (timestamp DESC, id DESC) для страниц
+# истории по курсору без COUNT и OFFSET
+
+
+def upgrade():
+    op.create_index(
+        'ix_messages_timestamp_id',
+        'messages',
+        [sa.text('timestamp DESC'), sa.text('id DESC')]
+    )
+
+
+def downgrade():
+    op.drop_index('ix_messages_timestamp_id', table_name='messages')
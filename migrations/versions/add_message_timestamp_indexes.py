@@ -0,0 +1,29 @@
+"""Миграция для составных индексов по времени сообщений."""
+
+from alembic import op
+import sqlalchemy as sa
+
+# --- Метаданные Миграции ---
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+# ---------------------------
+
+# Версия миграции: 0003
+# Описание: Составные индексы (user_id, timestamp DESC) и (session_id, timestamp DESC)
+# для выборки последних сообщений; заменяют одиночные индексы по user_id и session_id
+
+
+def upgrade():
+    op.create_index('ix_messages_user_id_timestamp', 'messages', ['user_id', sa.text('timestamp DESC')])
+    op.create_index('ix_messages_session_id_timestamp', 'messages', ['session_id', sa.text('timestamp DESC')])
+    op.drop_index('ix_messages_session_id', table_name='messages')
+    op.drop_index('ix_messages_user_id', table_name='messages')
+
+
+def downgrade():
+    op.create_index('ix_messages_user_id', 'messages', ['user_id'])
+    op.create_index('ix_messages_session_id', 'messages', ['session_id'])
+    op.drop_index('ix_messages_session_id_timestamp', table_name='messages')
+    op.drop_index('ix_messages_user_id_timestamp', table_name='messages')
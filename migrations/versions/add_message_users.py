@@ -0,0 +1,32 @@
+"""Миграция для таблицы пользователей, отправлявших сообщения."""
+
+from alembic import op
+import sqlalchemy as sa
+
+# --- Метаданные Миграции ---
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+# ---------------------------
+
+# Версия миграции: 0009
+# Описание: Таблица message_users (по строке на пользователя с сообщениями),
+# чтобы дашборд считал уникальных пользователей без COUNT(DISTINCT) по messages
+
+
+def upgrade():
+    op.create_table(
+        'message_users',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('first_seen', sa.DateTime(), nullable=False),
+    )
+    # Заполняем по уже сохранённым сообщениям
+    op.execute(
+        "INSERT INTO message_users (user_id, first_seen) "
+        "SELECT user_id, MIN(timestamp) FROM messages GROUP BY user_id"
+    )
+
+
+def downgrade():
+    op.drop_table('message_users')
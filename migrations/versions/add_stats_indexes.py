@@ -0,0 +1,28 @@
+"""Миграция для индексов запросов статистики."""
+
+from alembic import op
+
+# --- Метаданные Миграции ---
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+# ---------------------------
+
+# Версия миграции: 0010
+# Описание: Индексы для фильтров по периоду и соединений в /api/stats:
+# sessions.start_time, ratings.session_id, ratings.timestamp, feedback.rating_id
+
+
+def upgrade():
+    op.create_index('ix_sessions_start_time', 'sessions', ['start_time'])
+    op.create_index('ix_ratings_session_id', 'ratings', ['session_id'])
+    op.create_index('ix_ratings_timestamp', 'ratings', ['timestamp'])
+    op.create_index('ix_feedback_rating_id', 'feedback', ['rating_id'])
+
+
+def downgrade():
+    op.drop_index('ix_feedback_rating_id', table_name='feedback')
+    op.drop_index('ix_ratings_timestamp', table_name='ratings')
+    op.drop_index('ix_ratings_session_id', table_name='ratings')
+    op.drop_index('ix_sessions_start_time', table_name='sessions')
@@ -0,0 +1,22 @@
+"""Миграция для email пользователей веб-интерфейса."""
+
+from alembic import op
+import sqlalchemy as sa
+
+# --- Метаданные Миграции ---
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+# ---------------------------
+
+# Версия миграции: 0011
+# Описание: Колонка web_users.email, которую показывает и изменяет страница профиля
+
+
+def upgrade():
+    op.add_column('web_users', sa.Column('email', sa.String(255), nullable=True))
+
+
+def downgrade():
+    op.drop_column('web_users', 'email')
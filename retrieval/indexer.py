@@ -21,6 +21,9 @@ def index_documents():
     print(f"[DEBUG] index_documents: Found {len(files)} file(s) in {DOCUMENTS_PATH}")
 
     for file_name in files:
+        # Скрытые файлы - временные файлы загрузок и служебные данные, не документы
+        if file_name.startswith("."):
+            continue
         file_path = os.path.join(DOCUMENTS_PATH, file_name)
         if not os.path.isfile(file_path):
             continue
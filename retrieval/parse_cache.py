@@ -0,0 +1,110 @@
+# parse_cache.py
+"""
+Кэш разобранных документов, адресуемый по содержимому.
+
+Для каждого файла хранятся его чанки и их эмбеддинги под ключом
+"{модель эмбеддингов}:{SHA-256 содержимого}". Если файл не менялся,
+переиндексация берёт чанки и эмбеддинги отсюда и не вызывает ни парсер,
+ни API эмбеддингов. Смена модели меняет ключ, поэтому старые записи
+просто перестают находиться.
+
+Кэш хранится в SQLite-файле DOCUMENTS_PATH/.cache/parse_cache.sqlite3;
+каждое обращение открывает своё соединение, поэтому модулем можно
+пользоваться из нескольких процессов.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import List, Optional, Tuple
+
+import orjson
+
+from config import DOCUMENTS_PATH
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(DOCUMENTS_PATH, ".cache")
+CACHE_DB_PATH = os.path.join(CACHE_DIR, "parse_cache.sqlite3")
+
+# Размер блока при чтении файла для хеширования
+HASH_BLOCK_SIZE = 1024 * 1024
+# Документы с большим числом чанков не кэшируются: для записи пришлось бы
+# держать в памяти все их эмбеддинги
+MAX_CACHED_CHUNKS = 2048
+
+def file_sha256(file_path: str) -> str:
+    """
+    Считает SHA-256 содержимого файла, читая его блоками.
+
+    Args:
+        file_path: Путь к файлу
+
+    Returns:
+        str: Хеш в шестнадцатеричном виде
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS parse_cache ("
+        "key TEXT PRIMARY KEY, chunks BLOB NOT NULL, embeddings BLOB NOT NULL)"
+    )
+    return conn
+
+def get(sha: str, model: str) -> Optional[Tuple[List[str], List[List[float]]]]:
+    """
+    Возвращает закэшированные чанки и эмбеддинги документа.
+
+    Args:
+        sha: SHA-256 содержимого файла
+        model: Идентификатор модели эмбеддингов
+
+    Returns:
+        Кортеж (чанки, эмбеддинги) или None, если записи нет или кэш недоступен
+    """
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT chunks, embeddings FROM parse_cache WHERE key = ?",
+                (f"{model}:{sha}",)
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Parse cache lookup failed: {e}")
+        return None
+
+    if row is None:
+        return None
+    return orjson.loads(row[0]), orjson.loads(row[1])
+
+def put(sha: str, model: str, chunks: List[str], embeddings: List[List[float]]) -> None:
+    """
+    Сохраняет чанки и эмбеддинги документа в кэш.
+
+    Args:
+        sha: SHA-256 содержимого файла
+        model: Идентификатор модели эмбеддингов
+        chunks: Чанки документа
+        embeddings: Эмбеддинги чанков
+    """
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO parse_cache (key, chunks, embeddings) VALUES (?, ?, ?)",
+                    (f"{model}:{sha}", orjson.dumps(chunks), orjson.dumps(embeddings))
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Parse cache write failed: {e}")
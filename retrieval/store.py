@@ -1,14 +1,18 @@
 # store.py
 import os
+import re
 import chromadb
 import logging
 # ВАЖНО: для langchain==0.1.14 используем:
 from langchain.embeddings.openai import OpenAIEmbeddings
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterator, List, Tuple
 from config import CHROMA_DB_PATH
 
 logger = logging.getLogger(__name__)
 
+# Модель эмбеддингов; входит в ключ кэша разбора (retrieval/parse_cache.py)
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
 client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
 
 # Основная коллекция документов
@@ -19,38 +23,121 @@ collection = client.get_or_create_collection(name=COLLECTION_NAME)
 FAQ_COLLECTION_NAME = "faq_docs"
 faq_collection = client.get_or_create_collection(name=FAQ_COLLECTION_NAME)
 
+# Сколько чанков эмбеддится и сохраняется за раз при потоковой индексации
+STORE_BATCH_SIZE = 256
+
+_TOKEN_RE = re.compile(r"\S+")
+
+def iter_chunks(text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> Iterator[str]:
+    """
+    Лениво разбивает текст на чанки по словам с перекрытием.
+    В памяти держится только текущее окно слов, а не весь список токенов.
+    """
+    step = chunk_size - chunk_overlap
+    window = []
+    for match in _TOKEN_RE.finditer(text):
+        window.append(match.group())
+        if len(window) == chunk_size:
+            yield " ".join(window)
+            del window[:step]
+    # Как и раньше, хвост длиннее шага даёт ещё чанки из перекрытия
+    for start in range(0, len(window), step):
+        yield " ".join(window[start:])
+
 def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
-    tokens = text.split()
-    chunks = []
-    current_start = 0
-    while current_start < len(tokens):
-        end = current_start + chunk_size
-        chunk = tokens[current_start:end]
-        chunks.append(" ".join(chunk))
-        current_start = end - chunk_overlap
-        if current_start < 0:
-            current_start = 0
-    return chunks
+    return list(iter_chunks(text, chunk_size, chunk_overlap))
+
+def iter_embedded_batches(content: str, batch_size: int = STORE_BATCH_SIZE) -> Iterator[Tuple[List[str], List[List[float]]]]:
+    """
+    Разбивает текст на чанки и считает эмбеддинги пачками по batch_size чанков.
+    
+    Args:
+        content: Текст документа
+        batch_size: Размер пачки
+    
+    Yields:
+        Пары (чанки пачки, их эмбеддинги)
+    """
+    embedder = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    batch = []
+    for chunk in iter_chunks(content):
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch, embedder.embed_documents(batch)
+            batch = []
+    if batch:
+        yield batch, embedder.embed_documents(batch)
+
+def store_chunk_batch(source_path: str, start_index: int, chunks: List[str], vectors: List[List[float]]):
+    """
+    Сохраняет в ChromaDB (corporate_docs) пачку чанков документа.
+    
+    Args:
+        source_path: Путь к источнику
+        start_index: Порядковый номер первого чанка пачки в документе
+        chunks: Чанки
+        vectors: Эмбеддинги чанков
+    """
+    indices = range(start_index, start_index + len(chunks))
+    ids = [f"{os.path.basename(source_path)}_{idx}" for idx in indices]
+
+    _delete_ids_if_exist(ids, collection)
+
+    collection.add(
+        documents=chunks,
+        embeddings=vectors,
+        metadatas=[{"source_path": source_path, "chunk_index": idx} for idx in indices],
+        ids=ids
+    )
 
 def store_document_chunks(content: str, source_path: str):
     """
     Разбивает текст на чанки, создает эмбеддинги и сохраняет в ChromaDB (corporate_docs).
+    Работает пачками по STORE_BATCH_SIZE чанков, поэтому память не растёт с размером документа.
     """
-    embedder = OpenAIEmbeddings()
-    chunks = chunk_text(content)
-    if not chunks:
-        return
+    start_index = 0
+    for chunks, vectors in iter_embedded_batches(content):
+        store_chunk_batch(source_path, start_index, chunks, vectors)
+        start_index += len(chunks)
+
+def embed_documents_chunks(contents: List[str]) -> List[Tuple[List[str], List[List[float]]]]:
+    """
+    Разбивает тексты на чанки и считает эмбеддинги всех чанков одним вызовом.
+    
+    Args:
+        contents: Тексты документов
+    
+    Returns:
+        Для каждого текста пара (чанки, эмбеддинги чанков)
+    """
+    chunked = [chunk_text(content) for content in contents]
+    all_chunks = [chunk for chunks in chunked for chunk in chunks]
+    vectors = OpenAIEmbeddings(model=EMBEDDING_MODEL).embed_documents(all_chunks) if all_chunks else []
+
+    result, offset = [], 0
+    for chunks in chunked:
+        result.append((chunks, vectors[offset:offset + len(chunks)]))
+        offset += len(chunks)
+    return result
 
+def store_embedded_chunks(entries: List[Tuple[str, List[str], List[List[float]]]]):
+    """
+    Сохраняет в ChromaDB (corporate_docs) готовые чанки и эмбеддинги одной записью.
+    
+    Args:
+        entries: Список (путь к источнику, чанки, эмбеддинги)
+    """
     documents, metadatas, ids, embeddings = [], [], [], []
 
-    for idx, chunk in enumerate(chunks):
-        chunk_id = f"{os.path.basename(source_path)}_{idx}"
-        documents.append(chunk)
-        metadatas.append({"source_path": source_path, "chunk_index": idx})
-        ids.append(chunk_id)
+    for source_path, chunks, vectors in entries:
+        for idx, (chunk, vector) in enumerate(zip(chunks, vectors)):
+            documents.append(chunk)
+            metadatas.append({"source_path": source_path, "chunk_index": idx})
+            ids.append(f"{os.path.basename(source_path)}_{idx}")
+            embeddings.append(vector)
 
-    vectors = embedder.embed_documents(documents)
-    embeddings.extend(vectors)
+    if not documents:
+        return
 
     _delete_ids_if_exist(ids, collection)
 
@@ -89,7 +176,7 @@ def get_similar_docs(query: str, k: int = 3) -> List[Dict[str, Any]]:
     Выполняет векторный поиск по основной коллекции ChromaDB,
     возвращает до k самых релевантных чанков.
     """
-    embedder = OpenAIEmbeddings()
+    embedder = OpenAIEmbeddings(model=EMBEDDING_MODEL)
     query_embedding = embedder.embed_query(query)
 
     results = collection.query(
@@ -123,7 +210,7 @@ def store_faq_question(question: str, faq_id: str):
     Предполагается, что подробный ответ (если нужен) хранится где-то ещё,
     либо мы можем здесь же хранить и ответ.
     """
-    embedder = OpenAIEmbeddings()
+    embedder = OpenAIEmbeddings(model=EMBEDDING_MODEL)
     vector = embedder.embed_query(question)
 
     _delete_ids_if_exist([faq_id], faq_collection)
@@ -140,7 +227,7 @@ def get_similar_faq(query: str, k: int = 3) -> List[str]:
     Аналогично get_similar_docs, но для FAQ.
     Возвращает список близких по смыслу коротких вопросов (strings).
     """
-    embedder = OpenAIEmbeddings()
+    embedder = OpenAIEmbeddings(model=EMBEDDING_MODEL)
     query_embedding = embedder.embed_query(query)
 
     results = faq_collection.query(
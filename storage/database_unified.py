@@ -4,6 +4,8 @@
 """
 import os
 import logging
+import queue
+import threading
 from datetime import datetime
 from typing import Optional, Dict, Any, List, Tuple
 from contextlib import contextmanager
@@ -20,7 +22,9 @@ from sqlalchemy import (
     Text,
     func,
     Index,
+    text,
 )
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, Session
 
@@ -36,6 +40,8 @@ class UserSession(Base):
     __tablename__ = 'sessions'
     __table_args__ = (
         Index('ix_sessions_user_id', 'user_id'),
+        # Метрики дашборда и дневная статистика выбирают сессии за период
+        Index('ix_sessions_start_time', 'start_time'),
     )
     
     id = Column(Integer, primary_key=True)
@@ -53,8 +59,12 @@ class UserSession(Base):
 class Message(Base):
     __tablename__ = 'messages'
     __table_args__ = (
-        Index('ix_messages_user_id', 'user_id'),
-        Index('ix_messages_session_id', 'session_id'),
+        # Составные индексы отдают последнее сообщение пользователя или сессии
+        # без сортировки; они же покрывают фильтры по одному user_id/session_id
+        Index('ix_messages_user_id_timestamp', 'user_id', text('timestamp DESC')),
+        Index('ix_messages_session_id_timestamp', 'session_id', text('timestamp DESC')),
+        # Курсорная пагинация истории по (timestamp, id)
+        Index('ix_messages_timestamp_id', text('timestamp DESC'), text('id DESC')),
     )
     
     id = Column(Integer, primary_key=True)
@@ -70,8 +80,23 @@ class Message(Base):
     session = relationship("UserSession", back_populates="messages")
     followups = relationship("FollowupQuestion", back_populates="message")
 
+class MessageUser(Base):
+    """
+    Пользователь, отправивший хотя бы одно сообщение. Таблицу пополняет save_message,
+    и дашборд считает уникальных пользователей по ней, без COUNT(DISTINCT) по messages
+    """
+    __tablename__ = 'message_users'
+
+    user_id = Column(Integer, primary_key=True)
+    first_seen = Column(DateTime, nullable=False, default=datetime.now)
+
 class Rating(Base):
     __tablename__ = 'ratings'
+    __table_args__ = (
+        # Соединение оценок с сессиями в статистике и выборка отзывов за период
+        Index('ix_ratings_session_id', 'session_id'),
+        Index('ix_ratings_timestamp', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey('sessions.id'), nullable=False)
@@ -84,6 +109,9 @@ class Rating(Base):
 
 class Feedback(Base):
     __tablename__ = 'feedback'
+    __table_args__ = (
+        Index('ix_feedback_rating_id', 'rating_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     rating_id = Column(Integer, ForeignKey('ratings.id'), nullable=False)
@@ -127,6 +155,7 @@ class WebUser(Base):
     id = Column(Integer, primary_key=True)
     username = Column(String(50), nullable=False, unique=True)
     password_hash = Column(String(255), nullable=False)
+    email = Column(String(255), nullable=True)
     role = Column(String(20), nullable=False)  # 'admin', 'operator', 'viewer'
     created_at = Column(DateTime, nullable=False, default=datetime.now)
     last_login = Column(DateTime, nullable=True)
@@ -148,6 +177,9 @@ class Chat(Base):
 
 class Document(Base):
     __tablename__ = 'documents'
+    __table_args__ = (
+        Index('ux_documents_path', 'path', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
@@ -155,6 +187,17 @@ class Document(Base):
     description = Column(Text, nullable=True)
     uploaded_by = Column(Integer, ForeignKey('web_users.id'), nullable=False)
     uploaded_at = Column(DateTime, nullable=False, default=datetime.now)
+    indexing_status = Column(String(20), nullable=True)  # 'pending', 'indexed', 'failed'
+    content_sha = Column(String(64), nullable=True)  # SHA-256 содержимого на момент загрузки
+
+class DocumentIndexState(Base):
+    """Отпечаток (mtime, size) файла на момент последней индексации"""
+    __tablename__ = 'document_index_state'
+
+    path = Column(String(1024), primary_key=True)
+    mtime = Column(Float, nullable=False)
+    size = Column(Integer, nullable=False)
+    indexed_at = Column(DateTime, nullable=False, default=datetime.now)
 
 # Создаем движок с правильной конфигурацией connection pooling
 engine = create_engine(
@@ -341,6 +384,14 @@ def save_message(user_id: int, message_text: str, bot_response: str,
             language=language
         )
         db.add(new_message)
+        
+        # Отмечаем пользователя в message_users; если он уже есть, запись не меняется
+        insert = postgresql.insert if db.get_bind().dialect.name == 'postgresql' else sqlite.insert
+        db.execute(
+            insert(MessageUser)
+            .values(user_id=user_id, first_seen=new_message.timestamp)
+            .on_conflict_do_nothing(index_elements=['user_id'])
+        )
         db.commit()
         db.refresh(new_message)
         
@@ -434,6 +485,76 @@ def log_suspicious_input(user_id: int, input_text: str, detected_pattern: str, a
         db.add(new_suspicious_input)
         logger.debug(f"Logged suspicious input from user {user_id}")
 
+def log_suspicious_inputs(entries: List[Tuple[int, str, str, str]]):
+    """
+    Логирует несколько подозрительных вводов одной транзакцией
+    
+    Args:
+        entries: Список кортежей (user_id, input_text, detected_pattern, action_taken)
+    """
+    if not entries:
+        return
+
+    now = datetime.now()
+    with db_session() as db:
+        db.add_all([
+            SuspiciousInput(
+                user_id=user_id,
+                timestamp=now,
+                input_text=input_text,
+                detected_pattern=detected_pattern,
+                action_taken=action_taken
+            )
+            for user_id, input_text, detected_pattern, action_taken in entries
+        ])
+        logger.debug(f"Logged {len(entries)} suspicious inputs")
+
+# Очередь для фоновой записи подозрительных вводов, чтобы обработчики
+# сообщений не ждали запись в БД
+_SUSPICIOUS_INPUT_QUEUE: "queue.Queue[List[Tuple[int, str, str, str]]]" = queue.Queue()
+_SUSPICIOUS_INPUT_BATCH_SIZE = 100
+_suspicious_input_worker: Optional[threading.Thread] = None
+_suspicious_input_worker_lock = threading.Lock()
+
+def _suspicious_input_writer():
+    """Фоновый поток: забирает накопившиеся записи из очереди и пишет их пачкой"""
+    while True:
+        batch = list(_SUSPICIOUS_INPUT_QUEUE.get())
+        while len(batch) < _SUSPICIOUS_INPUT_BATCH_SIZE:
+            try:
+                batch.extend(_SUSPICIOUS_INPUT_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            log_suspicious_inputs(batch)
+        except Exception as e:
+            logger.error(f"Error logging suspicious inputs: {e}")
+
+def enqueue_suspicious_inputs(entries: List[Tuple[int, str, str, str]]):
+    """
+    Ставит подозрительные вводы в очередь на фоновую запись в базу данных
+    
+    Args:
+        entries: Список кортежей (user_id, input_text, detected_pattern, action_taken)
+    """
+    global _suspicious_input_worker
+
+    if not entries:
+        return
+
+    if _suspicious_input_worker is None:
+        with _suspicious_input_worker_lock:
+            if _suspicious_input_worker is None:
+                worker = threading.Thread(
+                    target=_suspicious_input_writer,
+                    name="suspicious-input-writer",
+                    daemon=True
+                )
+                worker.start()
+                _suspicious_input_worker = worker
+
+    _SUSPICIOUS_INPUT_QUEUE.put_nowait(entries)
+
 # Функции для работы с follow-up вопросами
 def save_followup_question(message_id: int, question_text: str, 
                       original_query: str = None, confidence_score: float = None, 
@@ -0,0 +1,211 @@
+"""
+Хранилище активных сессий пользователей с операторами.
+
+Сессии хранятся в Redis и поэтому общие для всех воркеров веб-интерфейса:
+- op:session:{user_id} - хеш {operator_id, session_id}
+- op:sessions:{operator_id} - множество user_id, принятых оператором
+
+Принцип работы: Graceful Degradation
+- Если Redis недоступен, сессии хранятся в памяти текущего процесса
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+import redis
+
+from utils.rate_limit import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY_PREFIX = "op:session:"
+OPERATOR_SESSIONS_KEY_PREFIX = "op:sessions:"
+
+# Сессии на случай недоступности Redis: {user_id: {"operator_id": ..., "session_id": ...}}
+_local_sessions: Dict[int, Dict[str, int]] = {}
+# Обратный индекс {operator_id: {user_id, ...}}, как op:sessions:{operator_id} в Redis
+_local_operator_sessions: Dict[int, Set[int]] = defaultdict(set)
+_local_sessions_lock = threading.Lock()
+
+# Атомарное закрепление: сессия создаётся, только если пользователь ещё ни за кем
+# не закреплён. KEYS[1] - op:session:{user_id}, KEYS[2] - op:sessions:{operator_id};
+# ARGV: operator_id, session_id, user_id. Возвращает 1 при успехе, 0 если занято
+CLAIM_SESSION_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'operator_id', ARGV[1], 'session_id', ARGV[2])
+redis.call('SADD', KEYS[2], ARGV[3])
+return 1
+"""
+_claim_script = None
+
+def _session_key(user_id: int) -> str:
+    return f"{SESSION_KEY_PREFIX}{user_id}"
+
+def _operator_key(operator_id: int) -> str:
+    return f"{OPERATOR_SESSIONS_KEY_PREFIX}{operator_id}"
+
+def _parse_session(data: Dict[str, str]) -> Optional[Dict[str, int]]:
+    if not data:
+        return None
+    return {
+        "operator_id": int(data["operator_id"]),
+        "session_id": int(data["session_id"])
+    }
+
+def _forget_local_session(user_id: int) -> None:
+    # Вызывается под _local_sessions_lock
+    session = _local_sessions.pop(user_id, None)
+    if session is None:
+        return
+    user_ids = _local_operator_sessions.get(session["operator_id"])
+    if user_ids is not None:
+        user_ids.discard(user_id)
+        if not user_ids:
+            del _local_operator_sessions[session["operator_id"]]
+
+def get_operator_session(user_id: int) -> Optional[Dict[str, int]]:
+    """
+    Возвращает активную сессию пользователя с оператором.
+
+    Args:
+        user_id: ID пользователя
+
+    Returns:
+        Optional[Dict[str, int]]: {"operator_id": ..., "session_id": ...} или None
+    """
+    client = get_redis_client()
+    if client is not None:
+        try:
+            return _parse_session(client.hgetall(_session_key(user_id)))
+        except redis.RedisError as e:
+            logger.warning(f"Failed to read operator session for user {user_id} from Redis: {e}")
+
+    with _local_sessions_lock:
+        session = _local_sessions.get(user_id)
+        return dict(session) if session else None
+
+def set_operator_session(user_id: int, operator_id: int, session_id: int) -> bool:
+    """
+    Закрепляет пользователя за оператором, если он ещё ни за кем не закреплён.
+    Проверка и запись выполняются атомарно, поэтому из двух операторов,
+    одновременно принимающих чат, его получает только один.
+
+    Args:
+        user_id: ID пользователя
+        operator_id: ID оператора
+        session_id: ID сессии пользователя
+
+    Returns:
+        bool: True, если пользователь закреплён за оператором; False, если он уже занят
+    """
+    global _claim_script
+
+    client = get_redis_client()
+    if client is not None:
+        try:
+            # register_script использует EVALSHA и сам загружает скрипт при NOSCRIPT
+            if _claim_script is None or _claim_script.registered_client is not client:
+                _claim_script = client.register_script(CLAIM_SESSION_SCRIPT)
+            claimed = _claim_script(
+                keys=[_session_key(user_id), _operator_key(operator_id)],
+                args=[operator_id, session_id, user_id]
+            )
+            return bool(claimed)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to save operator session for user {user_id} to Redis: {e}")
+
+    with _local_sessions_lock:
+        if user_id in _local_sessions:
+            return False
+        _local_sessions[user_id] = {"operator_id": operator_id, "session_id": session_id}
+        _local_operator_sessions[operator_id].add(user_id)
+        return True
+
+def delete_operator_session(user_id: int) -> None:
+    """
+    Завершает закрепление пользователя за оператором.
+
+    Args:
+        user_id: ID пользователя
+    """
+    client = get_redis_client()
+    if client is not None:
+        try:
+            operator_id = client.hget(_session_key(user_id), "operator_id")
+            pipe = client.pipeline()
+            pipe.delete(_session_key(user_id))
+            if operator_id is not None:
+                pipe.srem(_operator_key(operator_id), user_id)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to delete operator session for user {user_id} from Redis: {e}")
+
+    with _local_sessions_lock:
+        _forget_local_session(user_id)
+
+def get_operator_sessions(operator_id: int) -> Dict[int, Dict[str, int]]:
+    """
+    Возвращает все сессии, принятые оператором.
+
+    Args:
+        operator_id: ID оператора
+
+    Returns:
+        Dict[int, Dict[str, int]]: {user_id: {"operator_id": ..., "session_id": ...}}
+    """
+    client = get_redis_client()
+    if client is not None:
+        try:
+            user_ids = [int(user_id) for user_id in client.smembers(_operator_key(operator_id))]
+            if not user_ids:
+                return {}
+
+            # Все хеши сессий одним пакетом
+            pipe = client.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.hgetall(_session_key(user_id))
+
+            sessions = {}
+            for user_id, data in zip(user_ids, pipe.execute()):
+                session = _parse_session(data)
+                if session and session["operator_id"] == operator_id:
+                    sessions[user_id] = session
+            return sessions
+        except redis.RedisError as e:
+            logger.warning(f"Failed to read sessions of operator {operator_id} from Redis: {e}")
+
+    with _local_sessions_lock:
+        return {
+            user_id: dict(_local_sessions[user_id])
+            for user_id in _local_operator_sessions.get(operator_id, ())
+        }
+
+def get_assigned_user_ids(user_ids: Iterable[int]) -> Set[int]:
+    """
+    Отбирает пользователей, уже закреплённых за операторами.
+
+    Args:
+        user_ids: ID пользователей для проверки
+
+    Returns:
+        Set[int]: ID пользователей с активной сессией у оператора
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+
+    client = get_redis_client()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.exists(_session_key(user_id))
+            return {user_id for user_id, exists in zip(user_ids, pipe.execute()) if exists}
+        except redis.RedisError as e:
+            logger.warning(f"Failed to check operator sessions in Redis: {e}")
+
+    with _local_sessions_lock:
+        return {user_id for user_id in user_ids if user_id in _local_sessions}
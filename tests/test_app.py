@@ -0,0 +1,45 @@
+"""
+Unit-тесты для сборки приложения (webapp/app.py).
+
+Тестирует:
+- Регистрацию blueprints в create_app
+"""
+
+import pytest
+
+
+@pytest.fixture
+def client():
+    """Тестовый клиент приложения, собранного create_app"""
+    # create_app импортирует ops-маршруты, которым нужны зависимости RAG
+    pytest.importorskip("chromadb")
+    pytest.importorskip("langchain")
+    from webapp.app import create_app
+
+    return create_app().test_client()
+
+
+class TestBlueprintRegistration:
+    """Тесты для маршрутов, подключаемых в create_app"""
+
+    def test_history_api_is_routed(self, client):
+        """/api/history обрабатывается history_bp, а не catch-all со страницей входа"""
+        response = client.get("/api/history")
+
+        assert response.status_code == 401
+        assert response.is_json
+
+    def test_profile_routes_are_registered(self, client):
+        """/api/profile и страница /profile обрабатываются profile_bp"""
+        response = client.get("/api/profile")
+
+        assert response.status_code == 401
+        assert response.is_json
+        assert client.application.url_map.bind("").match("/profile")[0] == "profile.profile_page"
+
+    def test_health_routes_come_from_health_bp(self, client):
+        """/health и пробы обрабатываются health_bp, а не заглушкой приложения"""
+        endpoint = client.application.url_map.bind("").match("/health")[0]
+
+        assert endpoint == "health.health_check"
+        assert client.get("/health/live").status_code == 204
@@ -0,0 +1,127 @@
+"""
+Unit-тесты для модуля follow-up предложений по карте (utils/followup_suggestions.py).
+
+Тестирует:
+- Определение категории по ключевым словам
+- Кэширование карты follow-up вопросов
+- Неизменность закэшированной карты между вызовами
+"""
+
+import json
+
+import pytest
+
+
+@pytest.fixture
+def followup_map_file(tmp_path, monkeypatch):
+    """Подменяет путь к карте follow-up вопросов на временный файл"""
+    import utils.followup_suggestions as fs
+
+    data = {
+        "shipping": {
+            "keywords": ["доставка", "Shipping", "курьер"],
+            "followups": ["Как отследить посылку?", "Уточните адрес доставки."]
+        },
+        "payment": {
+            "keywords": ["оплата", "pay", "payment"],
+            "followups": ["Хотите изменить способ оплаты?"]
+        },
+        "other": {
+            "keywords": [],
+            "followups": ["У вас есть ещё вопросы?", "Хотите задать что-то ещё?"]
+        }
+    }
+    path = tmp_path / "followup_map.json"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    monkeypatch.setattr(fs, "FOLLOWUP_MAP_PATH", str(path))
+    fs.reload_followup_map()
+    yield path
+    fs.reload_followup_map()
+
+
+class TestGetFollowupSuggestions:
+    """Тесты для функции get_followup_suggestions"""
+
+    def test_category_requires_two_keywords(self, followup_map_file):
+        """Категория выбирается только при двух и более совпадениях"""
+        from utils.followup_suggestions import get_followup_suggestions
+
+        result = get_followup_suggestions("Нужна доставка курьером")
+        assert result == ["Как отследить посылку?", "Уточните адрес доставки."]
+
+        result = get_followup_suggestions("Нужна доставка")
+        assert result == ["У вас есть ещё вопросы?", "Хотите задать что-то ещё?"]
+
+    def test_keywords_match_case_insensitive(self, followup_map_file):
+        """Ключевые слова сравниваются без учёта регистра"""
+        from utils.followup_suggestions import get_followup_suggestions
+
+        result = get_followup_suggestions("SHIPPING и КУРЬЕР")
+        assert result[0] == "Как отследить посылку?"
+
+    def test_overlapping_keywords_counted_separately(self, followup_map_file):
+        """Вложенные ключевые слова ('pay' в 'payment') считаются отдельно"""
+        from utils.followup_suggestions import get_followup_suggestions
+
+        result = get_followup_suggestions("payment")
+        assert result == ["Хотите изменить способ оплаты?"]
+
+    def test_low_confidence_does_not_mutate_cached_map(self, followup_map_file):
+        """Кнопка оператора не попадает в закэшированную карту"""
+        from utils.followup_suggestions import get_followup_suggestions, load_followup_map
+
+        result = get_followup_suggestions("оплата payment", context_low_confidence=True)
+        assert result[-1] == "Нужна помощь оператора?"
+        assert load_followup_map()["payment"]["followups"] == ["Хотите изменить способ оплаты?"]
+
+    def test_low_confidence_keeps_operator_within_three(self, followup_map_file):
+        """Кнопка оператора не отрезается, даже если у категории много вопросов"""
+        import utils.followup_suggestions as fs
+
+        followup_map_file.write_text(json.dumps({
+            "other": {"keywords": [], "followups": ["1", "2", "3", "4"]}
+        }), encoding="utf-8")
+        fs.reload_followup_map()
+
+        assert fs.get_followup_suggestions("вопрос", context_low_confidence=True) == ["1", "2", "Нужна помощь оператора?"]
+        assert fs.get_followup_suggestions("вопрос") == ["1", "2", "3"]
+
+    def test_english_category_followups(self, followup_map_file):
+        """Для английского языка возвращаются английские вопросы категории"""
+        from utils.followup_suggestions import get_followup_suggestions
+
+        result = get_followup_suggestions("shipping courier доставка", language="en")
+        assert result[0] == "Which shipping company do you prefer?"
+
+
+class TestLoadFollowupMap:
+    """Тесты для кэширования карты follow-up вопросов"""
+
+    def test_map_is_read_once(self, followup_map_file):
+        """Повторные вызовы не перечитывают файл"""
+        from utils.followup_suggestions import load_followup_map
+
+        first = load_followup_map()
+        followup_map_file.write_text("{}", encoding="utf-8")
+        assert load_followup_map() is first
+
+    def test_reload_rereads_file(self, followup_map_file):
+        """reload_followup_map сбрасывает кэш"""
+        from utils.followup_suggestions import load_followup_map, reload_followup_map
+
+        load_followup_map()
+        followup_map_file.write_text('{"other": {"keywords": [], "followups": ["?"]}}', encoding="utf-8")
+        reload_followup_map()
+        assert load_followup_map()["other"]["followups"] == ["?"]
+
+    def test_missing_file_returns_default(self, tmp_path, monkeypatch):
+        """При отсутствии файла возвращается базовая структура"""
+        import utils.followup_suggestions as fs
+
+        monkeypatch.setattr(fs, "FOLLOWUP_MAP_PATH", str(tmp_path / "missing.json"))
+        fs.reload_followup_map()
+        try:
+            assert "other" in fs.load_followup_map()
+        finally:
+            fs.reload_followup_map()
@@ -0,0 +1,85 @@
+"""
+Unit-тесты для health check endpoints (webapp/health.py).
+
+Тестирует:
+- Кэширование снимка состояния
+- Ответ liveness probe
+"""
+
+import pytest
+from unittest.mock import MagicMock
+
+
+@pytest.fixture
+def db_check(monkeypatch):
+    """Подменяет check_db_health и сбрасывает кэш проверки"""
+    import webapp.health as health
+
+    check = MagicMock(return_value={
+        "status": "healthy", "message": "ok", "timestamp": "2024-01-01 00:00:00",
+        "connection_stats": {}
+    })
+    monkeypatch.setattr(health, "check_db_health", check)
+    monkeypatch.setattr(health, "_health_snapshot", None)
+    return check
+
+
+@pytest.fixture
+def client():
+    """Тестовый клиент приложения с зарегистрированным health_bp"""
+    from flask import Flask
+    from webapp.health import health_bp
+
+    app = Flask(__name__)
+    app.register_blueprint(health_bp)
+    return app.test_client()
+
+
+class TestHealthSnapshot:
+    """Тесты для снимка состояния _get_health_snapshot"""
+
+    def test_snapshot_is_reused_within_ttl(self, db_check):
+        """В пределах TTL БД проверяется один раз"""
+        from webapp.health import _get_health_snapshot
+
+        first = _get_health_snapshot()
+        assert first.healthy
+        assert _get_health_snapshot() is first
+        assert db_check.call_count == 1
+
+    def test_expired_result_is_refreshed(self, db_check, monkeypatch):
+        """После истечения TTL проверка выполняется заново"""
+        import webapp.health as health
+
+        monkeypatch.setattr(health, "HEALTH_CACHE_TTL_SECONDS", 0)
+        health._get_health_snapshot()
+        health._get_health_snapshot()
+        assert db_check.call_count == 2
+
+
+    def test_endpoints_share_one_check(self, db_check, client):
+        """Все health-эндпоинты отдают ответы из одного снимка"""
+        assert client.get('/health').json["components"]["database"]["status"] == "healthy"
+        assert client.get('/health/db').json["message"] == "ok"
+        assert client.get('/health/ready').json["status"] == "ready"
+        assert db_check.call_count == 1
+
+    def test_unhealthy_database_returns_503(self, db_check, client):
+        """При недоступной БД /health/db и /health/ready отвечают 503"""
+        db_check.return_value = dict(db_check.return_value, status="unhealthy", message="down")
+
+        assert client.get('/health').json["status"] == "unhealthy"
+        assert client.get('/health/db').status_code == 503
+        response = client.get('/health/ready')
+        assert response.status_code == 503
+        assert response.json["details"] == "down"
+
+
+class TestLivenessCheck:
+    """Тесты для /health/live"""
+
+    def test_liveness_returns_empty_204(self, client):
+        """Liveness probe отвечает 204 без тела"""
+        response = client.get('/health/live')
+        assert response.status_code == 204
+        assert response.data == b''
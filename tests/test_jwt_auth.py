@@ -0,0 +1,305 @@
+"""
+Unit-тесты для аутентификации веб-интерфейса (webapp/auth/jwt_auth.py).
+
+Тестирует:
+- Хеширование и проверку паролей
+- Создание и проверку JWT-токенов
+- Вход пользователя
+"""
+
+import pytest
+from unittest.mock import MagicMock
+
+
+class TestPasswordHashing:
+    """Тесты для generate_password_hash и check_password"""
+
+    def test_hash_roundtrip(self):
+        """Хеш в формате bcrypt проверяется тем же паролем"""
+        from webapp.auth.jwt_auth import generate_password_hash, check_password
+
+        password_hash = generate_password_hash("secret")
+        assert password_hash.startswith("$2b$")
+        assert check_password("secret", password_hash) is True
+        assert check_password("wrong", password_hash) is False
+
+
+class TestVerifyToken:
+    """Тесты для функции verify_token"""
+
+    def test_valid_token_is_decoded_once(self):
+        """Повторная проверка того же токена берётся из кэша"""
+        from unittest.mock import patch
+        import webapp.auth.jwt_auth as auth
+
+        token = auth.create_access_token(1, "admin", "admin")
+        first = auth.verify_token(token)
+        with patch.object(auth.jwt, "decode", side_effect=AssertionError("decode called")):
+            second = auth.verify_token(token)
+
+        assert first["username"] == second["username"] == "admin"
+        assert first["role"] == "admin"
+
+    def test_invalid_token_returns_none(self):
+        """Токен с неверной подписью отклоняется"""
+        from webapp.auth.jwt_auth import create_access_token, verify_token
+
+        token = create_access_token(1, "admin", "admin")
+        assert verify_token(token[:-2] + ("AA" if token[-2:] != "AA" else "BB")) is None
+
+    def test_malformed_token_skips_decoding(self):
+        """Токен не в компактной форме JWT отклоняется без вызова jwt.decode"""
+        from unittest.mock import patch
+        import webapp.auth.jwt_auth as auth
+
+        with patch.object(auth.jwt, "decode", side_effect=AssertionError("decode called")):
+            assert auth.verify_token("") is None
+            assert auth.verify_token("not-a-token") is None
+            assert auth.verify_token("a.b.c.d") is None
+            assert auth.verify_token("a.b!.c") is None
+
+
+
+def _expired_token(seconds_ago):
+    """Токен с подписью приложения, истекший seconds_ago секунд назад"""
+    import time
+    import jwt
+    from webapp.auth.jwt_auth import JWT_SECRET_KEY
+
+    payload = {"sub": 1, "username": "admin", "role": "admin", "exp": int(time.time()) - seconds_ago}
+    return jwt.encode(payload, JWT_SECRET_KEY, algorithm="HS256")
+
+
+class TestRenewToken:
+    """Тесты для продления токенов"""
+
+    def test_expired_token_is_not_verified(self):
+        """verify_token не принимает истекший токен"""
+        from webapp.auth.jwt_auth import verify_token
+
+        assert verify_token(_expired_token(60)) is None
+
+    def test_recently_expired_token_is_renewed(self):
+        """Токен, истекший менее 7 дней назад, обменивается на новый"""
+        from webapp.auth.jwt_auth import renew_token, verify_token
+
+        new_token = renew_token(_expired_token(3 * 86400))
+        assert verify_token(new_token)["username"] == "admin"
+
+    def test_old_token_is_not_renewed(self):
+        """Токен, истекший более 7 дней назад, не продлевается"""
+        from webapp.auth.jwt_auth import renew_token
+
+        assert renew_token(_expired_token(9 * 86400)) is None
+        assert renew_token("not-a-token") is None
+
+
+class TestCreateAccessToken:
+    """Тесты для функции create_access_token"""
+
+    def test_token_matches_pyjwt_encoding(self):
+        """Токен побайтно совпадает с результатом jwt.encode"""
+        import jwt
+        from webapp.auth.jwt_auth import create_access_token, JWT_SECRET_KEY
+
+        token = create_access_token(5, "operator", "operator")
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+
+        assert payload["sub"] == 5
+        assert payload["username"] == "operator"
+        assert token == jwt.encode(payload, JWT_SECRET_KEY, algorithm="HS256")
+
+
+@pytest.fixture
+def stored_user(monkeypatch):
+    """Пользователь в подменённой БД (сессия - MagicMock)"""
+    from contextlib import contextmanager
+    import webapp.auth.jwt_auth as auth
+
+    row = (3, "operator", auth.generate_password_hash("secret"), "operator", True)
+    db = MagicMock()
+    db.execute.return_value.first.return_value = row
+    sessions = []
+
+    @contextmanager
+    def fake_session():
+        sessions.append(db)
+        yield db
+
+    monkeypatch.setattr(auth, "db_session", fake_session)
+    monkeypatch.setattr(auth, "_record_last_login", MagicMock())
+    auth.invalidate_user_cache("operator")
+    yield sessions
+    auth.invalidate_user_cache("operator")
+
+
+class TestLoginUser:
+    """Тесты для функции login_user"""
+
+    def test_repeated_login_uses_cached_user(self, stored_user):
+        """Повторный вход не обращается к БД за пользователем"""
+        from webapp.auth.jwt_auth import login_user
+
+        first = login_user("operator", "secret")
+        second = login_user("operator", "secret")
+
+        assert first["user_id"] == second["user_id"] == 3
+        assert second["token"]
+        assert len(stored_user) == 1
+
+    def test_wrong_password_drops_cached_user(self, stored_user):
+        """Неверный пароль при записи из кэша заставляет перечитать БД"""
+        from webapp.auth.jwt_auth import login_user
+
+        assert login_user("operator", "secret") is not None
+        assert login_user("operator", "wrong") is None
+        assert login_user("operator", "secret") is not None
+        assert len(stored_user) == 2
+
+    def test_unknown_user_still_checks_password(self, monkeypatch):
+        """Для несуществующего пользователя пароль сверяется с фиктивным хешем"""
+        from contextlib import contextmanager
+        import webapp.auth.jwt_auth as auth
+
+        db = MagicMock()
+        db.execute.return_value.first.return_value = None
+
+        @contextmanager
+        def fake_session():
+            yield db
+
+        check = MagicMock(return_value=True)
+        monkeypatch.setattr(auth, "db_session", fake_session)
+        monkeypatch.setattr(auth, "check_password", check)
+
+        assert auth.login_user("ghost", "secret") is None
+        check.assert_called_once_with("secret", auth._DUMMY_PASSWORD_HASH)
+
+
+class TestLastLogin:
+    """Тесты для отложенной записи last_login"""
+
+    def test_pending_logins_flushed_in_one_update(self, monkeypatch):
+        """Несколько входов записываются одним UPDATE, берётся последнее время"""
+        from contextlib import contextmanager
+        from datetime import datetime
+        import webapp.auth.jwt_auth as auth
+
+        db = MagicMock()
+
+        @contextmanager
+        def fake_session():
+            yield db
+
+        monkeypatch.setattr(auth, "db_session", fake_session)
+        monkeypatch.setattr(auth, "_last_login_worker", MagicMock())
+        monkeypatch.setattr(auth, "_PENDING_LOGINS", {})
+
+        auth._record_last_login(1, datetime(2024, 1, 1, 10))
+        auth._record_last_login(2, datetime(2024, 1, 1, 11))
+        auth._record_last_login(1, datetime(2024, 1, 1, 12))
+        auth._flush_last_logins()
+
+        db.execute.assert_called_once()
+        assert db.execute.call_args[0][1] == [
+            {'id': 1, 'last_login': datetime(2024, 1, 1, 12)},
+            {'id': 2, 'last_login': datetime(2024, 1, 1, 11)},
+        ]
+
+        auth._flush_last_logins()
+        db.execute.assert_called_once()
+
+
+class TestPasswordChange:
+    """Тесты сброса кэша login_user при смене пароля и изменении пользователя"""
+
+    def test_old_password_rejected_after_change(self, monkeypatch):
+        """После смены пароля старый пароль не принимается, даже если пользователь был в кэше"""
+        from contextlib import contextmanager
+        from flask import Flask
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import StaticPool
+        import webapp.auth.jwt_auth as auth
+        import webapp.routes.profile as profile
+        from storage.database_unified import WebUser
+
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        WebUser.__table__.create(engine)
+        Session = sessionmaker(bind=engine)
+
+        @contextmanager
+        def sqlite_session():
+            db = Session()
+            try:
+                yield db
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+        monkeypatch.setattr(auth, "db_session", sqlite_session)
+        monkeypatch.setattr(profile, "db_session", sqlite_session)
+        monkeypatch.setattr(auth, "_record_last_login", MagicMock())
+        auth.invalidate_user_cache("operator")
+
+        with sqlite_session() as db:
+            db.add(WebUser(id=3, username="operator", role="operator",
+                           password_hash=auth.generate_password_hash("secret")))
+
+        # Пользователь попадает в кэш login_user
+        assert auth.login_user("operator", "secret") is not None
+
+        app = Flask(__name__)
+        app.register_blueprint(profile.profile_bp)
+        token = auth.create_access_token(3, "operator", "operator")
+        response = app.test_client().put(
+            "/api/profile/password",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"current_password": "secret", "new_password": "new-secret"}
+        )
+
+        assert response.status_code == 200
+        assert auth.login_user("operator", "secret") is None
+        assert auth.login_user("operator", "new-secret") is not None
+        auth.invalidate_user_cache("operator")
+
+    def test_deactivated_user_rejected_while_cached(self, monkeypatch):
+        """Отключение пользователя через ORM сбрасывает его запись в кэше login_user"""
+        from contextlib import contextmanager
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import StaticPool
+        import webapp.auth.jwt_auth as auth
+        from storage.database_unified import WebUser
+
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        WebUser.__table__.create(engine)
+        Session = sessionmaker(bind=engine)
+
+        @contextmanager
+        def sqlite_session():
+            db = Session()
+            try:
+                yield db
+                db.commit()
+            finally:
+                db.close()
+
+        monkeypatch.setattr(auth, "db_session", sqlite_session)
+        monkeypatch.setattr(auth, "_record_last_login", MagicMock())
+        auth.invalidate_user_cache("viewer")
+
+        with sqlite_session() as db:
+            db.add(WebUser(id=4, username="viewer", role="viewer",
+                           password_hash=auth.generate_password_hash("secret")))
+
+        assert auth.login_user("viewer", "secret") is not None
+
+        with sqlite_session() as db:
+            db.query(WebUser).filter_by(id=4).one().is_active = False
+
+        assert auth.login_user("viewer", "secret") is None
+        auth.invalidate_user_cache("viewer")
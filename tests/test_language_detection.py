@@ -0,0 +1,26 @@
+"""
+Unit-тесты для локализованных сообщений (utils/language_detection.py).
+"""
+
+
+class TestGetLanguageMessage:
+    """Тесты для функции get_language_message"""
+
+    def test_returns_message_for_language(self):
+        """Сообщение возвращается на запрошенном языке"""
+        from utils.language_detection import get_language_message
+
+        assert get_language_message('ru', 'followup_prompt') == "Что-нибудь ещё?"
+        assert get_language_message('en', 'followup_prompt') == "Anything else?"
+
+    def test_unsupported_language_falls_back_to_english(self):
+        """Для неподдерживаемого языка используется английский"""
+        from utils.language_detection import get_language_message
+
+        assert get_language_message('de', 'followup_prompt') == "Anything else?"
+
+    def test_unknown_key_returns_key(self):
+        """Для неизвестного ключа возвращается сам ключ"""
+        from utils.language_detection import get_language_message
+
+        assert get_language_message('ru', 'no_such_key') == 'no_such_key'
@@ -0,0 +1,73 @@
+"""
+Unit-тесты для оценки уверенности в utils/openai_client.py.
+
+Тестирует:
+- Преобразование logprobs токенов в оценку уверенности
+- Оценку уверенности по релевантности документов
+"""
+
+import math
+
+import pytest
+
+
+@pytest.fixture
+def client():
+    """Клиент без инициализации ChatOpenAI (сеть не нужна)"""
+    from utils.openai_client import OpenAIClient
+
+    instance = OpenAIClient.__new__(OpenAIClient)
+    instance.default_confidence = 0.6
+    return instance
+
+
+def _sigmoid(x):
+    return 1 / (1 + math.exp(-x))
+
+
+class TestScoreFromLogprobs:
+    """Тесты для метода _score_from_logprobs"""
+
+    def test_empty_metadata_returns_none(self, client):
+        """Без logprobs оценка не вычисляется"""
+        assert client._score_from_logprobs({}) is None
+        assert client._score_from_logprobs({"logprobs": None}) is None
+        assert client._score_from_logprobs({"logprobs": {"token_logprobs": [None]}}) is None
+
+    def test_token_logprobs_average(self, client):
+        """Среднее logprob пропускается через сигмоиду, None игнорируются"""
+        score = client._score_from_logprobs({"logprobs": {"token_logprobs": [-0.1, None, -0.3]}})
+        assert score == pytest.approx(_sigmoid(-0.2))
+
+    def test_nested_content_format(self, client):
+        """Поддерживается вложенный формат content"""
+        metadata = {"logprobs": {"content": [{"logprob": -1.0}, {"logprob": None}, {"logprob": -3.0}]}}
+        assert client._score_from_logprobs(metadata) == pytest.approx(_sigmoid(-2.0))
+
+    def test_list_format(self, client):
+        """Поддерживается формат простого списка"""
+        assert client._score_from_logprobs({"logprobs": [0.0, None]}) == pytest.approx(0.5)
+
+    def test_large_negative_logprob_does_not_overflow(self, client):
+        """Очень маленькие logprob не вызывают переполнения"""
+        assert client._score_from_logprobs({"logprobs": [-1000.0]}) == pytest.approx(0.0)
+
+
+class TestScoreFromDocuments:
+    """Тесты для метода _score_from_documents"""
+
+    def test_no_documents_returns_none(self, client):
+        """Без документов или оценок результат None"""
+        assert client._score_from_documents(None) is None
+        assert client._score_from_documents([]) is None
+        assert client._score_from_documents([{"content": "text"}]) is None
+
+    def test_scores_are_normalized_and_averaged(self, client):
+        """Оценки делятся на 5 и усредняются"""
+        docs = [{"relevance_score": 5}, {"metadata": {"relevance_score": "2.5"}}, {"content": "no score"}]
+        assert client._score_from_documents(docs) == pytest.approx(0.75)
+
+    def test_scores_are_clipped(self, client):
+        """Оценки вне диапазона [0, 5] ограничиваются"""
+        docs = [{"relevance_score": 10}, {"relevance_score": -3}]
+        assert client._score_from_documents(docs) == pytest.approx(0.5)
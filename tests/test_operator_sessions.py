@@ -0,0 +1,115 @@
+"""
+Unit-тесты для хранилища сессий с операторами (storage/operator_sessions.py).
+
+Тестирует:
+- Чтение и запись сессий в Redis
+- Работу без Redis (сессии в памяти процесса)
+"""
+
+from collections import defaultdict
+
+import pytest
+from unittest.mock import MagicMock
+
+import redis
+
+
+@pytest.fixture
+def local_store(monkeypatch):
+    """Хранилище без Redis"""
+    import storage.operator_sessions as store
+
+    monkeypatch.setattr(store, "get_redis_client", lambda: None)
+    monkeypatch.setattr(store, "_local_sessions", {})
+    monkeypatch.setattr(store, "_local_operator_sessions", defaultdict(set))
+    return store
+
+
+class TestLocalFallback:
+    """Тесты для хранения сессий в памяти при недоступном Redis"""
+
+    def test_session_lifecycle(self, local_store):
+        """Сессия сохраняется, находится по оператору и удаляется"""
+        local_store.set_operator_session(10, 1, 100)
+        local_store.set_operator_session(11, 2, 101)
+
+        assert local_store.get_operator_session(10) == {"operator_id": 1, "session_id": 100}
+        assert local_store.get_operator_sessions(1) == {10: {"operator_id": 1, "session_id": 100}}
+        assert local_store.get_assigned_user_ids([10, 11, 12]) == {10, 11}
+
+        local_store.delete_operator_session(10)
+        assert local_store.get_operator_session(10) is None
+        assert local_store.get_operator_sessions(1) == {}
+
+    def test_second_claim_loses(self, local_store):
+        """Уже закреплённого пользователя не может принять другой оператор"""
+        assert local_store.set_operator_session(10, 1, 100) is True
+        assert local_store.set_operator_session(10, 2, 100) is False
+
+        assert local_store.get_operator_session(10) == {"operator_id": 1, "session_id": 100}
+        assert local_store.get_operator_sessions(2) == {}
+
+    def test_reclaim_after_release_updates_operator_index(self, local_store):
+        """После завершения сессии пользователя может принять другой оператор"""
+        local_store.set_operator_session(10, 1, 100)
+        local_store.delete_operator_session(10)
+        assert local_store.set_operator_session(10, 2, 100) is True
+
+        assert local_store.get_operator_sessions(1) == {}
+        assert local_store.get_operator_sessions(2) == {10: {"operator_id": 2, "session_id": 100}}
+        assert 1 not in local_store._local_operator_sessions
+
+
+class TestRedisStore:
+    """Тесты для хранения сессий в Redis"""
+
+    def test_get_parses_hash(self, monkeypatch):
+        """Значения хеша приводятся к int"""
+        import storage.operator_sessions as store
+
+        client = MagicMock()
+        client.hgetall.return_value = {"operator_id": "1", "session_id": "100"}
+        monkeypatch.setattr(store, "get_redis_client", lambda: client)
+
+        assert store.get_operator_session(10) == {"operator_id": 1, "session_id": 100}
+        client.hgetall.assert_called_once_with("op:session:10")
+
+    def test_operator_sessions_fetched_in_one_pipeline(self, monkeypatch):
+        """Сессии оператора читаются одним пакетом HGETALL"""
+        import storage.operator_sessions as store
+
+        client = MagicMock()
+        client.smembers.return_value = {"10"}
+        client.pipeline.return_value.execute.return_value = [{"operator_id": "1", "session_id": "100"}]
+        monkeypatch.setattr(store, "get_redis_client", lambda: client)
+
+        assert store.get_operator_sessions(1) == {10: {"operator_id": 1, "session_id": 100}}
+        client.smembers.assert_called_once_with("op:sessions:1")
+        client.pipeline.return_value.hgetall.assert_called_once_with("op:session:10")
+
+    def test_claim_uses_atomic_script(self, monkeypatch):
+        """Закрепление в Redis выполняется одним скриптом и сообщает о проигрыше"""
+        import storage.operator_sessions as store
+
+        client = MagicMock()
+        script = client.register_script.return_value
+        script.registered_client = client
+        script.side_effect = [1, 0]
+        monkeypatch.setattr(store, "get_redis_client", lambda: client)
+        monkeypatch.setattr(store, "_claim_script", None)
+
+        assert store.set_operator_session(10, 1, 100) is True
+        assert store.set_operator_session(10, 2, 100) is False
+        client.register_script.assert_called_once_with(store.CLAIM_SESSION_SCRIPT)
+        script.assert_called_with(keys=["op:session:10", "op:sessions:2"], args=[2, 100, 10])
+
+    def test_redis_error_falls_back_to_memory(self, monkeypatch):
+        """При ошибке Redis используется память процесса"""
+        import storage.operator_sessions as store
+
+        client = MagicMock()
+        client.hgetall.side_effect = redis.ConnectionError("down")
+        monkeypatch.setattr(store, "get_redis_client", lambda: client)
+        monkeypatch.setattr(store, "_local_sessions", {10: {"operator_id": 1, "session_id": 100}})
+
+        assert store.get_operator_session(10) == {"operator_id": 1, "session_id": 100}
@@ -0,0 +1,59 @@
+"""
+Unit-тесты для кэша разобранных документов (retrieval/parse_cache.py).
+
+Тестирует:
+- Хеширование содержимого файла
+- Чтение и запись чанков и эмбеддингов с учётом модели
+"""
+
+import hashlib
+import os
+
+import pytest
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Кэш во временной директории"""
+    import retrieval.parse_cache as parse_cache
+
+    monkeypatch.setattr(parse_cache, "CACHE_DIR", str(tmp_path / ".cache"))
+    monkeypatch.setattr(parse_cache, "CACHE_DB_PATH", str(tmp_path / ".cache" / "cache.sqlite3"))
+    return parse_cache
+
+
+class TestFileSha256:
+    """Тесты для функции file_sha256"""
+
+    def test_hash_matches_content(self, cache, tmp_path, monkeypatch):
+        """Хеш, посчитанный по блокам, совпадает с хешем всего содержимого"""
+        monkeypatch.setattr(cache, "HASH_BLOCK_SIZE", 3)
+        path = tmp_path / "doc.txt"
+        path.write_bytes(b"corporate faq document")
+
+        assert cache.file_sha256(str(path)) == hashlib.sha256(b"corporate faq document").hexdigest()
+
+
+class TestParseCache:
+    """Тесты для функций get и put"""
+
+    def test_roundtrip(self, cache):
+        """Сохранённые чанки и эмбеддинги возвращаются без изменений"""
+        cache.put("abc", "model-1", ["первый чанк", "второй"], [[0.1, 0.2], [0.3, 0.4]])
+
+        assert cache.get("abc", "model-1") == (["первый чанк", "второй"], [[0.1, 0.2], [0.3, 0.4]])
+        assert os.path.exists(cache.CACHE_DB_PATH)
+
+    def test_miss_and_model_change(self, cache):
+        """Отсутствующий хеш и другая модель эмбеддингов дают промах"""
+        cache.put("abc", "model-1", ["чанк"], [[1.0]])
+
+        assert cache.get("def", "model-1") is None
+        assert cache.get("abc", "model-2") is None
+
+    def test_put_replaces_entry(self, cache):
+        """Повторная запись заменяет значение"""
+        cache.put("abc", "model-1", ["старый"], [[1.0]])
+        cache.put("abc", "model-1", ["новый"], [[2.0]])
+
+        assert cache.get("abc", "model-1") == (["новый"], [[2.0]])
@@ -0,0 +1,182 @@
+"""
+Unit-тесты для модуля ограничения частоты запросов (utils/rate_limit.py).
+
+Тестирует:
+- Разбор ответов Lua-скриптов проверки лимитов
+- Graceful degradation при ошибках Redis
+"""
+
+import threading
+
+import pytest
+from unittest.mock import MagicMock
+
+import redis
+
+
+@pytest.fixture
+def limiter():
+    """RateLimiter с подменёнными Lua-скриптами (Redis не нужен)"""
+    from utils.rate_limit import RateLimiter
+
+    instance = RateLimiter.__new__(RateLimiter)
+    instance.enabled = True
+    instance.redis = MagicMock()
+    instance._telegram_script = MagicMock()
+    instance._web_script = MagicMock()
+    instance._cell_available = False
+    instance._recent_block = {}
+    instance._recent_block_lock = threading.Lock()
+    return instance
+
+
+class TestCheckTelegramLimit:
+    """Тесты для метода check_telegram_limit"""
+
+    def test_allowed_request(self, limiter):
+        """Разрешённый запрос проверяется одним вызовом скрипта"""
+        limiter._telegram_script.return_value = [1, 0, 0, 0]
+
+        assert limiter.check_telegram_limit(42) == {"allowed": True}
+        limiter._telegram_script.assert_called_once()
+        keys = limiter._telegram_script.call_args.kwargs["keys"]
+        assert keys == [
+            "rate_limit_block:telegram:42",
+            "rate_limit:telegram:42",
+            "rate_limit_violations:telegram:42",
+        ]
+
+    def test_too_frequent_request(self, limiter):
+        """Слишком частый запрос отклоняется без блокировки"""
+        limiter._telegram_script.return_value = [0, 3, 0, 1]
+
+        assert limiter.check_telegram_limit(42) == {"allowed": False, "retry_after": 3}
+
+    def test_blocked_user(self, limiter):
+        """Заблокированный пользователь получает время окончания блокировки"""
+        limiter._telegram_script.return_value = [0, 30, 1700000030, 4]
+
+        result = limiter.check_telegram_limit(42)
+        assert result == {"allowed": False, "blocked_until": 1700000030, "retry_after": 30}
+
+    def test_active_block_is_served_from_local_cache(self, limiter):
+        """Повторные сообщения заблокированного пользователя не обращаются к Redis"""
+        limiter._telegram_script.return_value = [0, 30, 1700000030, 4]
+
+        limiter.check_telegram_limit(42)
+        result = limiter.check_telegram_limit(42)
+
+        assert limiter._telegram_script.call_count == 1
+        assert result["allowed"] is False
+        assert result["blocked_until"] == 1700000030
+        assert 0 < result["retry_after"] <= 30
+
+    def test_interval_violation_is_not_cached(self, limiter):
+        """Нарушения интервала проверяются в Redis, чтобы копился счётчик нарушений"""
+        limiter._telegram_script.return_value = [0, 3, 0, 1]
+
+        limiter.check_telegram_limit(42)
+        limiter.check_telegram_limit(42)
+
+        assert limiter._telegram_script.call_count == 2
+
+    def test_redis_error_allows_request(self, limiter):
+        """При ошибке Redis запрос пропускается"""
+        limiter._telegram_script.side_effect = redis.ConnectionError("down")
+
+        assert limiter.check_telegram_limit(42) == {"allowed": True}
+
+
+class TestCheckWebLimit:
+    """Тесты для метода check_web_limit"""
+
+    def test_allowed_request(self, limiter):
+        """Запрос в пределах окна разрешается"""
+        limiter._web_script.return_value = [1, 0, 5]
+
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": True}
+        assert limiter._web_script.call_args.kwargs["keys"] == ["rate_limit:web:10.0.0.1"]
+
+    def test_limit_exceeded(self, limiter):
+        """При превышении лимита возвращается TTL окна"""
+        limiter._web_script.return_value = [0, 17, 100]
+
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": False, "retry_after": 17}
+
+    def test_disabled_limiter_skips_redis(self, limiter):
+        """Отключённый лимитер не обращается к Redis"""
+        limiter.enabled = False
+
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": True}
+        limiter._web_script.assert_not_called()
+
+    def test_pipeline_fallback_when_scripts_unavailable(self, limiter):
+        """Без поддержки скриптов лимит проверяется одним пакетом команд"""
+        from utils.rate_limit import WEB_RATE_LIMIT_REQUESTS
+
+        limiter._web_script.side_effect = redis.ResponseError("NOSCRIPT")
+        pipe = limiter.redis.pipeline.return_value
+
+        pipe.execute.return_value = [True, 1, 60]
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": True}
+        limiter.redis.pipeline.assert_called_once_with(transaction=False)
+        pipe.set.assert_called_once_with("rate_limit:web:10.0.0.1", 0, ex=60, nx=True)
+
+        pipe.execute.return_value = [None, WEB_RATE_LIMIT_REQUESTS + 1, 12]
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": False, "retry_after": 12}
+
+
+class TestCheckWebLimitThrottle:
+    """Тесты для проверки веб-лимита через redis-cell"""
+
+    def test_throttle_allows_request(self, limiter):
+        """При наличии redis-cell используется CL.THROTTLE"""
+        from utils.rate_limit import WEB_RATE_LIMIT_REQUESTS
+
+        limiter._cell_available = True
+        limiter.redis.execute_command.return_value = [0, WEB_RATE_LIMIT_REQUESTS, 99, -1, 1]
+
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": True}
+        limiter.redis.execute_command.assert_called_once_with(
+            "CL.THROTTLE", "rate_limit:web_cell:10.0.0.1",
+            WEB_RATE_LIMIT_REQUESTS - 1, WEB_RATE_LIMIT_REQUESTS, 60, 1
+        )
+        limiter._web_script.assert_not_called()
+
+    def test_throttle_limits_request(self, limiter):
+        """Ответ limited=1 отклоняет запрос с retry_after из redis-cell"""
+        limiter._cell_available = True
+        limiter.redis.execute_command.return_value = [1, 100, 0, 3, 60]
+
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": False, "retry_after": 3}
+
+    def test_missing_module_falls_back_to_script(self, limiter):
+        """Без redis-cell используется Lua-скрипт, и CL.THROTTLE больше не вызывается"""
+        limiter._cell_available = True
+        limiter.redis.execute_command.side_effect = redis.ResponseError("unknown command 'CL.THROTTLE'")
+        limiter._web_script.return_value = [1, 0, 1]
+
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": True}
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": True}
+        assert limiter.redis.execute_command.call_count == 1
+        assert limiter._web_script.call_count == 2
+
+
+class TestRedisInitialization:
+    """Тесты для ленивого подключения к Redis"""
+
+    def test_unavailable_redis_allows_requests(self, monkeypatch):
+        """Без Redis запросы пропускаются, повторное подключение откладывается"""
+        import utils.rate_limit as rl
+
+        ping = MagicMock(side_effect=redis.ConnectionError("down"))
+        monkeypatch.setattr(rl.redis.Redis, "ping", ping)
+        monkeypatch.setattr(rl, "_redis_client", None)
+        monkeypatch.setattr(rl, "_redis_retry_at", 0.0)
+
+        limiter = rl.RateLimiter()
+        limiter.enabled = True
+        assert limiter.check_web_limit("10.0.0.1") == {"allowed": True}
+        assert limiter.check_telegram_limit(42) == {"allowed": True}
+        assert ping.call_count == 1
+
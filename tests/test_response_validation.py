@@ -0,0 +1,59 @@
+"""
+Unit-тесты для проверки ответов LLM (utils/response_validation.py).
+
+Тестирует:
+- Замену подозрительных ответов безопасным текстом
+- Маскирование секретов в ответе
+"""
+
+from unittest.mock import patch
+
+
+class TestValidateResponse:
+    """Тесты для функции validate_response"""
+
+    @patch('utils.response_validation.enqueue_suspicious_inputs')
+    def test_clean_response_is_unchanged(self, mock_log):
+        """Обычный ответ возвращается без изменений"""
+        from utils.response_validation import validate_response
+
+        assert validate_response("Доставка занимает 3 дня.", 1) == "Доставка занимает 3 дня."
+        mock_log.assert_not_called()
+
+    @patch('utils.response_validation.enqueue_suspicious_inputs')
+    def test_suspicious_response_is_replaced(self, mock_log):
+        """Любой из паттернов приводит к замене ответа, регистр не важен"""
+        from utils.response_validation import validate_response, SAFE_FALLBACK_RESPONSES
+
+        assert validate_response("As An AI Language Model, I think", 1) == SAFE_FALLBACK_RESPONSES["ru"]
+        assert validate_response("Here's the SYSTEM PROMPT", 1, "en") == SAFE_FALLBACK_RESPONSES["en"]
+        assert validate_response("your API key", 1, "de") == SAFE_FALLBACK_RESPONSES["en"]
+        assert mock_log.call_count == 3
+
+
+class TestSanitizeEnvironmentVariables:
+    """Тесты для функции sanitize_environment_variables"""
+
+    @patch('utils.response_validation.enqueue_suspicious_inputs')
+    def test_secrets_are_redacted(self, mock_log):
+        """Секреты маскируются, факт маскирования логируется один раз"""
+        from utils.response_validation import sanitize_environment_variables
+
+        result = sanitize_environment_variables("key sk-abc123 and OPENAI_API_KEY = 'value'", 1)
+        assert result == "key [API_KEY_REDACTED] and [REDACTED]"
+        mock_log.assert_called_once()
+
+    @patch('utils.response_validation.enqueue_suspicious_inputs')
+    def test_unquoted_key_is_redacted(self, mock_log):
+        """Ключ без кавычек маскируется с сохранением имени переменной"""
+        from utils.response_validation import sanitize_environment_variables
+
+        assert sanitize_environment_variables("api_key=abc-def", 1) == "api_key=[REDACTED]"
+
+    @patch('utils.response_validation.enqueue_suspicious_inputs')
+    def test_clean_response_is_not_logged(self, mock_log):
+        """Ответ без секретов не изменяется и не логируется"""
+        from utils.response_validation import sanitize_environment_variables
+
+        assert sanitize_environment_variables("Всё в порядке", 1) == "Всё в порядке"
+        mock_log.assert_not_called()
@@ -0,0 +1,44 @@
+"""
+Unit-тесты для индикатора «Думаю...» (utils/thinking_indicator.py).
+"""
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+
+def _make_update_and_context():
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=7))
+    bot = SimpleNamespace(
+        send_chat_action=AsyncMock(),
+        send_message=AsyncMock(return_value=SimpleNamespace(message_id=42)),
+    )
+    return update, SimpleNamespace(bot=bot)
+
+
+class TestThinkingIndicatorStart:
+    """Тесты для метода ThinkingIndicator.start"""
+
+    def test_indicator_message_is_remembered(self):
+        """ID сообщения «Думаю...» сохраняется для последующего редактирования"""
+        from utils.thinking_indicator import ThinkingIndicator
+
+        indicator = ThinkingIndicator()
+        update, context = _make_update_and_context()
+        asyncio.run(indicator.start(update, context, 'en'))
+
+        context.bot.send_chat_action.assert_awaited_once()
+        context.bot.send_message.assert_awaited_once_with(chat_id=7, text='Thinking...')
+        assert indicator.active_indicators == {7: 42}
+
+    def test_typing_action_failure_does_not_resend_message(self):
+        """Ошибка статуса «печатает» не приводит к повторной отправке сообщения"""
+        from utils.thinking_indicator import ThinkingIndicator
+
+        indicator = ThinkingIndicator()
+        update, context = _make_update_and_context()
+        context.bot.send_chat_action.side_effect = RuntimeError("network")
+        asyncio.run(indicator.start(update, context))
+
+        context.bot.send_message.assert_awaited_once()
+        assert indicator.active_indicators == {7: 42}
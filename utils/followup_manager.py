@@ -25,11 +25,14 @@ BANNED_PHRASES = [
     "тематика разговора не соответствует",
 ]
 
+# Фразы в нижнем регистре вычисляются один раз при импорте
+_BANNED_PHRASES_LOWER = tuple(phrase.lower() for phrase in BANNED_PHRASES)
+
 
 def _is_bad_followup(text: str) -> bool:
     """True, если строка содержит одну из запрещённых фраз."""
     t = text.lower()
-    return any(b in t for b in BANNED_PHRASES)
+    return any(b in t for b in _BANNED_PHRASES_LOWER)
 
 
 # ------------------------------------------
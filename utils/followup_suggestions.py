@@ -1,15 +1,57 @@
 import json
 import logging
 import os
-from typing import List, Dict, Any, Optional
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Pattern, Tuple
 
 from config import FOLLOWUP_MAP_PATH
 
 logger = logging.getLogger(__name__)
 
+# Базовые вопросы, если категория не найдена или у неё нет follow-up вопросов
+_RU_DEFAULT: Tuple[str, ...] = (
+    "У вас есть ещё вопросы?",
+    "Хотите задать что-то ещё?",
+)
+_EN_DEFAULT: Tuple[str, ...] = (
+    "Do you have any other questions?",
+    "Would you like to ask something else?",
+)
+
+# Английские follow-up вопросы по категориям (пока без переводчика)
+_EN_FOLLOWUPS: Dict[str, Tuple[str, ...]] = {
+    "shipping": (
+        "Which shipping company do you prefer?",
+        "Could you specify the delivery address?",
+        "Would you like to know the shipping cost?",
+        "How can I track my package?",
+    ),
+    "payment": (
+        "Would you like to change the payment method?",
+        "Do you want to check the invoice status?",
+        "Need to clarify payment terms?",
+        "How to request a refund?",
+    ),
+    "customs": (
+        "What documents are needed for customs clearance?",
+        "How is the customs duty calculated?",
+        "What to do if the package is detained at customs?",
+    ),
+    "products": (
+        "How to check product availability?",
+        "How to modify an order after placement?",
+        "How to return a product?",
+    ),
+}
+
+@lru_cache(maxsize=1)
 def load_followup_map() -> Dict[str, Any]:
     """
     Загружает карту follow-up вопросов из JSON файла.
+
+    Результат кэшируется на время жизни процесса: файл меняется только
+    при деплое. Для перечитывания используйте reload_followup_map().
     
     Returns:
         Dict[str, Any]: Структура данных с follow-up вопросами
@@ -23,13 +65,57 @@ def load_followup_map() -> Dict[str, Any]:
         return {
             "other": {
                 "keywords": [],
-                "followups": [
-                    "У вас есть ещё вопросы?",
-                    "Хотите задать что-то ещё?"
-                ]
+                "followups": list(_RU_DEFAULT)
             }
         }
 
+
+@lru_cache(maxsize=1)
+def _get_lowered_keywords() -> Dict[str, Tuple[str, ...]]:
+    """
+    Возвращает ключевые слова каждой категории, заранее приведённые к нижнему регистру.
+    """
+    return {
+        category: tuple(keyword.lower() for keyword in data.get("keywords", []))
+        for category, data in load_followup_map().items()
+    }
+
+
+@lru_cache(maxsize=1)
+def _get_keyword_matcher() -> Tuple[Optional[Pattern[str]], Dict[str, Tuple[str, ...]]]:
+    """
+    Строит единый регулярный шаблон по всем ключевым словам карты.
+
+    Альтернативы отсортированы по убыванию длины, поэтому в каждой позиции
+    находится самое длинное слово. Вложенные в него ключевые слова
+    (например, 'pay' внутри 'payment') возвращаются через словарь implied,
+    так что результат совпадает с проверкой каждого слова через `in`.
+
+    Returns:
+        Tuple: (скомпилированный шаблон или None, слово -> вложенные в него ключевые слова)
+    """
+    all_keywords = {keyword for keywords in _get_lowered_keywords().values() for keyword in keywords if keyword}
+    if not all_keywords:
+        return None, {}
+
+    ordered = sorted(all_keywords, key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in ordered) + "))")
+    implied = {
+        keyword: tuple(other for other in all_keywords if other in keyword)
+        for keyword in all_keywords
+    }
+    return pattern, implied
+
+
+def reload_followup_map() -> None:
+    """
+    Сбрасывает кэш карты follow-up вопросов, чтобы следующий вызов перечитал файл.
+    """
+    load_followup_map.cache_clear()
+    _get_lowered_keywords.cache_clear()
+    _get_keyword_matcher.cache_clear()
+    logger.info("Followup map cache cleared")
+
 def get_followup_suggestions(user_query: str, language: str = 'ru', context_low_confidence: bool = False) -> List[str]:
     """
     Генерирует контекстные предложения для follow-up вопросов на основе запроса пользователя.
@@ -48,63 +134,38 @@ def get_followup_suggestions(user_query: str, language: str = 'ru', context_low_
     # Определяем категорию запроса на основе ключевых слов
     matched_category = "other"  # Категория по умолчанию
     max_matches = 0
+
+    # Один проход по запросу находит все встретившиеся ключевые слова
+    pattern, implied = _get_keyword_matcher()
+    found_keywords = set()
+    if pattern is not None:
+        for match in pattern.finditer(user_query_lower):
+            found_keywords.update(implied[match.group(1)])
     
-    for category, data in followup_map.items():
-        keywords = data.get("keywords", [])
-        matches = sum(1 for keyword in keywords if keyword.lower() in user_query_lower)
+    for category, keywords in _get_lowered_keywords().items():
+        matches = sum(1 for keyword in keywords if keyword in found_keywords)
         
         # Требуем минимум 2 совпадения для более точного определения категории
         if matches >= 2 and matches > max_matches:
             max_matches = matches
             matched_category = category
     
-    # Получаем follow-up вопросы для найденной категории
-    followups = followup_map.get(matched_category, {}).get("followups", [])
-    
     # Если язык английский, переводим вопросы (в будущем можно использовать переводчик)
     if language == 'en':
         # Здесь можно добавить перевод с использованием utils/translator.py
         # Пока используем заглушку с базовыми английскими вопросами
-        if matched_category == "shipping":
-            return [
-                "Which shipping company do you prefer?",
-                "Could you specify the delivery address?",
-                "Would you like to know the shipping cost?",
-                "How can I track my package?"
-            ]
-        elif matched_category == "payment":
-            return [
-                "Would you like to change the payment method?",
-                "Do you want to check the invoice status?",
-                "Need to clarify payment terms?",
-                "How to request a refund?"
-            ]
-        elif matched_category == "customs":
-            return [
-                "What documents are needed for customs clearance?",
-                "How is the customs duty calculated?",
-                "What to do if the package is detained at customs?"
-            ]
-        elif matched_category == "products":
-            return [
-                "How to check product availability?",
-                "How to modify an order after placement?",
-                "How to return a product?"
-            ]
-        else:
-            return [
-                "Do you have any other questions?",
-                "Would you like to ask something else?"
-            ]
+        return list(_EN_FOLLOWUPS.get(matched_category, _EN_DEFAULT))
+    
+    # Получаем follow-up вопросы для найденной категории
+    # (срезы ниже создают новый список, закэшированная карта не изменяется)
+    followups = followup_map.get(matched_category, {}).get("followups", [])
     
-    # Добавляем кнопку оператора только при низкой уверенности
+    # Добавляем кнопку оператора только при низкой уверенности,
+    # оставляя для неё место среди трёх предложений
     if context_low_confidence:
         operator_help = "Нужна помощь оператора?" if language == 'ru' else "Do you need operator assistance?"
-        if operator_help not in followups:
-            followups.append(operator_help)
+        if operator_help not in followups[:2]:
+            return followups[:2] + [operator_help]
     
     # Возвращаем 2-3 предложения
-    return followups[:3] if followups else [
-        "У вас есть ещё вопросы?" if language == 'ru' else "Do you have any other questions?",
-        "Хотите задать что-то ещё?" if language == 'ru' else "Would you like to ask something else?"
-    ]
+    return followups[:3] if followups else list(_RU_DEFAULT if language == 'ru' else _EN_DEFAULT)
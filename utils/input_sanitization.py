@@ -2,10 +2,13 @@
 
 import re
 import logging
+import string
+from functools import lru_cache
 from typing import Tuple, List, Optional
 
 from config import SUPPORTED_LANGUAGES
-from storage.database_unified import log_suspicious_input
+from storage.database_unified import enqueue_suspicious_inputs
+from utils.pattern_scanner import build_hyperscan_database, scan_pattern_ids
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +21,34 @@ SUSPICIOUS_PATTERNS = [
     (r"(?i)(execute|run|eval).*(command|code|script|shell)", "code_execution_attempt")
 ]
 
+# Паттерны компилируются один раз при импорте
+_COMPILED_SUSPICIOUS_PATTERNS = [(re.compile(pattern), pattern_name) for pattern, pattern_name in SUSPICIOUS_PATTERNS]
+
+# Длина самого короткого текста, который может совпасть с одним из паттернов
+# ("runcode" для code_execution_attempt). Более короткие сообщения ("да", "/start")
+# не сканируются. При изменении SUSPICIOUS_PATTERNS значение нужно пересмотреть.
+_MIN_SUSPICIOUS_LENGTH = 7
+
 # Максимальная длина сообщения (примерно 1000 токенов)
 MAX_MESSAGE_LENGTH = 3000
 
+# Наборы символов для определения языка: [а-яА-ЯёЁ] и [a-zA-Z]
+_CYRILLIC_CHARS = frozenset("".join(chr(code) for code in range(ord("А"), ord("я") + 1)) + "ёЁ")
+_LATIN_CHARS = frozenset(string.ascii_letters)
+
+# Таблица для str.translate: кириллица -> 'C', латиница -> 'L'.
+# Сами 'C' и 'L' тоже латинские буквы и переводятся в 'L', поэтому остальные
+# символы, которые translate оставляет как есть, не искажают подсчёт.
+_ALPHABET_TABLE = str.maketrans({
+    **{char: "C" for char in _CYRILLIC_CHARS},
+    **{char: "L" for char in _LATIN_CHARS},
+})
+
+# Тексты длиннее этого порога не кэшируются в detect_language
+_LANGUAGE_CACHE_MAX_TEXT_LENGTH = 512
+
+_HYPERSCAN_DB = build_hyperscan_database([pattern for pattern, _ in SUSPICIOUS_PATTERNS])
+
 def sanitize_input(user_id: int, input_text: str) -> Tuple[str, bool]:
     """
     Проверяет и санитизирует пользовательский ввод.
@@ -34,32 +62,47 @@ def sanitize_input(user_id: int, input_text: str) -> Tuple[str, bool]:
     """
     # Проверка длины сообщения
     if len(input_text) > MAX_MESSAGE_LENGTH:
-        log_suspicious_input(
+        enqueue_suspicious_inputs([(
             user_id, 
             input_text[:100] + "...", 
             "message_too_long", 
             "truncated"
-        )
+        )])
         return input_text[:MAX_MESSAGE_LENGTH], True
     
+    # Слишком короткий текст не может содержать подозрительный паттерн
+    if len(input_text) < _MIN_SUSPICIOUS_LENGTH:
+        return input_text, False
+    
     # Проверка на подозрительные паттерны
     original_text = input_text
     is_suspicious = False
+    # Срабатывания копятся и записываются в БД одной пачкой в фоне
+    suspicious_hits = []
     
-    for pattern, pattern_name in SUSPICIOUS_PATTERNS:
-        if re.search(pattern, input_text):
+    # Hyperscan (если установлен) служит предфильтром: re запускается
+    # только для паттернов, которые действительно встретились в тексте
+    candidate_ids = scan_pattern_ids(_HYPERSCAN_DB, input_text)
+
+    for pattern_id, (pattern, pattern_name) in enumerate(_COMPILED_SUSPICIOUS_PATTERNS):
+        if candidate_ids is not None and pattern_id not in candidate_ids:
+            continue
+        if pattern.search(input_text):
             # Логируем подозрительный ввод
-            log_suspicious_input(
+            suspicious_hits.append((
                 user_id, 
                 input_text, 
                 pattern_name, 
                 "sanitized"
-            )
+            ))
             
             # Заменяем подозрительный паттерн на [FILTERED]
-            input_text = re.sub(pattern, "[FILTERED]", input_text)
+            input_text = pattern.sub("[FILTERED]", input_text)
             is_suspicious = True
     
+    if suspicious_hits:
+        enqueue_suspicious_inputs(suspicious_hits)
+    
     return input_text, is_suspicious
 
 def detect_language(text: str) -> Optional[str]:
@@ -72,26 +115,53 @@ def detect_language(text: str) -> Optional[str]:
     Returns:
         str: Код языка ('ru', 'en') или None, если не удалось определить
     """
+    return detect_language_with_counts(text)[0]
+
+def detect_language_with_counts(text: str) -> Tuple[Optional[str], int, int]:
+    """
+    Определяет язык текста и возвращает подсчитанные символы алфавитов.
+
+    Args:
+        text: Текст для анализа
+
+    Returns:
+        Tuple[Optional[str], int, int]: (код языка или None, число символов кириллицы, число символов латиницы)
+    """
     # guard: если текст не строка, просто возвращаем None (не определено)
     if not isinstance(text, str):  # ← patched
-        return None                # ← patched
+        return None, 0, 0          # ← patched
+    if not text:
+        return None, 0, 0
+
+    # Короткие фразы ("да", "hello") часто повторяются — кэшируем их
+    if len(text) > _LANGUAGE_CACHE_MAX_TEXT_LENGTH:
+        return _detect_language_uncached(text)
+    return _detect_language_cached(text)
 
+def _detect_language_uncached(text: str) -> Tuple[Optional[str], int, int]:
+    """
+    Определяет язык строки по преобладающему алфавиту (без кэширования).
+    """
     # Простая эвристика для определения языка
-    # Подсчитываем символы кириллицы и латиницы
-    cyrillic_count = len(re.findall(r'[а-яА-ЯёЁ]', text))
-    latin_count = len(re.findall(r'[a-zA-Z]', text))
+    # Подсчитываем символы кириллицы и латиницы: классификация и подсчёт
+    # выполняются встроенными методами строки на уровне C
+    classified = text.translate(_ALPHABET_TABLE)
+    cyrillic_count = classified.count("C")
+    latin_count = classified.count("L")
 
     # Если текст слишком короткий, не определяем язык
     if cyrillic_count + latin_count < 3:
-        return None
+        return None, cyrillic_count, latin_count
 
     # Определяем язык на основе преобладающего алфавита
     if cyrillic_count > latin_count:
-        return 'ru'
+        return 'ru', cyrillic_count, latin_count
     elif latin_count > cyrillic_count:
-        return 'en'
+        return 'en', cyrillic_count, latin_count
+
+    return None, cyrillic_count, latin_count
 
-    return None
+_detect_language_cached = lru_cache(maxsize=2048)(_detect_language_uncached)
 
 def is_supported_language(language_code: str) -> bool:
     """
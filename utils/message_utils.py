@@ -3,6 +3,9 @@ from config import MAX_MESSAGE_LENGTH
 
 logger = logging.getLogger(__name__)
 
+# Уведомление о том, что сообщение было обрезано
+TRUNCATION_NOTICE = "\n\n... (ответ был сокращен из-за ограничений длины сообщения)"
+
 def truncate_message(message: str) -> str:
     """
     Обрезает сообщение до максимально допустимой длины для Telegram.
@@ -16,17 +19,13 @@ def truncate_message(message: str) -> str:
     if len(message) <= MAX_MESSAGE_LENGTH:
         return message
     
-    # Если сообщение слишком длинное, обрезаем его и добавляем уведомление
-    truncated_message = message[:MAX_MESSAGE_LENGTH - 200]
-    
-    # Находим последний полный абзац для более аккуратного обрезания
-    last_paragraph = truncated_message.rfind('\n\n')
-    if last_paragraph > MAX_MESSAGE_LENGTH // 2:
-        truncated_message = truncated_message[:last_paragraph]
-    
-    # Добавляем уведомление о том, что сообщение было обрезано
-    truncation_notice = "\n\n... (ответ был сокращен из-за ограничений длины сообщения)"
+    # Если сообщение слишком длинное, обрезаем его и добавляем уведомление.
+    # Ищем последний полный абзац во второй половине допустимой длины прямо
+    # в исходной строке, не создавая промежуточный срез
+    limit = MAX_MESSAGE_LENGTH - 200
+    last_paragraph = message.rfind('\n\n', MAX_MESSAGE_LENGTH // 2 + 1, limit)
+    cut = last_paragraph if last_paragraph != -1 else limit
     
-    logger.info(f"Message truncated from {len(message)} to {len(truncated_message)} characters")
+    logger.info(f"Message truncated from {len(message)} to {cut} characters")
     
-    return truncated_message + truncation_notice
+    return message[:cut] + TRUNCATION_NOTICE
@@ -1,6 +1,8 @@
+import asyncio
 import logging
 import math
-from typing import Dict, Any, Optional, Tuple, List
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Optional, Tuple, List
 
 import httpx
 import openai
@@ -62,35 +64,73 @@ class OpenAIClient:
             # Получаем ответ от модели используя метод invoke вместо прямого вызова
             response = self.chat.invoke(messages)
             
-            # Извлекаем текст ответа
-            response_text = response.content
+            return self._process_response(response, user_id, language, retrieved_docs)
             
-            # Проверяем ответ на наличие подозрительных паттернов
-            response_text = validate_response(response_text, user_id, language)
-            
-            # Проверяем ответ на наличие потенциальных секретов
-            response_text = sanitize_environment_variables(response_text, user_id)
+        except (openai.APITimeoutError, httpx.TimeoutException) as exc:
+            logger.error("OpenAI API call timed out: %s", exc)
+            return self._fallback_response(language), 0.0
+
+        except Exception as e:
+            logger.error(f"Error in OpenAI API call: {e}")
             
-            confidence = self._estimate_confidence(response, retrieved_docs)
+            # Возвращаем безопасный ответ в случае ошибки
+            return self._fallback_response(language), 0.0
 
-            return response_text, confidence
+    async def aget_completion(self, system_prompt: str, user_message: str, user_id: int,
+                              language: str = 'ru', retrieved_docs: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, float]:
+        """
+        Асинхронный вариант get_completion: не блокирует цикл событий бота
+        на время запроса к OpenAI.
+        
+        Args:
+            system_prompt: Системный промпт
+            user_message: Сообщение пользователя
+            user_id: ID пользователя для логирования
+            language: Язык пользователя ('ru' или 'en')
             
-        except (openai.APITimeoutError, httpx.TimeoutException) as exc:
-            logger.error("OpenAI API call timed out: %s", exc)
+        Returns:
+            Tuple[str, float]: (ответ модели, уровень уверенности)
+        """
+        try:
+            messages = format_chat_messages(system_prompt, user_message)
+            response = await self.chat.ainvoke(messages)
 
-            fallback_response = "Извините, произошла ошибка при обработке вашего запроса." if language == 'ru' else \
-                               "Sorry, an error occurred while processing your request."
+            # Проверка ответа может писать в БД, поэтому выполняем её в потоке
+            return await asyncio.to_thread(self._process_response, response, user_id, language, retrieved_docs)
 
-            return fallback_response, 0.0
+        except (openai.APITimeoutError, httpx.TimeoutException) as exc:
+            logger.error("OpenAI API call timed out: %s", exc)
+            return self._fallback_response(language), 0.0
 
         except Exception as e:
             logger.error(f"Error in OpenAI API call: {e}")
-            
-            # Возвращаем безопасный ответ в случае ошибки
-            fallback_response = "Извините, произошла ошибка при обработке вашего запроса." if language == 'ru' else \
-                               "Sorry, an error occurred while processing your request."
+            return self._fallback_response(language), 0.0
 
-            return fallback_response, 0.0
+    def _process_response(self, response: Any, user_id: int, language: str,
+                          retrieved_docs: Optional[List[Dict[str, Any]]]) -> Tuple[str, float]:
+        """
+        Проверяет ответ модели и оценивает уверенность.
+        """
+        # Извлекаем текст ответа
+        response_text = response.content
+        
+        # Проверяем ответ на наличие подозрительных паттернов
+        response_text = validate_response(response_text, user_id, language)
+        
+        # Проверяем ответ на наличие потенциальных секретов
+        response_text = sanitize_environment_variables(response_text, user_id)
+        
+        confidence = self._estimate_confidence(response, retrieved_docs)
+
+        return response_text, confidence
+
+    @staticmethod
+    def _fallback_response(language: str) -> str:
+        """
+        Возвращает безопасный ответ при ошибке обращения к OpenAI.
+        """
+        return "Извините, произошла ошибка при обработке вашего запроса." if language == 'ru' else \
+               "Sorry, an error occurred while processing your request."
 
     def _estimate_confidence(self, response: Any, retrieved_docs: Optional[List[Dict[str, Any]]]) -> float:
         """
@@ -130,21 +170,36 @@ class OpenAIClient:
         if not logprobs:
             return None
 
-        token_logprobs: List[float] = []
+        total, count = 0.0, 0
 
         if isinstance(logprobs, dict):
-            token_logprobs = [lp for lp in logprobs.get("token_logprobs", []) if lp is not None]
+            total, count = self._sum_logprobs(logprobs.get("token_logprobs") or ())
             # Формат logprobs в новых моделях может быть вложенным
-            if not token_logprobs and isinstance(logprobs.get("content"), list):
-                token_logprobs = [segment.get("logprob") for segment in logprobs["content"] if segment.get("logprob") is not None]
+            if not count and isinstance(logprobs.get("content"), list):
+                total, count = self._sum_logprobs(segment.get("logprob") for segment in logprobs["content"])
         elif isinstance(logprobs, list):
-            token_logprobs = [lp for lp in logprobs if lp is not None]
+            total, count = self._sum_logprobs(logprobs)
 
-        if not token_logprobs:
+        if not count:
             return None
 
-        avg_logprob = sum(token_logprobs) / len(token_logprobs)
-        return 1 / (1 + math.exp(-avg_logprob))
+        # Сигмоида через tanh: 1 / (1 + exp(-x)) == 0.5 * (1 + tanh(x / 2)), без переполнения exp
+        return 0.5 * (1.0 + math.tanh(0.5 * total / count))
+
+    @staticmethod
+    def _sum_logprobs(values: Iterable[Optional[float]]) -> Tuple[float, int]:
+        """
+        Суммирует логарифмы вероятностей за один проход, пропуская None.
+
+        Returns:
+            Tuple[float, int]: (сумма, количество учтённых значений)
+        """
+        total, count = 0.0, 0
+        for value in values:
+            if value is not None:
+                total += value
+                count += 1
+        return total, count
 
     def _score_from_documents(self, retrieved_docs: Optional[List[Dict[str, Any]]]) -> Optional[float]:
         """
@@ -153,23 +208,56 @@ class OpenAIClient:
         if not retrieved_docs:
             return None
 
-        relevance_scores: List[float] = []
+        # Один проход: оценки ограничиваются диапазоном [0, 5] и суммируются
+        total, count = 0.0, 0
         for doc in retrieved_docs:
             score = doc.get("relevance_score")
             if score is None:
                 score = doc.get("metadata", {}).get("relevance_score")
-            if score is not None:
-                relevance_scores.append(float(score))
+            if score is None:
+                continue
 
-        if not relevance_scores:
+            score = float(score)
+            if score < 0.0:
+                score = 0.0
+            elif score > 5.0:
+                score = 5.0
+            total += score
+            count += 1
+
+        if not count:
             return None
 
-        normalized_scores = [max(0.0, min(1.0, s / 5.0)) for s in relevance_scores]
-        return sum(normalized_scores) / len(normalized_scores)
+        return total / (5.0 * count)
+
+# Переиспользуемые экземпляры OpenAIClient по имени модели
+_CLIENTS: Dict[str, OpenAIClient] = {}
+
+def get_wrapped_client(model: str = "gpt-3.5-turbo") -> OpenAIClient:
+    """
+    Возвращает общий для процесса экземпляр OpenAIClient для указанной модели.
 
+    ChatOpenAI держит пул HTTP-соединений, поэтому повторное использование
+    клиента избавляет каждый запрос от установки TCP/TLS соединения.
+    
+    Args:
+        model: Модель OpenAI для использования
+        
+    Returns:
+        OpenAIClient: Клиент OpenAI с проверкой ответов
+    """
+    client = _CLIENTS.get(model)
+    if client is None:
+        client = _CLIENTS.setdefault(model, OpenAIClient(model=model))
+    return client
+
+@lru_cache(maxsize=8)
 def get_openai_client(model: str = RERANKING_MODEL):
     """
     Возвращает экземпляр клиента OpenAI.
+
+    Клиент создаётся один раз на процесс и переиспользуется вместе со своим
+    пулом соединений.
     
     Args:
         model: Модель OpenAI для использования
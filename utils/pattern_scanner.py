@@ -0,0 +1,70 @@
+# pattern_scanner.py
+
+import logging
+from typing import List, Optional
+
+try:  # Необязательная зависимость: многошаблонный сканер без бэктрекинга
+    import hyperscan
+except ImportError:  # pragma: no cover - зависит от окружения
+    hyperscan = None
+
+logger = logging.getLogger(__name__)
+
+def build_hyperscan_database(patterns: List[str]):
+    """
+    Компилирует паттерны в одну базу Hyperscan.
+
+    Args:
+        patterns: Регулярные выражения со встроенным флагом (?i)
+
+    Returns:
+        hyperscan.Database или None, если hyperscan не установлен или компиляция не удалась
+    """
+    if hyperscan is None:
+        return None
+
+    try:
+        # (?i) передаём через HS_FLAG_CASELESS, а UTF8/UCP нужны, чтобы \s и \w
+        # совпадали с теми же Unicode-символами, что и в re
+        expressions = [pattern.removeprefix("(?i)").encode() for pattern in patterns]
+        flags = (
+            hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+            | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+        )
+        database = hyperscan.Database()
+        database.compile(
+            expressions=expressions,
+            ids=list(range(len(expressions))),
+            elements=len(expressions),
+            flags=[flags] * len(expressions),
+        )
+        return database
+    except Exception as e:
+        logger.warning(f"Hyperscan database compilation failed, using re fallback: {e}")
+        return None
+
+def scan_pattern_ids(database, text: str) -> Optional[set]:
+    """
+    Одним проходом Hyperscan находит номера паттернов, которые встречаются в тексте.
+
+    Args:
+        database: База, собранная build_hyperscan_database, или None
+        text: Проверяемый текст
+
+    Returns:
+        set с номерами паттернов или None, если Hyperscan недоступен
+    """
+    if database is None:
+        return None
+
+    matched_ids = set()
+
+    def on_match(pattern_id, start, end, flags, context):
+        matched_ids.add(pattern_id)
+
+    try:
+        database.scan(text.encode("utf-8"), match_event_handler=on_match)
+    except Exception as e:
+        logger.warning(f"Hyperscan scan failed, using re fallback: {e}")
+        return None
+    return matched_ids
@@ -2,41 +2,152 @@
 Модуль для реализации rate-limiting и защиты от злоупотреблений.
 Использует Redis для хранения данных о лимитах.
 """
+import math
 import time
 import redis
 import logging
-from functools import wraps
+import threading
+from functools import lru_cache, wraps
+from redis.utils import HIREDIS_AVAILABLE
 from flask import request, jsonify
-from typing import Callable, Dict, Optional, Union, Any
+from typing import Callable, Dict, Optional, Tuple, Union, Any
 
 from config import (
-    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD, REDIS_URL,
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD, REDIS_POOL_SIZE,
     RATE_LIMIT_ENABLED, TELEGRAM_RATE_LIMIT_SECONDS, TELEGRAM_RATE_LIMIT_MAX_VIOLATIONS,
     TELEGRAM_RATE_LIMIT_BLOCK_SECONDS, WEB_RATE_LIMIT_REQUESTS, WEB_RATE_LIMIT_MINUTES
 )
 
-# Настройка логирования
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
-handler = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
 
-# Инициализация Redis-клиента
-try:
-    redis_client = redis.Redis(
-        host=REDIS_HOST,
-        port=REDIS_PORT,
-        db=REDIS_DB,
-        password=REDIS_PASSWORD,
-        decode_responses=True
+# Инициализация Redis-клиента с ограниченным пулом соединений.
+# Пул общий для всех потоков процесса и может переиспользоваться другими модулями.
+# Параметры передаются по отдельности, а не через URL: пароль с символами
+# вроде "/", "#" или "%" ломает разбор redis://-адреса
+redis_pool = redis.BlockingConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    password=REDIS_PASSWORD or None,
+    max_connections=REDIS_POOL_SIZE,
+    timeout=1,
+    socket_keepalive=True,
+    decode_responses=True
+)
+
+# Клиент создаётся при первом обращении, чтобы импорт модуля не ходил в сеть
+_redis_client: Optional[redis.Redis] = None
+_redis_lock = threading.Lock()
+_redis_retry_at = 0.0
+
+# Через сколько секунд повторять подключение после неудачи
+REDIS_RETRY_SECONDS = 30
+
+
+def get_redis_client() -> Optional[redis.Redis]:
+    """
+    Возвращает Redis-клиент для rate-limiting, подключаясь при первом вызове.
+    
+    Returns:
+        Redis-клиент или None, если Redis недоступен
+    """
+    global _redis_client, _redis_retry_at
+    
+    if _redis_client is not None:
+        return _redis_client
+    if time.monotonic() < _redis_retry_at:
+        return None
+    
+    with _redis_lock:
+        if _redis_client is None and time.monotonic() >= _redis_retry_at:
+            client = redis.Redis(connection_pool=redis_pool)
+            try:
+                client.ping()  # Проверка соединения
+                # redis-py сам выбирает C-парсер ответов, если установлен hiredis
+                logger.info(f"Redis connection established successfully (hiredis parser: {HIREDIS_AVAILABLE})")
+                _redis_client = client
+            except (redis.ConnectionError, redis.TimeoutError) as e:
+                logger.error(f"Failed to connect to Redis: {e}")
+                _redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+    
+    return _redis_client
+
+# Максимальное количество пользователей в локальном кэше блокировок
+RECENT_BLOCK_CACHE_SIZE = 10000
+
+
+# Lua-скрипт проверки лимита Telegram: блокировка, интервал между сообщениями
+# и счётчик нарушений проверяются атомарно за один запрос к Redis.
+# KEYS: [block_key, last_request_key, violation_key]
+# ARGV: [limit_seconds, max_violations, block_seconds]
+# Время берётся с сервера Redis: у всех процессов одни часы, а скачки системного
+# времени на клиентах не влияют на сравнение с blocked_until.
+# Возвращает {allowed, retry_after, blocked_until, violations}
+TELEGRAM_LIMIT_SCRIPT = """
+local now = tonumber(redis.call('TIME')[1])
+local blocked_until = tonumber(redis.call('GET', KEYS[1]))
+if blocked_until then
+    if now < blocked_until then
+        return {0, blocked_until - now, blocked_until, 0}
+    end
+    redis.call('DEL', KEYS[1])
+end
+
+local last_request = tonumber(redis.call('GET', KEYS[2]))
+if last_request then
+    local time_passed = now - last_request
+    if time_passed < tonumber(ARGV[1]) then
+        local violations = redis.call('INCR', KEYS[3])
+        redis.call('EXPIRE', KEYS[3], 60)
+        if violations > tonumber(ARGV[2]) then
+            blocked_until = now + tonumber(ARGV[3])
+            redis.call('SET', KEYS[1], blocked_until, 'EX', ARGV[3])
+            return {0, tonumber(ARGV[3]), blocked_until, violations}
+        end
+        return {0, tonumber(ARGV[1]) - time_passed, 0, violations}
+    end
+end
+
+redis.call('SET', KEYS[2], now, 'EX', 60)
+return {1, 0, 0, 0}
+"""
+
+# Lua-скрипт проверки лимита веб-запросов в фиксированном окне.
+# KEYS: [key]
+# ARGV: [max_requests, window_seconds]
+# Возвращает {allowed, retry_after, count}
+WEB_LIMIT_SCRIPT = """
+local count = tonumber(redis.call('GET', KEYS[1]))
+if not count then
+    redis.call('SET', KEYS[1], 1, 'EX', ARGV[2])
+    return {1, 0, 1}
+end
+if count >= tonumber(ARGV[1]) then
+    return {0, redis.call('TTL', KEYS[1]), count}
+end
+redis.call('INCR', KEYS[1])
+return {1, 0, count + 1}
+"""
+
+
+@lru_cache(maxsize=4096)
+def _build_keys(prefix: str, identifier: str) -> Tuple[str, str, str]:
+    """
+    Формирует ключи Redis для пользователя или IP-адреса.
+    Ключи активных пользователей берутся из кэша, а не форматируются заново.
+    
+    Args:
+        prefix: Префикс ключа (например, 'telegram', 'web')
+        identifier: Идентификатор пользователя или IP-адрес
+        
+    Returns:
+        Кортеж (ключ лимита, ключ нарушений, ключ блокировки)
+    """
+    return (
+        f"rate_limit:{prefix}:{identifier}",
+        f"rate_limit_violations:{prefix}:{identifier}",
+        f"rate_limit_block:{prefix}:{identifier}",
     )
-    redis_client.ping()  # Проверка соединения
-    logger.info("Redis connection established successfully")
-except redis.ConnectionError as e:
-    logger.error(f"Failed to connect to Redis: {e}")
-    redis_client = None
 
 
 class RateLimiter:
@@ -47,7 +158,33 @@ class RateLimiter:
     
     def __init__(self):
         self.enabled = RATE_LIMIT_ENABLED
-        self.redis = redis_client
+        # Клиент и Lua-скрипты инициализируются при первой проверке (см. _get_redis)
+        self.redis = None
+        self._telegram_script = None
+        self._web_script = None
+        # Есть ли в Redis модуль redis-cell (CL.THROTTLE); уточняется при первом вызове
+        self._cell_available = True
+        # Локальный кэш активных блокировок: user_id -> (monotonic-дедлайн, blocked_until).
+        # Пока блокировка действует, ответ Redis заранее известен.
+        self._recent_block: Dict[str, Tuple[float, int]] = {}
+        self._recent_block_lock = threading.Lock()
+    
+    def _get_redis(self) -> Optional[redis.Redis]:
+        """
+        Возвращает Redis-клиент, при первом успешном подключении регистрируя Lua-скрипты.
+        
+        Returns:
+            Redis-клиент или None, если Redis недоступен
+        """
+        if self.redis is None:
+            client = get_redis_client()
+            if client is None:
+                return None
+            # register_script использует EVALSHA и сам загружает скрипт при NOSCRIPT
+            self._telegram_script = client.register_script(TELEGRAM_LIMIT_SCRIPT)
+            self._web_script = client.register_script(WEB_LIMIT_SCRIPT)
+            self.redis = client
+        return self.redis
     
     def _get_key(self, prefix: str, identifier: str) -> str:
         """
@@ -60,7 +197,7 @@ class RateLimiter:
         Returns:
             Строка ключа для Redis
         """
-        return f"rate_limit:{prefix}:{identifier}"
+        return _build_keys(prefix, identifier)[0]
     
     def _get_violation_key(self, prefix: str, identifier: str) -> str:
         """
@@ -73,7 +210,7 @@ class RateLimiter:
         Returns:
             Строка ключа для Redis
         """
-        return f"rate_limit_violations:{prefix}:{identifier}"
+        return _build_keys(prefix, identifier)[1]
     
     def _get_block_key(self, prefix: str, identifier: str) -> str:
         """
@@ -86,7 +223,7 @@ class RateLimiter:
         Returns:
             Строка ключа для Redis
         """
-        return f"rate_limit_block:{prefix}:{identifier}"
+        return _build_keys(prefix, identifier)[2]
     
     def check_telegram_limit(self, user_id: Union[int, str]) -> Dict[str, Any]:
         """
@@ -101,66 +238,96 @@ class RateLimiter:
                 - blocked_until: Время окончания блокировки (если заблокирован)
                 - retry_after: Время до следующего разрешенного запроса (если превышен лимит)
         """
-        if not self.enabled or not self.redis:
+        if not self.enabled or not self._get_redis():
             return {"allowed": True}
         
         user_id = str(user_id)
-        now = int(time.time())
         
-        # Проверяем, заблокирован ли пользователь
-        block_key = self._get_block_key("telegram", user_id)
-        blocked_until = self.redis.get(block_key)
+        cached = self._get_recent_block(user_id)
+        if cached:
+            return cached
+        
+        key, violation_key, block_key = _build_keys("telegram", user_id)
+        
+        try:
+            allowed, retry_after, blocked_until, violations = self._telegram_script(
+                keys=[block_key, key, violation_key],
+                args=[
+                    TELEGRAM_RATE_LIMIT_SECONDS,
+                    TELEGRAM_RATE_LIMIT_MAX_VIOLATIONS,
+                    TELEGRAM_RATE_LIMIT_BLOCK_SECONDS,
+                ],
+            )
+        except redis.RedisError as e:
+            logger.error(f"Telegram rate limit check failed: {e}")
+            return {"allowed": True}
+        
+        if allowed:
+            return {"allowed": True}
         
         if blocked_until:
-            blocked_until = int(blocked_until)
-            if now < blocked_until:
-                logger.warning(f"Telegram user {user_id} is blocked until {blocked_until}")
-                return {
-                    "allowed": False,
-                    "blocked_until": blocked_until,
-                    "retry_after": blocked_until - now
-                }
+            if violations:
+                logger.warning(f"Telegram user {user_id} blocked for {TELEGRAM_RATE_LIMIT_BLOCK_SECONDS} seconds")
             else:
-                # Блокировка истекла, удаляем ключ
-                self.redis.delete(block_key)
+                logger.warning(f"Telegram user {user_id} is blocked until {blocked_until}")
+            self._remember_block(user_id, retry_after, blocked_until)
+            return {
+                "allowed": False,
+                "blocked_until": blocked_until,
+                "retry_after": retry_after
+            }
         
-        # Проверяем ограничение частоты запросов
-        key = self._get_key("telegram", user_id)
-        last_request = self.redis.get(key)
+        logger.warning(f"Rate limit exceeded for Telegram user {user_id}, violations: {violations}")
+        return {
+            "allowed": False,
+            "retry_after": retry_after
+        }
+    
+    def _get_recent_block(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает результат проверки из локального кэша блокировок без обращения к Redis.
         
-        if last_request:
-            last_request = int(last_request)
-            time_passed = now - last_request
+        Args:
+            user_id: ID пользователя Telegram
             
-            if time_passed < TELEGRAM_RATE_LIMIT_SECONDS:
-                # Увеличиваем счетчик нарушений
-                violation_key = self._get_violation_key("telegram", user_id)
-                violations = self.redis.incr(violation_key)
-                self.redis.expire(violation_key, 60)  # Сбрасываем счетчик через минуту
-                
-                # Если превышено максимальное количество нарушений, блокируем пользователя
-                if violations > TELEGRAM_RATE_LIMIT_MAX_VIOLATIONS:
-                    blocked_until = now + TELEGRAM_RATE_LIMIT_BLOCK_SECONDS
-                    self.redis.set(block_key, blocked_until)
-                    self.redis.expire(block_key, TELEGRAM_RATE_LIMIT_BLOCK_SECONDS)
-                    logger.warning(f"Telegram user {user_id} blocked for {TELEGRAM_RATE_LIMIT_BLOCK_SECONDS} seconds")
-                    return {
-                        "allowed": False,
-                        "blocked_until": blocked_until,
-                        "retry_after": TELEGRAM_RATE_LIMIT_BLOCK_SECONDS
-                    }
-                
-                logger.warning(f"Rate limit exceeded for Telegram user {user_id}, violations: {violations}")
-                return {
-                    "allowed": False,
-                    "retry_after": TELEGRAM_RATE_LIMIT_SECONDS - time_passed
-                }
-        
-        # Обновляем время последнего запроса
-        self.redis.set(key, now)
-        self.redis.expire(key, 60)  # Ключ истекает через минуту
+        Returns:
+            Словарь с результатом проверки или None, если активной блокировки нет
+        """
+        with self._recent_block_lock:
+            entry = self._recent_block.get(user_id)
+            if entry is None:
+                return None
+            deadline, blocked_until = entry
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                del self._recent_block[user_id]
+                return None
         
-        return {"allowed": True}
+        return {
+            "allowed": False,
+            "blocked_until": blocked_until,
+            "retry_after": math.ceil(remaining)
+        }
+    
+    def _remember_block(self, user_id: str, retry_after: int, blocked_until: int) -> None:
+        """
+        Сохраняет активную блокировку в локальный кэш.
+        
+        Args:
+            user_id: ID пользователя Telegram
+            retry_after: Секунд до окончания блокировки
+            blocked_until: Время окончания блокировки (Unix timestamp)
+        """
+        now = time.monotonic()
+        with self._recent_block_lock:
+            if len(self._recent_block) >= RECENT_BLOCK_CACHE_SIZE:
+                # Удаляем истёкшие записи, а если их нет - сбрасываем кэш целиком
+                expired = [key for key, (deadline, _) in self._recent_block.items() if deadline <= now]
+                for key in expired:
+                    del self._recent_block[key]
+                if len(self._recent_block) >= RECENT_BLOCK_CACHE_SIZE:
+                    self._recent_block.clear()
+            self._recent_block[user_id] = (now + retry_after, blocked_until)
     
     def check_web_limit(self, ip_address: str) -> Dict[str, Any]:
         """
@@ -174,39 +341,105 @@ class RateLimiter:
                 - allowed: True, если запрос разрешен, иначе False
                 - retry_after: Время до следующего разрешенного запроса (если превышен лимит)
         """
-        if not self.enabled or not self.redis:
+        if not self.enabled or not self._get_redis():
             return {"allowed": True}
         
-        now = int(time.time())
         window = WEB_RATE_LIMIT_MINUTES * 60  # Окно в секундах
         
-        # Ключ для хранения запросов в текущем окне
-        key = self._get_key("web", ip_address)
-        
-        # Получаем текущее количество запросов
-        count = self.redis.get(key)
-        
-        if count is None:
-            # Первый запрос в окне
-            self.redis.set(key, 1)
-            self.redis.expire(key, window)
+        try:
+            result = self._check_web_limit_throttle(ip_address, window) if self._cell_available else None
+            if result is not None:
+                allowed, retry_after, count = result
+            else:
+                allowed, retry_after, count = self._check_web_limit_window(ip_address, window)
+        except redis.RedisError as e:
+            logger.error(f"Web rate limit check failed: {e}")
             return {"allowed": True}
         
-        count = int(count)
-        
-        if count >= WEB_RATE_LIMIT_REQUESTS:
+        if not allowed:
             # Превышен лимит запросов
-            ttl = self.redis.ttl(key)
             logger.warning(f"Web rate limit exceeded for IP {ip_address}, count: {count}")
             return {
                 "allowed": False,
-                "retry_after": ttl
+                "retry_after": retry_after
             }
         
-        # Увеличиваем счетчик запросов
-        self.redis.incr(key)
-        
         return {"allowed": True}
+    
+    def _check_web_limit_throttle(self, ip_address: str, window: int) -> Optional[Tuple[bool, int, int]]:
+        """
+        Проверяет веб-лимит командой CL.THROTTLE модуля redis-cell (алгоритм GCRA):
+        WEB_RATE_LIMIT_REQUESTS запросов за окно без двойного всплеска на границе окон.
+        
+        Args:
+            ip_address: IP-адрес клиента
+            window: Длина окна в секундах
+            
+        Returns:
+            Кортеж (allowed, retry_after, count) или None, если модуль не загружен в Redis
+        """
+        # Отдельный ключ: redis-cell хранит в нём своё состояние, а не счётчик
+        key = self._get_key("web_cell", ip_address)
+        try:
+            limited, limit, remaining, retry_after, _ = self.redis.execute_command(
+                "CL.THROTTLE", key, WEB_RATE_LIMIT_REQUESTS - 1, WEB_RATE_LIMIT_REQUESTS, window, 1
+            )
+        except redis.ResponseError as e:
+            # Модуль не загружен - больше не пытаемся и используем фиксированное окно
+            logger.info(f"redis-cell is unavailable, using fixed window rate limit: {e}")
+            self._cell_available = False
+            return None
+        
+        if limited:
+            return False, max(int(retry_after), 1), limit - remaining
+        return True, 0, limit - remaining
+    
+    def _check_web_limit_window(self, ip_address: str, window: int) -> Tuple[bool, int, int]:
+        """
+        Проверяет веб-лимит счётчиком в фиксированном окне (Lua-скрипт или пакет команд).
+        
+        Args:
+            ip_address: IP-адрес клиента
+            window: Длина окна в секундах
+            
+        Returns:
+            Кортеж (allowed, retry_after, count)
+        """
+        # Ключ для хранения запросов в текущем окне
+        key = self._get_key("web", ip_address)
+        
+        try:
+            return self._web_script(
+                keys=[key],
+                args=[WEB_RATE_LIMIT_REQUESTS, window],
+            )
+        except redis.ResponseError as e:
+            # Скрипты могут быть запрещены на сервере (например, в managed Redis)
+            logger.warning(f"Web rate limit script failed, using pipeline: {e}")
+            return self._check_web_limit_pipelined(key, window)
+    
+    def _check_web_limit_pipelined(self, key: str, window: int) -> Tuple[bool, int, int]:
+        """
+        Проверяет веб-лимит без Lua-скрипта: SET NX EX, INCR и TTL
+        отправляются одним пакетом за один сетевой запрос.
+        
+        Args:
+            key: Ключ счётчика запросов в Redis
+            window: Длина окна в секундах
+            
+        Returns:
+            Кортеж (allowed, retry_after, count)
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        # Ключ создаётся сразу с TTL, поэтому не может остаться без срока жизни
+        pipe.set(key, 0, ex=window, nx=True)
+        pipe.incr(key)
+        pipe.ttl(key)
+        _, count, ttl = pipe.execute()
+        
+        if count > WEB_RATE_LIMIT_REQUESTS:
+            return False, ttl, count
+        return True, 0, count
 
 
 # Создаем глобальный экземпляр RateLimiter
@@ -222,12 +455,13 @@ def telegram_rate_limit(func: Callable) -> Callable:
         
     Returns:
         Обернутая функция с проверкой ограничений
+        (или исходная функция, если rate-limiting отключен)
     """
+    if not RATE_LIMIT_ENABLED:
+        return func
+    
     @wraps(func)
     async def wrapper(update, context, *args, **kwargs):
-        if not RATE_LIMIT_ENABLED:
-            return await func(update, context, *args, **kwargs)
-        
         user_id = update.effective_user.id
         result = rate_limiter.check_telegram_limit(user_id)
         
@@ -261,12 +495,13 @@ def web_rate_limit(func: Callable) -> Callable:
         
     Returns:
         Обернутая функция с проверкой ограничений
+        (или исходная функция, если rate-limiting отключен)
     """
+    if not RATE_LIMIT_ENABLED:
+        return func
+    
     @wraps(func)
     def wrapper(*args, **kwargs):
-        if not RATE_LIMIT_ENABLED:
-            return func(*args, **kwargs)
-        
         ip_address = request.remote_addr
         result = rate_limiter.check_web_limit(ip_address)
         
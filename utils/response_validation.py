@@ -5,7 +5,8 @@ from typing import Dict, Any, Optional, Tuple, List
 from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage
 
 from config import SUPPORTED_LANGUAGES
-from storage.database_unified import log_suspicious_input
+from storage.database_unified import enqueue_suspicious_inputs
+from utils.pattern_scanner import build_hyperscan_database, scan_pattern_ids
 
 logger = logging.getLogger(__name__)
 
@@ -18,11 +19,34 @@ SUSPICIOUS_RESPONSE_PATTERNS = [
     r"(?i)(sk-[A-Za-z0-9]{20,}|api[_\s]?key|secret|token)",
 ]
 
+# Все паттерны объединены в одно выражение, чтобы проверять ответ за один проход
+_SUSPICIOUS_RESPONSE_RE = re.compile(
+    "|".join(f"(?:{pattern.removeprefix('(?i)')})" for pattern in SUSPICIOUS_RESPONSE_PATTERNS),
+    re.IGNORECASE
+)
+
+# Паттерны для обнаружения потенциальных секретов
+ENV_VAR_PATTERNS = [
+    (r"(?i)(TELEGRAM_BOT_TOKEN|OPENAI_API_KEY|API_KEY|SECRET_KEY)[\s]*=[\s]*['\"](.*?)['\"]", "[REDACTED]"),
+    (r"(?i)(sk-[A-Za-z0-9]{1,})", "[API_KEY_REDACTED]"),  # Исправлено: {20,} -> {1,}
+    (r"(?i)(access_token|bearer token|auth token)[\s]*[:=][\s]*['\"](.*?)['\"]", "[TOKEN_REDACTED]"),
+    # Добавлен новый паттерн для обнаружения API ключей без кавычек
+    (r"(?i)(TELEGRAM_BOT_TOKEN|OPENAI_API_KEY|API_KEY|SECRET_KEY)[\s]*=[\s]*([\w\-]+)", r"\1=[REDACTED]"),
+]
+
+_COMPILED_ENV_VAR_PATTERNS = [
+    (re.compile(pattern, re.IGNORECASE), replacement) for pattern, replacement in ENV_VAR_PATTERNS
+]
+
+_SUSPICIOUS_RESPONSE_DB = build_hyperscan_database(SUSPICIOUS_RESPONSE_PATTERNS)
+_ENV_VAR_DB = build_hyperscan_database([pattern for pattern, _ in ENV_VAR_PATTERNS])
+
 # Безопасные замены для подозрительных ответов
 SAFE_FALLBACK_RESPONSES = {
     "ru": "Извините, я не могу предоставить ответ на этот вопрос. Пожалуйста, попробуйте переформулировать запрос или обратитесь к оператору.",
     "en": "Sorry, I cannot provide an answer to this question. Please try rephrasing your query or contact an operator."
 }
+_DEFAULT_FALLBACK_RESPONSE = SAFE_FALLBACK_RESPONSES["en"]
 
 def validate_response(response: str, user_id: int, language: str = 'ru') -> str:
     """
@@ -36,24 +60,24 @@ def validate_response(response: str, user_id: int, language: str = 'ru') -> str:
     Returns:
         str: Проверенный и при необходимости измененный ответ
     """
-    original_response = response
-    is_suspicious = False
-    
     # Проверяем на наличие подозрительных паттернов
-    for pattern in SUSPICIOUS_RESPONSE_PATTERNS:
-        if re.search(pattern, response):
-            is_suspicious = True
-            # Логируем подозрительный ответ
-            log_suspicious_input(
-                user_id, 
-                original_response[:100] + "...", 
-                "suspicious_response", 
-                "replaced_with_fallback"
-            )
-            
-            # Заменяем на безопасный ответ
-            fallback_language = language if language in SAFE_FALLBACK_RESPONSES else 'en'
-            return SAFE_FALLBACK_RESPONSES[fallback_language]
+    matched_ids = scan_pattern_ids(_SUSPICIOUS_RESPONSE_DB, response)
+    if matched_ids is None:
+        is_suspicious = _SUSPICIOUS_RESPONSE_RE.search(response) is not None
+    else:
+        is_suspicious = bool(matched_ids)
+    
+    if is_suspicious:
+        # Логируем подозрительный ответ в фоне, не задерживая ответ пользователю
+        enqueue_suspicious_inputs([(
+            user_id, 
+            response[:100] + "...", 
+            "suspicious_response", 
+            "replaced_with_fallback"
+        )])
+        
+        # Заменяем на безопасный ответ
+        return SAFE_FALLBACK_RESPONSES.get(language, _DEFAULT_FALLBACK_RESPONSE)
     
     return response
 
@@ -68,32 +92,27 @@ def sanitize_environment_variables(response: str, user_id: int) -> str:
     Returns:
         str: Проверенный и при необходимости измененный ответ
     """
-    # Паттерны для обнаружения потенциальных секретов
-    env_var_patterns = [
-        (r"(?i)(TELEGRAM_BOT_TOKEN|OPENAI_API_KEY|API_KEY|SECRET_KEY)[\s]*=[\s]*['\"](.*?)['\"]", "[REDACTED]"),
-        (r"(?i)(sk-[A-Za-z0-9]{1,})", "[API_KEY_REDACTED]"),  # Исправлено: {20,} -> {1,}
-        (r"(?i)(access_token|bearer token|auth token)[\s]*[:=][\s]*['\"](.*?)['\"]", "[TOKEN_REDACTED]"),
-        # Добавлен новый паттерн для обнаружения API ключей без кавычек
-        (r"(?i)(TELEGRAM_BOT_TOKEN|OPENAI_API_KEY|API_KEY|SECRET_KEY)[\s]*=[\s]*([\w\-]+)", r"\1=[REDACTED]"),
-    ]
-    
-    original_response = response
     is_modified = False
     
+    # Hyperscan отсеивает паттерны, которых точно нет в ответе; подстановку делает re
+    matched_ids = scan_pattern_ids(_ENV_VAR_DB, response)
+    
     # Проверяем на наличие паттернов секретов
-    for pattern, replacement in env_var_patterns:
-        if re.search(pattern, response):
+    for pattern_id, (pattern, replacement) in enumerate(_COMPILED_ENV_VAR_PATTERNS):
+        if matched_ids is not None and pattern_id not in matched_ids:
+            continue
+        response, replaced = pattern.subn(replacement, response)
+        if replaced:
             is_modified = True
-            response = re.sub(pattern, replacement, response)
     
     if is_modified:
         # Логируем обнаружение потенциальных секретов
-        log_suspicious_input(
+        enqueue_suspicious_inputs([(
             user_id, 
             "Potential secrets in response", 
             "env_var_exposure", 
             "redacted"
-        )
+        )])
     
     return response
 
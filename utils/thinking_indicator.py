@@ -1,5 +1,6 @@
 # utils/thinking_indicator.py
 
+import asyncio
 import logging
 
 from telegram.error import BadRequest, TelegramError
@@ -26,15 +27,25 @@ class ThinkingIndicator:
         chat_id = update.effective_chat.id
         text = 'Думаю...' if language == 'ru' else 'Thinking...'
         try:
-            # Показываем «бот печатает...»
-            await context.bot.send_chat_action(
-                chat_id=chat_id,
-                action=ChatAction.TYPING
-            )
-            msg = await context.bot.send_message(
-                chat_id=chat_id,
-                text=text
+            # Показываем «бот печатает...» и отправляем «Думаю...» параллельно
+            typing_result, msg = await asyncio.gather(
+                context.bot.send_chat_action(
+                    chat_id=chat_id,
+                    action=ChatAction.TYPING
+                ),
+                context.bot.send_message(
+                    chat_id=chat_id,
+                    text=text
+                ),
+                return_exceptions=True
             )
+            if isinstance(typing_result, Exception):
+                # Без статуса «печатает» можно обойтись, сообщение уже отправлено
+                logging.warning(
+                    "Failed to send typing action for chat %s: %s", chat_id, typing_result
+                )
+            if isinstance(msg, Exception):
+                raise msg
             # Сохраняем ID сообщения, чтобы потом его отредактировать
             self.active_indicators[chat_id] = msg.message_id
         except Exception:
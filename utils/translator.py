@@ -1,31 +1,61 @@
 # utils/translator.py
 
 import logging
+from functools import lru_cache
+from typing import Tuple
 from googletrans import Translator
 
 logger = logging.getLogger(__name__)
 
 translator = Translator()
 
+# Максимальное количество закэшированных переводов и определений языка
+TRANSLATION_CACHE_SIZE = 10000
+
+@lru_cache(maxsize=TRANSLATION_CACHE_SIZE)
+def _translate_cached(text: str, dest_language: str) -> Tuple[str, str]:
+    # Исключения не кэшируются, поэтому неудачный перевод будет повторён
+    result = translator.translate(text, dest=dest_language)
+    return result.text, result.src
+
+@lru_cache(maxsize=TRANSLATION_CACHE_SIZE)
+def _detect_cached(text: str) -> str:
+    return translator.detect(text).lang
+
 def translate_text(text: str, dest_language: str = "en") -> str:
     """
     Переводит text на указанный язык (en|ru).
+    Повторные переводы одного и того же текста берутся из кэша.
     """
     if not text.strip():
         return text
     try:
-        result = translator.translate(text, dest=dest_language)
-        return result.text
+        return _translate_cached(text, dest_language)[0]
     except Exception as e:
         logger.error(f"Translation error: {e}")
         return text  # Возвращаем оригинал, если не вышло
 
+def translate_and_detect(text: str, dest_language: str = "en") -> Tuple[str, str]:
+    """
+    Переводит text и одновременно определяет язык оригинала одним запросом.
+    Используйте вместо пары detect_language + translate_text.
+    
+    Returns:
+        Кортеж (перевод, код исходного языка); при ошибке - (text, "unknown")
+    """
+    if not text.strip():
+        return text, "unknown"
+    try:
+        return _translate_cached(text, dest_language)
+    except Exception as e:
+        logger.error(f"Translation error: {e}")
+        return text, "unknown"
+
 def detect_language(text: str) -> str:
     """
     Определяет язык текста (возвращает код 'en', 'ru' и т.д.).
     """
     try:
-        detection = translator.detect(text)
-        return detection.lang
+        return _detect_cached(text)
     except:
         return "unknown"
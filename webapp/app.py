@@ -2,14 +2,106 @@
 Модуль для создания и настройки Flask-приложения веб-интерфейса.
 """
 import os
+import hashlib
 import logging
-from flask import Flask, jsonify, render_template, send_from_directory, request
+import orjson
+from flask import Flask, current_app, jsonify, render_template, request
+from flask.json.provider import DefaultJSONProvider
 from flask_jwt_extended import JWTManager
+from jinja2 import FileSystemBytecodeCache
 
 from config import JWT_SECRET_KEY, WEB_DEBUG
 
 logger = logging.getLogger(__name__)
 
+# Страницы веб-интерфейса: (маршрут, endpoint, шаблон)
+PAGE_ROUTES = [
+    # Корневой маршрут — возвращает HTML UI панели операторов
+    ('/', 'index', 'tailwind/login.html'),
+    ('/login', 'login_page', 'tailwind/login.html'),
+    ('/dashboard', 'dashboard_page', 'tailwind/dashboard.html'),
+    ('/active-chats', 'active_chats_page', 'tailwind/active-chats.html'),
+    ('/chat', 'chat_page', 'tailwind/chat.html'),
+    ('/knowledge-base', 'knowledge_base_page', 'tailwind/knowledge-base.html'),
+    ('/history', 'history_page', 'tailwind/history.html'),
+    ('/statistics', 'statistics_page', 'tailwind/statistics.html'),
+]
+
+# Отрендеренные страницы: (шаблон, script_root) -> (HTML, ETag). Шаблоны страниц не зависят
+# от пользователя, поэтому каждый рендерится один раз на процесс
+_RENDERED_PAGES = {}
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    JSON-провайдер Flask на основе orjson.
+    
+    datetime сериализуется самим orjson в ISO 8601 (как datetime.isoformat()),
+    поэтому обработчикам не нужно вызывать isoformat() для каждой строки.
+    Типы, которые orjson не сериализует сам (Decimal и т.п.), передаются
+    в DefaultJSONProvider.default.
+    """
+    _options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self._options).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # jsonify попадает сюда: байты orjson отдаются в ответ напрямую,
+        # без промежуточной строки и повторного кодирования
+        obj = self._prepare_response_obj(args, kwargs)
+        options = self._options | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            options |= orjson.OPT_INDENT_2
+        
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=options),
+            mimetype=self.mimetype
+        )
+
+def _make_page_view(template: str):
+    """
+    Создает view-функцию, которая отдает указанный шаблон.
+    
+    Args:
+        template: Путь к шаблону относительно папки templates
+        
+    Returns:
+        Функция-обработчик для app.add_url_rule
+    """
+    def page_view():
+        return render_page(template)
+    return page_view
+
+def render_page(template: str):
+    """
+    Отдает страницу веб-интерфейса, отрендеренную один раз, с ETag;
+    на совпадающий If-None-Match отвечает 304 Not Modified.
+    В режиме отладки шаблон рендерится при каждом запросе, чтобы правки были видны сразу.
+    
+    Args:
+        template: Путь к шаблону относительно папки templates
+        
+    Returns:
+        Response: HTML-ответ
+    """
+    if current_app.debug:
+        return render_template(template)
+    
+    # url_for('static') в шаблонах зависит от префикса, под которым смонтировано приложение
+    key = (template, request.script_root)
+    page = _RENDERED_PAGES.get(key)
+    if page is None:
+        body = render_template(template).encode('utf-8')
+        page = _RENDERED_PAGES[key] = (body, hashlib.sha1(body).hexdigest())
+    
+    body, etag = page
+    response = current_app.response_class(body, mimetype='text/html')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 def create_app():
     """
     Создает и настраивает Flask-приложение.
@@ -22,12 +114,21 @@ def create_app():
                 template_folder='templates',
                 static_folder='static')
     
+    # Сериализация JSON через orjson для всех jsonify
+    app.json = ORJSONProvider(app)
+    
     # Настраиваем приложение
     app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key')
     app.config['JWT_SECRET_KEY'] = JWT_SECRET_KEY
     app.config['JWT_TOKEN_LOCATION'] = ['headers']
     app.config['JWT_HEADER_NAME'] = 'Authorization'
     app.config['JWT_HEADER_TYPE'] = 'Bearer'
+    # Браузер кэширует статические файлы на сутки
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 86400
+    
+    # Скомпилированные шаблоны сохраняются на диск и переиспользуются
+    # при следующих запусках воркеров
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
     
     # Инициализируем JWT
     jwt = JWTManager(app)
@@ -46,23 +147,19 @@ def create_app():
     from webapp.auth.routes import auth_bp
     from webapp.ops.routes import ops_bp
     from webapp.stats.routes import stats_bp
+    from webapp.routes.history import history_bp
+    from webapp.routes.profile import profile_bp
+    from webapp.health import health_bp
     
     # Эндпоинты веб-API теперь под /api/...
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(ops_bp,  url_prefix='/api/ops')
     app.register_blueprint(stats_bp, url_prefix='/api/stats')
-    
-    # Добавляем маршрут для API аутентификации (альтернативный)
-    @app.route('/api/auth/login', methods=['POST'])
-    def api_auth_login():
-        # Перенаправляем запрос на обработчик в auth_bp
-        from webapp.auth.routes import login
-        return login()
-    
-    # Добавляем маршрут для проверки работоспособности
-    @app.route('/health')
-    def health_check():
-        return jsonify({'status': 'ok'})
+    # Маршруты истории и профиля уже содержат полный путь (/api/history, /api/profile, /profile)
+    app.register_blueprint(history_bp)
+    app.register_blueprint(profile_bp)
+    # Проверки работоспособности: /health, /health/db, /health/ready, /health/live
+    app.register_blueprint(health_bp)
     
     # Временный API-индекс на /api (для тестов)
     @app.route('/api')
@@ -74,51 +171,25 @@ def create_app():
                 'auth': '/api/auth',
                 'operations': '/api/ops',
                 'statistics': '/api/stats',
+                'history': '/api/history',
+                'profile': '/api/profile',
                 'health': '/health'
             }
         })
     
-    # Корневой маршрут — возвращает HTML UI панели операторов
-    @app.route('/')
-    def index():
-        return render_template('tailwind/login.html')
-    
     # Добавляем маршруты для веб-интерфейса
-    @app.route('/login')
-    def login_page():
-        return render_template('tailwind/login.html')
+    for route, endpoint, template in PAGE_ROUTES:
+        app.add_url_rule(route, endpoint=endpoint, view_func=_make_page_view(template))
     
-    @app.route('/dashboard')
-    def dashboard_page():
-        return render_template('tailwind/dashboard.html')
-    
-    @app.route('/active-chats')
-    def active_chats_page():
-        return render_template('tailwind/active-chats.html')
-    
-    @app.route('/chat')
-    def chat_page():
-        return render_template('tailwind/chat.html')
-    
-    @app.route('/knowledge-base')
-    def knowledge_base_page():
-        return render_template('tailwind/knowledge-base.html')
-
-    # Добавляем маршрут для страницы истории
-    @app.route('/history')
-    def history_page():
-        return render_template('tailwind/history.html')
-
-    # Добавляем маршрут для страницы статистики
-    @app.route('/statistics')
-    def statistics_page():
-        return render_template('tailwind/statistics.html')
-    
-    # (Опционально) Catch-all для SPA:
+    # (Опционально) Catch-all для SPA.
+    # Статические файлы отдаются встроенным маршрутом /static/, поэтому
+    # проверять наличие файла на диске для каждого неизвестного URL не нужно
     @app.route('/<path:path>')
     def static_proxy(path):
-        if os.path.exists(os.path.join(app.static_folder, path)):
-            return send_from_directory(app.static_folder, path)
-        return render_template('tailwind/login.html')
+        return render_page('tailwind/login.html')
+    
+    # Компилируем шаблоны страниц заранее, чтобы первый запрос не ждал разбора
+    for template in {template for _, _, template in PAGE_ROUTES}:
+        app.jinja_env.get_template(template)
     
     return app
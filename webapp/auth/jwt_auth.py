@@ -2,20 +2,181 @@
 Модуль для аутентификации и авторизации в веб-интерфейсе.
 Реализует JWT-авторизацию для API.
 """
+import re
+import hmac
+import atexit
+import json
+import time
+import base64
+import hashlib
 import logging
+import threading
 import bcrypt
-from datetime import datetime, timedelta
+from datetime import datetime
 from functools import wraps
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, NamedTuple, Optional, Callable, Tuple
 
 import jwt
 from flask import request, jsonify, current_app, g
+from sqlalchemy import event, inspect, select, update
 
-from config import JWT_SECRET_KEY, JWT_ACCESS_TOKEN_EXPIRES
+from config import JWT_SECRET_KEY, JWT_ACCESS_TOKEN_EXPIRES, BCRYPT_ROUNDS
 from storage.database_unified import db_session, WebUser
 
 logger = logging.getLogger(__name__)
 
+# Кэш проверенных токенов: blake2b(токен) -> (срок действия, payload).
+# Повторные запросы с тем же токеном не декодируют JWT и не считают HMAC заново
+TOKEN_CACHE_SIZE = 10000
+_TOKEN_CACHE: Dict[bytes, Tuple[float, Dict[str, Any]]] = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+def _token_cache_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+# Кэш пользователей для login_user: username -> (срок жизни записи, данные пользователя).
+# Изменения WebUser через ORM в этом процессе сбрасывают запись сразу (см.
+# _invalidate_on_user_change). Изменения в других процессах и прямые UPDATE
+# в обход ORM видны только после истечения USER_CACHE_TTL_SECONDS: столько
+# секунд после смены пароля, роли или отключения пользователя старые данные
+# ещё могут приниматься при входе
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL_SECONDS = 60
+
+class _UserRecord(NamedTuple):
+    id: int
+    username: str
+    password_hash: str
+    role: str
+    is_active: bool
+
+_USER_CACHE: Dict[str, Tuple[float, _UserRecord]] = {}
+_USER_CACHE_LOCK = threading.Lock()
+
+# Время входа копится в памяти и раз в LAST_LOGIN_FLUSH_SECONDS записывается
+# в БД одним пакетным UPDATE (для каждого пользователя - последнее значение)
+LAST_LOGIN_FLUSH_SECONDS = 5
+_PENDING_LOGINS: Dict[int, datetime] = {}
+_PENDING_LOGINS_LOCK = threading.Lock()
+_last_login_worker: Optional[threading.Thread] = None
+
+def _get_cached_user(username: str) -> Optional[_UserRecord]:
+    with _USER_CACHE_LOCK:
+        cached = _USER_CACHE.get(username)
+        if cached is None:
+            return None
+        expires_at, user = cached
+        if time.monotonic() >= expires_at:
+            del _USER_CACHE[username]
+            return None
+        return user
+
+def _cache_user(user: _UserRecord) -> None:
+    with _USER_CACHE_LOCK:
+        if len(_USER_CACHE) >= USER_CACHE_SIZE:
+            _USER_CACHE.clear()
+        _USER_CACHE[user.username] = (time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+
+def invalidate_user_cache(username: str) -> None:
+    """
+    Удаляет пользователя из кэша login_user (после смены пароля, роли или статуса).
+    
+    Args:
+        username: Имя пользователя
+    """
+    with _USER_CACHE_LOCK:
+        _USER_CACHE.pop(username, None)
+
+@event.listens_for(WebUser, 'after_update')
+@event.listens_for(WebUser, 'after_delete')
+def _invalidate_on_user_change(mapper, connection, target) -> None:
+    """Сбрасывает кэш login_user при любом изменении или удалении WebUser через ORM"""
+    invalidate_user_cache(target.username)
+    # При переименовании в кэше могла остаться запись под старым именем
+    for old_username in inspect(target).attrs.username.history.deleted:
+        invalidate_user_cache(old_username)
+
+def _flush_last_logins() -> None:
+    """Записывает накопленные времена входа одним пакетным UPDATE по первичному ключу"""
+    with _PENDING_LOGINS_LOCK:
+        pending = dict(_PENDING_LOGINS)
+        _PENDING_LOGINS.clear()
+    
+    if not pending:
+        return
+    
+    try:
+        with db_session() as db:
+            db.execute(
+                update(WebUser),
+                [{'id': user_id, 'last_login': login_time} for user_id, login_time in pending.items()]
+            )
+    except Exception as e:
+        logger.error(f"Failed to update last login for {len(pending)} users: {e}")
+
+def _last_login_writer() -> None:
+    """Фоновый поток: периодически сбрасывает накопленные времена входа в БД"""
+    while True:
+        time.sleep(LAST_LOGIN_FLUSH_SECONDS)
+        _flush_last_logins()
+
+def _record_last_login(user_id: int, login_time: datetime) -> None:
+    """
+    Ставит время последнего входа пользователя в очередь на запись.
+    
+    Args:
+        user_id: ID пользователя
+        login_time: Время входа (UTC)
+    """
+    global _last_login_worker
+    
+    if _last_login_worker is None:
+        with _PENDING_LOGINS_LOCK:
+            if _last_login_worker is None:
+                worker = threading.Thread(
+                    target=_last_login_writer,
+                    name="last-login-writer",
+                    daemon=True
+                )
+                worker.start()
+                _last_login_worker = worker
+                # Не теряем накопленное при штатной остановке процесса
+                atexit.register(_flush_last_logins)
+    
+    with _PENDING_LOGINS_LOCK:
+        _PENDING_LOGINS[user_id] = login_time
+
+# Компактная форма JWT: три base64url-сегмента через точку. Всё остальное
+# отбрасывается до разбора и вычисления HMAC
+_TOKEN_RE = re.compile(r'[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+')
+
+# Сколько дней после истечения токен ещё можно обменять на новый
+TOKEN_RENEWAL_WINDOW_DAYS = 7
+
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+# Заголовок токена и ключ HMAC не меняются, поэтому готовятся один раз.
+# Формат совпадает с jwt.encode(..., algorithm='HS256')
+_JWT_HEADER_B64 = _b64url(b'{"alg":"HS256","typ":"JWT"}')
+_JWT_HMAC = hmac.new(JWT_SECRET_KEY.encode('utf-8'), digestmod=hashlib.sha256)
+
+def _encode_jwt(payload: Dict[str, Any]) -> str:
+    """
+    Подписывает payload алгоритмом HS256 без накладных расходов PyJWT.
+    
+    Args:
+        payload: Данные токена (только JSON-совместимые типы)
+        
+    Returns:
+        str: JWT-токен
+    """
+    payload_b64 = _b64url(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    signing_input = _JWT_HEADER_B64 + b'.' + payload_b64
+    signature = _JWT_HMAC.copy()
+    signature.update(signing_input)
+    return (signing_input + b'.' + _b64url(signature.digest())).decode('ascii')
+
 def generate_password_hash(password: str) -> str:
     """
     Генерирует хеш пароля с использованием bcrypt.
@@ -26,8 +187,10 @@ def generate_password_hash(password: str) -> str:
     Returns:
         str: Хеш пароля
     """
-    # Генерируем соль и хешируем пароль
-    salt = bcrypt.gensalt()
+    # Генерируем соль и хешируем пароль. Пакет bcrypt (4.x) реализован на Rust
+    # и отпускает GIL, поэтому хеширование в разных потоках идёт параллельно;
+    # формат $2b$ совместим с уже сохранёнными хешами
+    salt = bcrypt.gensalt(BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -47,6 +210,12 @@ def check_password(password: str, password_hash: str) -> bool:
     """
     return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
 
+# Хеш для сравнения при входе несуществующего или неактивного пользователя:
+# ответ занимает столько же времени, сколько при неверном пароле. Заранее
+# посчитанные соль и хеш; стоимость подставляется из BCRYPT_ROUNDS, поэтому
+# checkpw тратит на него столько же раундов, сколько на настоящие хеши
+_DUMMY_PASSWORD_HASH = '$2b$%02d$OootEIdMXXtvNN.V1cfLquwzjftiaX82akJSs0.dwQcTo5OjZo20.' % BCRYPT_ROUNDS
+
 def create_access_token(user_id: int, username: str, role: str) -> str:
     """
     Создает JWT-токен доступа.
@@ -59,8 +228,8 @@ def create_access_token(user_id: int, username: str, role: str) -> str:
     Returns:
         str: JWT-токен
     """
-    # Устанавливаем время истечения токена
-    expires = datetime.utcnow() + timedelta(seconds=JWT_ACCESS_TOKEN_EXPIRES)
+    # Устанавливаем время истечения токена (целые секунды Unix, как требует JWT)
+    expires = int(time.time()) + JWT_ACCESS_TOKEN_EXPIRES
     
     # Создаем payload токена
     payload = {
@@ -71,7 +240,7 @@ def create_access_token(user_id: int, username: str, role: str) -> str:
     }
     
     # Генерируем токен
-    token = jwt.encode(payload, JWT_SECRET_KEY, algorithm='HS256')
+    token = _encode_jwt(payload)
     
     return token
 
@@ -85,42 +254,78 @@ def verify_token(token: str) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: Данные пользователя или None, если токен недействителен
     """
+    if not isinstance(token, str) or not _TOKEN_RE.fullmatch(token):
+        logger.warning("Malformed JWT rejected")
+        return None
+    
+    cache_key = _token_cache_key(token)
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(cache_key)
+    if cached is not None:
+        expires_at, cached_payload = cached
+        if time.time() < expires_at:
+            return dict(cached_payload)
+        with _TOKEN_CACHE_LOCK:
+            _TOKEN_CACHE.pop(cache_key, None)
+    
     try:
-        # Декодируем токен с отключенной проверкой срока действия
-        # Это позволит нам самостоятельно обработать истекшие токены
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'], options={"verify_exp": False})
+        # Подпись и срок действия проверяет PyJWT; продление истекших токенов
+        # выполняется отдельно в renew_token
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
         
-        # Проверяем срок действия
-        if 'exp' in payload and datetime.fromtimestamp(payload['exp']) < datetime.utcnow():
-            # Если токен истек, но не более чем на 7 дней, автоматически продлеваем его
-            expiration_delta = datetime.utcnow() - datetime.fromtimestamp(payload['exp'])
-            if expiration_delta.days <= 7:
-                # Создаем новый токен с теми же данными, но с обновленным сроком действия
-                new_token = create_access_token(
-                    user_id=payload['sub'],
-                    username=payload['username'],
-                    role=payload['role']
-                )
-                # Добавляем информацию о продлении в payload
-                payload['renewed'] = True
-                payload['original_exp'] = payload['exp']
-                payload['exp'] = (datetime.utcnow() + timedelta(seconds=JWT_ACCESS_TOKEN_EXPIRES)).timestamp()
-                
-                # Логируем продление токена
-                logger.info(f"Token for user {payload['username']} was automatically renewed")
-                
-                # Возвращаем обновленный payload
-                return payload
-            else:
-                # Если токен истек более 7 дней назад, считаем его недействительным
-                logger.warning(f"Token expired more than 7 days ago for user {payload.get('username', 'unknown')}")
-                return None
+        # Кэшируем только действующие токены и только до истечения их срока
+        if 'exp' in payload:
+            with _TOKEN_CACHE_LOCK:
+                if len(_TOKEN_CACHE) >= TOKEN_CACHE_SIZE:
+                    _TOKEN_CACHE.clear()
+                _TOKEN_CACHE[cache_key] = (payload['exp'], dict(payload))
         
         return payload
+    except jwt.ExpiredSignatureError:
+        logger.debug("JWT has expired")
+        return None
     except jwt.PyJWTError as e:
         logger.error(f"JWT verification error: {e}")
         return None
 
+def renew_token(token: str) -> Optional[str]:
+    """
+    Выпускает новый токен взамен действующего или недавно истекшего.
+    
+    Args:
+        token: JWT-токен
+        
+    Returns:
+        Optional[str]: Новый JWT-токен или None, если токен недействителен
+                       или истек более TOKEN_RENEWAL_WINDOW_DAYS дней назад
+    """
+    if not isinstance(token, str) or not _TOKEN_RE.fullmatch(token):
+        return None
+    
+    try:
+        # Подпись проверяется, срок действия - вручную ниже
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'], options={"verify_exp": False})
+    except jwt.PyJWTError as e:
+        logger.error(f"JWT verification error: {e}")
+        return None
+    
+    # Если токен истек, но не более чем на 7 дней, продлеваем его
+    if 'exp' in payload:
+        expiration_days = int(time.time() - payload['exp']) // 86400
+        if expiration_days > TOKEN_RENEWAL_WINDOW_DAYS:
+            logger.warning(f"Token expired more than {TOKEN_RENEWAL_WINDOW_DAYS} days ago for user {payload.get('username', 'unknown')}")
+            return None
+    
+    # Создаем новый токен с теми же данными, но с обновленным сроком действия
+    new_token = create_access_token(
+        user_id=payload['sub'],
+        username=payload['username'],
+        role=payload['role']
+    )
+    
+    logger.info(f"Token for user {payload['username']} was renewed")
+    return new_token
+
 def login_user(username: str, password: str) -> Optional[Dict[str, Any]]:
     """
     Аутентифицирует пользователя и возвращает JWT-токен.
@@ -135,39 +340,56 @@ def login_user(username: str, password: str) -> Optional[Dict[str, Any]]:
     logger.debug(f"Attempting login for user: {username}")
     
     try:
-        with db_session() as db:
-            # Получаем пользователя по имени из той же сессии
-            user = db.query(WebUser).filter_by(username=username).first()
-            
-            # Проверяем существование пользователя и активность
-            if not user:
-                logger.debug(f"User {username} not found")
-                return None
+        user = _get_cached_user(username)
+        from_cache = user is not None
+        
+        if user is None:
+            with db_session() as db:
+                # Получаем только нужные колонки, без загрузки ORM-объекта
+                row = db.execute(
+                    select(
+                        WebUser.id, WebUser.username, WebUser.password_hash,
+                        WebUser.role, WebUser.is_active
+                    ).where(WebUser.username == username)
+                ).first()
                 
-            if not user.is_active:
-                logger.debug(f"User {username} is not active")
-                return None
-            
-            # Проверяем пароль
-            if not check_password(password, user.password_hash):
-                logger.debug(f"Invalid password for user {username}")
-                return None
-            
-            # Обновляем время последнего входа в той же сессии
-            user.last_login = datetime.utcnow()
-            db.commit()
-            
-            logger.debug(f"Login successful for user {username}")
-            
-            # Создаем токен
-            token = create_access_token(user.id, user.username, user.role)
-            
-            return {
-                'user_id': user.id,
-                'username': user.username,
-                'role': user.role,
-                'token': token
-            }
+                # Проверяем существование пользователя
+                if not row:
+                    logger.debug(f"User {username} not found")
+                    check_password(password, _DUMMY_PASSWORD_HASH)
+                    return None
+                
+                user = _UserRecord._make(row)
+            _cache_user(user)
+        
+        # Проверяем активность пользователя
+        if not user.is_active:
+            logger.debug(f"User {username} is not active")
+            check_password(password, _DUMMY_PASSWORD_HASH)
+            return None
+        
+        # Проверяем пароль
+        if not check_password(password, user.password_hash):
+            logger.debug(f"Invalid password for user {username}")
+            if from_cache:
+                # Пароль мог смениться - следующая попытка перечитает пользователя из БД
+                invalidate_user_cache(username)
+            return None
+        
+        # Обновляем время последнего входа в фоне
+        _record_last_login(user.id, datetime.utcnow())
+        
+        logger.debug(f"Login successful for user {username}")
+        
+        # Создаем токен
+        token = create_access_token(user.id, user.username, user.role)
+        
+        return {
+            'user_id': user.id,
+            'username': user.username,
+            'role': user.role,
+            'token': token
+        }
     except Exception as e:
         logger.error(f"Login error for user {username}: {e}", exc_info=True)
         return None
@@ -190,11 +412,20 @@ def token_required(f: Callable) -> Callable:
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({'message': 'Missing or invalid token'}), 401
         
-        token = auth_header.split(' ')[1]
+        token = auth_header[7:]
         
         # Проверяем токен
         payload = verify_token(token)
         if not payload:
+            # Недавно истекший токен не продлевается молча: клиент получает
+            # новый токен в ответе и повторяет запрос с ним
+            new_token = renew_token(token)
+            if new_token:
+                return jsonify({
+                    'message': 'Token expired',
+                    'code': 'token_expired_refreshable',
+                    'new_access_token': new_token
+                }), 401
             return jsonify({'message': 'Invalid or expired token'}), 401
         
         # Сохраняем данные пользователя в g для использования в обработчике
@@ -214,6 +445,8 @@ def role_required(roles: list) -> Callable:
     Returns:
         Callable: Декоратор
     """
+    allowed_roles = frozenset(roles)
+    
     def decorator(f: Callable) -> Callable:
         @wraps(f)
         def decorated(*args, **kwargs):
@@ -222,7 +455,7 @@ def role_required(roles: list) -> Callable:
                 return jsonify({'message': 'Authentication required'}), 401
             
             # Проверяем роль пользователя
-            if g.user['role'] not in roles:
+            if g.user['role'] not in allowed_roles:
                 return jsonify({'message': 'Insufficient permissions'}), 403
             
             return f(*args, **kwargs)
@@ -2,11 +2,13 @@
 Маршруты для аутентификации в веб-интерфейсе.
 """
 import logging
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, g
+from sqlalchemy.exc import IntegrityError
 
-from webapp.auth.jwt_auth import login_user
+from webapp.auth.jwt_auth import (
+    login_user, renew_token, generate_password_hash, token_required, role_required
+)
 from storage.database_unified import db_session, WebUser
-from webapp.auth.jwt_auth import generate_password_hash, token_required, role_required
 from utils.rate_limit import web_rate_limit  # Импортируем декоратор для rate-limiting
 
 logger = logging.getLogger(__name__)
@@ -46,6 +48,27 @@ def login():
         'token': user_data['token']
     }), 200
 
+@auth_bp.route('/refresh', methods=['POST'])
+@web_rate_limit  # Применяем декоратор для ограничения частоты запросов
+def refresh():
+    """
+    Обмен действующего или недавно истекшего JWT-токена на новый.
+    """
+    auth_header = request.headers.get('Authorization')
+    
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({'message': 'Missing or invalid token'}), 401
+    
+    new_token = renew_token(auth_header[7:])
+    
+    if not new_token:
+        return jsonify({'message': 'Invalid or expired token'}), 401
+    
+    return jsonify({
+        'message': 'Token refreshed',
+        'token': new_token
+    }), 200
+
 @auth_bp.route('/check', methods=['GET'])
 @token_required
 @web_rate_limit  # Применяем декоратор для ограничения частоты запросов
@@ -53,8 +76,6 @@ def check_auth():
     """
     Проверка аутентификации пользователя.
     """
-    from flask import g
-    
     return jsonify({
         'message': 'Authentication valid',
         'user': {
@@ -86,15 +107,9 @@ def create_user():
     if role not in ['admin', 'operator', 'viewer']:
         return jsonify({'message': 'Invalid role'}), 400
     
-    # Проверяем, существует ли пользователь с таким именем и создаем нового
+    # Создаем пользователя; уникальность имени проверяет индекс на username
     try:
         with db_session() as db:
-            # Проверяем существование пользователя в той же сессии
-            existing_user = db.query(WebUser).filter_by(username=username).first()
-            
-            if existing_user:
-                return jsonify({'message': 'Username already exists'}), 409
-            
             # Хешируем пароль
             password_hash = generate_password_hash(password)
             
@@ -107,7 +122,11 @@ def create_user():
             )
             
             db.add(new_user)
-            db.commit()
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                return jsonify({'message': 'Username already exists'}), 409
             
             # Получаем ID созданного пользователя
             user_id = new_user.id
@@ -142,15 +161,9 @@ def init_admin():
     username = data['username']
     password = data['password']
     
-    # Проверяем, есть ли уже пользователи в системе и создаем администратора
+    # Создаем администратора; уникальность имени проверяет индекс на username
     try:
         with db_session() as db:
-            # Проверяем, существует ли пользователь с таким именем в той же сессии
-            existing_user = db.query(WebUser).filter_by(username=username).first()
-            
-            if existing_user:
-                return jsonify({'message': 'Username already exists'}), 409
-            
             # Хешируем пароль
             password_hash = generate_password_hash(password)
             
@@ -163,7 +176,11 @@ def init_admin():
             )
             
             db.add(admin_user)
-            db.commit()
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                return jsonify({'message': 'Username already exists'}), 409
             
             # Получаем ID созданного пользователя
             user_id = admin_user.id
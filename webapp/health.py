@@ -1,14 +1,111 @@
 """
 Health check endpoints для мониторинга состояния системы.
 """
+import time
 import logging
-from flask import Blueprint, jsonify
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+import orjson
+from flask import Blueprint, jsonify, current_app
 from utils.db_monitor import check_db_health, get_connection_stats
 
 logger = logging.getLogger(__name__)
 
 health_bp = Blueprint('health', __name__)
 
+# Сколько секунд переиспользуется результат проверки БД. Пробы оркестратора
+# и балансировщика приходят часто, а SELECT 1 на каждую занимает соединение из пула
+HEALTH_CACHE_TTL_SECONDS = 1.0
+
+_JSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+
+@dataclass(slots=True)
+class HealthSnapshot:
+    """Результат проверки БД с заранее сериализованными ответами health-эндпоинтов"""
+    created_at: float
+    status: str
+    health_payload: bytes
+    db_payload: bytes
+    ready_payload: bytes
+    
+    @property
+    def healthy(self) -> bool:
+        return self.status == "healthy"
+
+_health_snapshot: Optional[HealthSnapshot] = None
+_health_snapshot_lock = threading.Lock()
+
+def _build_snapshot(db_health: Dict[str, Any]) -> HealthSnapshot:
+    """
+    Готовит тела ответов /health, /health/db и /health/ready по результату проверки БД.
+    
+    Args:
+        db_health: Результат check_db_health
+        
+    Returns:
+        HealthSnapshot: Снимок состояния
+    """
+    healthy = db_health["status"] == "healthy"
+    
+    health = {
+        "status": "healthy" if healthy else "unhealthy",
+        "timestamp": db_health["timestamp"],
+        "components": {
+            "database": {
+                "status": db_health["status"],
+                "message": db_health["message"]
+            }
+        }
+    }
+    
+    if healthy:
+        ready = {
+            "status": "ready",
+            "message": "Service is ready to handle requests"
+        }
+    else:
+        ready = {
+            "status": "not_ready",
+            "message": "Service is not ready - database issues",
+            "details": db_health["message"]
+        }
+    
+    return HealthSnapshot(
+        created_at=time.monotonic(),
+        status=db_health["status"],
+        health_payload=orjson.dumps(health, option=_JSON_OPTIONS),
+        db_payload=orjson.dumps(db_health, default=str, option=_JSON_OPTIONS),
+        ready_payload=orjson.dumps(ready, option=_JSON_OPTIONS)
+    )
+
+def _get_health_snapshot() -> HealthSnapshot:
+    """
+    Возвращает снимок состояния, обновляя его не чаще раза в HEALTH_CACHE_TTL_SECONDS.
+    Одновременные запросы после истечения снимка выполняют только одну проверку.
+    
+    Returns:
+        HealthSnapshot: Актуальный снимок состояния
+    """
+    global _health_snapshot
+    
+    snapshot = _health_snapshot
+    if snapshot is not None and time.monotonic() - snapshot.created_at < HEALTH_CACHE_TTL_SECONDS:
+        return snapshot
+    
+    with _health_snapshot_lock:
+        snapshot = _health_snapshot
+        if snapshot is not None and time.monotonic() - snapshot.created_at < HEALTH_CACHE_TTL_SECONDS:
+            return snapshot
+        
+        snapshot = _build_snapshot(check_db_health())
+        _health_snapshot = snapshot
+        return snapshot
+
+def _snapshot_response(payload: bytes, status: int):
+    return current_app.response_class(payload, status=status, mimetype='application/json')
+
 @health_bp.route('/health')
 def health_check():
     """
@@ -18,21 +115,7 @@ def health_check():
         JSON: Статус здоровья системы
     """
     try:
-        db_health = check_db_health()
-        
-        # Определяем общий статус системы
-        overall_status = "healthy" if db_health["status"] == "healthy" else "unhealthy"
-        
-        return jsonify({
-            "status": overall_status,
-            "timestamp": db_health["timestamp"],
-            "components": {
-                "database": {
-                    "status": db_health["status"],
-                    "message": db_health["message"]
-                }
-            }
-        })
+        return _snapshot_response(_get_health_snapshot().health_payload, 200)
     except Exception as e:
         logger.error(f"Health check failed: {e}", exc_info=True)
         return jsonify({
@@ -50,13 +133,9 @@ def db_health_check():
         JSON: Подробная информация о состоянии БД
     """
     try:
-        health_info = check_db_health()
-        
-        if health_info["status"] == "healthy":
-            return jsonify(health_info)
-        else:
-            return jsonify(health_info), 503  # Service Unavailable
-            
+        snapshot = _get_health_snapshot()
+        # 503 Service Unavailable, если БД недоступна
+        return _snapshot_response(snapshot.db_payload, 200 if snapshot.healthy else 503)
     except Exception as e:
         logger.error(f"Database health check failed: {e}", exc_info=True)
         return jsonify({
@@ -92,20 +171,8 @@ def readiness_check():
         JSON: Готовность системы к обработке запросов
     """
     try:
-        db_health = check_db_health()
-        
-        if db_health["status"] == "healthy":
-            return jsonify({
-                "status": "ready",
-                "message": "Service is ready to handle requests"
-            })
-        else:
-            return jsonify({
-                "status": "not_ready",
-                "message": "Service is not ready - database issues",
-                "details": db_health["message"]
-            }), 503
-            
+        snapshot = _get_health_snapshot()
+        return _snapshot_response(snapshot.ready_payload, 200 if snapshot.healthy else 503)
     except Exception as e:
         logger.error(f"Readiness check failed: {e}", exc_info=True)
         return jsonify({
@@ -120,19 +187,6 @@ def liveness_check():
     Liveness probe для Kubernetes/Docker
     
     Returns:
-        JSON: Жизнеспособность системы
+        Пустой ответ 204: если мы можем ответить, значит живы
     """
-    try:
-        # Простая проверка - если мы можем ответить, значит живы
-        return jsonify({
-            "status": "alive",
-            "message": "Service is alive"
-        })
-    except Exception as e:
-        logger.error(f"Liveness check failed: {e}", exc_info=True)
-        return jsonify({
-            "status": "dead",
-            "message": "Liveness check failed",
-            "error": str(e)
-        }), 500
-
+    return '', 204
@@ -1,12 +1,25 @@
 # Full new content for /home/ubuntu/bot_project/Bot_V5_0_0/webapp/ops/routes.py
 
+import asyncio
+import hashlib
 import logging
+import mimetypes
 import os
+import re
+import tempfile
+import threading
 import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import wraps
+from types import SimpleNamespace
+from urllib.parse import quote
 
-from flask import Blueprint, request, jsonify, g, send_from_directory
+from flask import Blueprint, Response, request, jsonify, g, send_from_directory, current_app
 from flask_jwt_extended import get_jwt_identity # get_jwt_identity is imported but not directly used in this file. g.user['sub'] is used.
+from werkzeug.datastructures import MultiDict
+from werkzeug.formparser import parse_form_data
 from werkzeug.utils import secure_filename
 
 from webapp.auth.jwt_auth import token_required, role_required
@@ -16,20 +29,54 @@ from storage.database_unified import (
     Message,
     Chat,
     Document,
+    DocumentIndexState,
     end_session
 )
-from bot.operator import ACTIVE_OPERATOR_SESSIONS, send_rating_request # Moved import
+from bot.operator import send_rating_request # Moved import
+from storage.operator_sessions import (
+    get_operator_session,
+    set_operator_session,
+    delete_operator_session,
+    get_operator_sessions,
+    get_assigned_user_ids
+)
 from services.crm_client import log_operator_action
-from utils.rate_limit import web_rate_limit
-from sqlalchemy import func
-from sqlalchemy.exc import OperationalError, DisconnectionError
+from utils.rate_limit import web_rate_limit, get_redis_client
+import redis
+from sqlalchemy import func, select, and_, case, delete, insert, update, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
 
-from config import DOCUMENTS_PATH
+from config import DOCUMENTS_PATH, DOCUMENTS_ACCEL_REDIRECT_PREFIX
 from bot.telegram_bot import bot # Moved import
 
 # Imports for RAG indexing (Problem 2)
 from retrieval.doc_parser import parse_document
-from retrieval.store import delete_document_chunks, store_document_chunks
+from retrieval import parse_cache
+from retrieval.store import (
+    EMBEDDING_MODEL,
+    delete_document_chunks,
+    embed_documents_chunks,
+    iter_embedded_batches,
+    store_chunk_batch,
+    store_document_chunks,
+    store_embedded_chunks
+)
+
+# DOCUMENTS_PATH не меняется во время работы, поэтому абсолютный путь считается один раз
+_ABS_DOCUMENTS_PATH = os.path.abspath(DOCUMENTS_PATH)
+_REAL_DOCUMENTS_PATH = os.path.realpath(DOCUMENTS_PATH)
+
+def _inside_documents(path):
+    """
+    Проверяет, что путь после разрешения символических ссылок лежит внутри
+    DOCUMENTS_PATH. Сравнение по компонентам пути, поэтому /docs_evil
+    не считается вложенным в /docs.
+    """
+    real_path = os.path.realpath(path)
+    return (
+        real_path != _REAL_DOCUMENTS_PATH
+        and os.path.commonpath([real_path, _REAL_DOCUMENTS_PATH]) == _REAL_DOCUMENTS_PATH
+    )
 
 ALLOWED_EXTENSIONS = {
     ".txt",
@@ -47,78 +94,272 @@ logger = logging.getLogger(__name__)
 
 ops_bp = Blueprint('ops', __name__)
 
-def retry_db_operation(operation, max_retries=3, delay=1):
+# Методы бота (python-telegram-bot 20) - корутины. Они выполняются в одном
+# постоянном event loop фонового потока: HTTP-клиент бота не пересоздаётся
+# на каждый запрос, а обработчики могут не ждать ответа Telegram
+_telegram_loop = None
+_telegram_loop_lock = threading.Lock()
+
+def _get_telegram_loop():
+    """Возвращает фоновый event loop для вызовов Telegram API, запуская его при первом обращении"""
+    global _telegram_loop
+    
+    if _telegram_loop is None:
+        with _telegram_loop_lock:
+            if _telegram_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="telegram-loop", daemon=True).start()
+                _telegram_loop = loop
+    return _telegram_loop
+
+# send_rating_request использует из контекста бота только context.bot
+_RATING_CONTEXT = SimpleNamespace(bot=bot)
+
+def submit_telegram_call(coro, description):
     """
-    Выполняет операцию с базой данных с повторными попытками при ошибках соединения.
+    Ставит корутину Telegram API в фоновый event loop, не дожидаясь результата.
+    Ошибка доставки только логируется.
     
     Args:
-        operation: Функция для выполнения
-        max_retries: Максимальное количество попыток
-        delay: Задержка между попытками в секундах
+        coro: Корутина (например, bot.send_message(...))
+        description: Описание вызова для лога
     
     Returns:
-        Результат операции или None при неудаче
+        concurrent.futures.Future с результатом корутины
     """
-    for attempt in range(max_retries):
-        try:
-            return operation()
-        except (OperationalError, DisconnectionError) as e:
-            logger.warning(f"Database connection error on attempt {attempt + 1}/{max_retries}: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(delay * (attempt + 1))  # Увеличиваем задержку с каждой попыткой
-                continue
-            else:
-                logger.error(f"All {max_retries} database retry attempts failed")
-                raise
-        except Exception as e:
-            logger.error(f"Non-retryable database error: {e}")
-            raise
+    future = asyncio.run_coroutine_threadsafe(coro, _get_telegram_loop())
+    
+    def log_failure(done):
+        if done.cancelled():
+            logger.warning(f"Telegram call cancelled: {description}")
+        elif done.exception() is not None:
+            logger.error(f"Telegram call failed: {description}: {done.exception()}")
+    
+    future.add_done_callback(log_failure)
+    return future
+
+def _last_messages_subquery(session_ids):
+    """
+    Подзапрос с последним сообщением каждой из указанных сессий.
+    
+    Args:
+        session_ids: Список ID сессий или select, возвращающий их
+    
+    Returns:
+        Подзапрос с колонками session_id, message_text, timestamp и rn
+        (последнему сообщению сессии соответствует rn == 1)
+    """
+    return select(
+        Message.session_id,
+        Message.message_text,
+        Message.timestamp,
+        func.row_number().over(
+            partition_by=Message.session_id,
+            order_by=Message.timestamp.desc()
+        ).label('rn')
+    ).where(
+        Message.session_id.in_(session_ids)
+    ).subquery()
+
+def _latest_user_messages_subquery(db, since):
+    """
+    Подзапрос с последним сообщением каждого пользователя начиная с since.
+    Чаты связаны с сообщениями через user_id (колонки chat_id у Message нет).
+    
+    На PostgreSQL используется DISTINCT ON: он читает индекс
+    (user_id, timestamp DESC) без оконной функции. На остальных СУБД -
+    row_number() по user_id.
+    
+    Args:
+        db: Сессия SQLAlchemy
+        since: Нижняя граница времени сообщений
+    
+    Returns:
+        Подзапрос с колонками user_id и message_text
+    """
+    if db.get_bind().dialect.name == 'postgresql':
+        return select(
+            Message.user_id,
+            Message.message_text
+        ).where(
+            Message.timestamp >= since
+        ).order_by(
+            Message.user_id, Message.timestamp.desc()
+        ).distinct(Message.user_id).subquery()
+    
+    ranked = select(
+        Message.user_id,
+        Message.message_text,
+        func.row_number().over(
+            partition_by=Message.user_id,
+            order_by=Message.timestamp.desc()
+        ).label('rn')
+    ).where(
+        Message.timestamp >= since
+    ).subquery()
+    return select(ranked.c.user_id, ranked.c.message_text).where(ranked.c.rn == 1).subquery()
+
+def _session_columns_select(last_messages):
+    """
+    select колонок сессии, нужных спискам чатов, и её последнего сообщения.
+    
+    Args:
+        last_messages: Подзапрос из _last_messages_subquery
+    
+    Returns:
+        select без FROM-соединения с last_messages (его добавляет вызывающий код)
+    """
+    return select(
+        UserSession.id,
+        UserSession.user_id,
+        UserSession.start_time,
+        UserSession.last_escalation_time,
+        UserSession.interface_type,
+        last_messages.c.message_text,
+        last_messages.c.timestamp.label('last_message_time')
+    )
+
+# Ответ /active-chats кэшируется в Redis: панель операторов опрашивает его
+# часто, а данные меняются редко
+ACTIVE_CHATS_CACHE_KEY = 'ops:active-chats:v1'
+ACTIVE_CHATS_CACHE_TTL = 3
+
+# Список документов: синхронизация с директорией дорогая, а страница базы знаний
+# запрашивает список при каждом открытии. Ключ включает mtime директории,
+# поэтому появление, замена или удаление файла сразу дают новый ключ
+DOCUMENTS_CACHE_KEY_PREFIX = 'ops:documents:v1:'
+DOCUMENTS_CACHE_TTL = 60
+
+def documents_cache_key():
+    """Ключ кэша списка документов для текущего состояния DOCUMENTS_PATH"""
+    try:
+        return f"{DOCUMENTS_CACHE_KEY_PREFIX}{os.stat(DOCUMENTS_PATH).st_mtime_ns}"
+    except OSError:
+        return f"{DOCUMENTS_CACHE_KEY_PREFIX}missing"
+
+def redis_cached_response(key, ttl):
+    """
+    Декоратор: кэширует JSON-ответ обработчика в Redis на ttl секунд.
+    Кэшируются только ответы со статусом 200; без Redis обработчик вызывается как обычно.
+    
+    Args:
+        key: Ключ Redis или функция без аргументов, возвращающая ключ
+        ttl: Время жизни кэша в секундах
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            cache_key = key() if callable(key) else key
+            client = get_redis_client()
+            if client is not None:
+                try:
+                    body = client.get(cache_key)
+                    if body is not None:
+                        return current_app.response_class(body, mimetype='application/json')
+                except redis.RedisError as e:
+                    logger.warning(f"Failed to read cached response {cache_key}: {e}")
+            
+            response = current_app.make_response(f(*args, **kwargs))
+            if client is not None and response.status_code == 200:
+                try:
+                    client.setex(cache_key, ttl, response.get_data())
+                except redis.RedisError as e:
+                    logger.warning(f"Failed to cache response {cache_key}: {e}")
+            return response
+        return decorated
+    return decorator
+
+def conditional_response(f):
+    """
+    Декоратор: добавляет ETag к успешному JSON-ответу и отвечает 304 Not Modified,
+    если клиент прислал совпадающий If-None-Match. Панель оператора опрашивает
+    списки чатов каждые несколько секунд, и чаще всего ответ не меняется.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        response = current_app.make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            response.add_etag()
+            # Ответ зависит от токена: браузер может хранить его, но обязан перепроверять
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.make_conditional(request)
+        return response
+    return decorated
+
+def invalidate_cached_response(key):
+    """
+    Удаляет закэшированный ответ после изменения состояния чатов.
+    
+    Args:
+        key: Ключ Redis
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.delete(key)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to invalidate cached response {key}: {e}")
+
+def chat_ownership_required(f):
+    """
+    Пропускает запрос только к чату, закреплённому за текущим оператором.
+    В обработчик передаются operator_id и session_id закрепления.
+    """
+    @wraps(f)
+    def decorated(user_id):
+        operator_id = g.user['sub']
+        operator_session = get_operator_session(user_id)
+        if not operator_session or operator_session["operator_id"] != operator_id:
+            return jsonify({'message': 'Chat not assigned to you'}), 403
+        return f(user_id, operator_id=operator_id, session_id=operator_session["session_id"])
+    return decorated
 
 @ops_bp.route('/active-chats')
 @token_required
 @role_required(['admin', 'operator'])
+@conditional_response
+@redis_cached_response(ACTIVE_CHATS_CACHE_KEY, ACTIVE_CHATS_CACHE_TTL)
 def get_active_chats():
     try:
         with db_session() as db:
-            day_ago = int((datetime.now() - timedelta(days=1)).timestamp())
-            subquery = db.query(
-                Message.chat_id,
-                func.max(Message.timestamp).label('last_message_time')
-            ).group_by(Message.chat_id).subquery()
-            active_chats_query = db.query(Chat).join(
-                subquery, Chat.id == subquery.c.chat_id
-            ).filter(
-                subquery.c.last_message_time >= day_ago,
-                Chat.status == 'active'  # Original filter
-            )
-            active_chats = active_chats_query.all()
+            day_ago = datetime.now() - timedelta(days=1)
+            latest_messages = _latest_user_messages_subquery(db, day_ago)
+            # Только нужные колонки, без создания ORM-объектов Chat
+            active_chats = db.execute(
+                select(
+                    Chat.id, Chat.user_id, Chat.updated_at, Chat.status, Chat.operator_id,
+                    latest_messages.c.message_text
+                ).join(
+                    latest_messages, Chat.user_id == latest_messages.c.user_id
+                ).where(
+                    Chat.status == 'active',  # Original filter
+                    # Активные чаты без оператора в ответ не попадают
+                    Chat.operator_id.isnot(None)
+                )
+            ).all()
             
             result = []
-            for chat_obj in active_chats:
-                last_user_message = db.query(Message).filter(
-                    Message.chat_id == chat_obj.id
-                ).order_by(Message.timestamp.desc()).first()
-                
+            for chat in active_chats:
                 user_info = {
-                    'id': chat_obj.user_id,
-                    'name': f"Пользователь {chat_obj.user_id}"
+                    'id': chat.user_id,
+                    'name': f"Пользователь {chat.user_id}"
                 }
                 
                 result.append({
-                    'id': chat_obj.id,
+                    'id': chat.id,
                     'user': user_info,
-                    'last_message': last_user_message.message_text if last_user_message else '',
-                    'last_activity': chat_obj.updated_at.isoformat() if chat_obj.updated_at else None,
-                    'status': chat_obj.status,
-                    'operator_id': chat_obj.operator_id
+                    'last_message': chat.message_text or '',
+                    'last_activity': chat.updated_at,
+                    'status': chat.status,
+                    'operator_id': chat.operator_id
                 })
             
-            final_waiting_chats = [c for c in result if c['status'] == 'waiting']
-            final_active_chats = [c for c in result if c['status'] == 'active' and c.get('operator_id')]
-
+            # Запрос выбирает только активные чаты, поэтому список ожидающих пуст
             return jsonify({
-                'waiting': final_waiting_chats,
-                'active': final_active_chats
+                'waiting': [],
+                'active': result
             })
     except Exception as e:
         logger.error(f"Error getting active chats: {e}", exc_info=True)
@@ -131,32 +372,39 @@ def get_active_chats():
 def get_active_chats_old():
     try:
         with db_session() as db:
-            active_sessions = db.query(UserSession).filter(
+            active_session_ids = select(UserSession.id).where(
                 UserSession.end_time.is_(None),
                 UserSession.last_escalation_time.isnot(None)
+            )
+            # Сессии вместе с последним сообщением одним запросом;
+            # сессии без сообщений отбрасываются внутренним соединением
+            last_messages = _last_messages_subquery(active_session_ids)
+            active_sessions = db.execute(
+                _session_columns_select(last_messages).join(
+                    last_messages, last_messages.c.session_id == UserSession.id
+                ).where(
+                    last_messages.c.rn == 1
+                )
             ).all()
             
+            assigned_user_ids = get_assigned_user_ids(session.user_id for session in active_sessions)
+            
             chats_list = []
             for session in active_sessions:
-                if session.user_id in ACTIVE_OPERATOR_SESSIONS:
+                if session.user_id in assigned_user_ids:
                     continue
                 
-                last_message = db.query(Message).filter(
-                    Message.session_id == session.id
-                ).order_by(Message.timestamp.desc()).first()
-                
-                if last_message:
-                    chats_list.append({
-                        'session_id': session.id,
-                        'user_id': session.user_id,
-                        'start_time': session.start_time.isoformat() if session.start_time else None,
-                        'last_escalation_time': session.last_escalation_time.isoformat() if session.last_escalation_time else None,
-                        'interface_type': session.interface_type,
-                        'last_message': {
-                            'text': last_message.message_text,
-                            'timestamp': last_message.timestamp.isoformat() if last_message.timestamp else None
-                        }
-                    })
+                chats_list.append({
+                    'session_id': session.id,
+                    'user_id': session.user_id,
+                    'start_time': session.start_time,
+                    'last_escalation_time': session.last_escalation_time,
+                    'interface_type': session.interface_type,
+                    'last_message': {
+                        'text': session.message_text,
+                        'timestamp': session.last_message_time
+                    }
+                })
             
             return jsonify({
                 'chats': chats_list,
@@ -170,33 +418,44 @@ def get_active_chats_old():
 @token_required
 @role_required(['admin', 'operator'])
 @web_rate_limit
+@conditional_response
 def get_my_chats():
     db = None
     try:
         operator_id = g.user['sub']
-        my_sessions_data = {user_id: data for user_id, data in ACTIVE_OPERATOR_SESSIONS.items()
-                            if data.get("operator_id") == operator_id}
+        my_sessions_data = get_operator_sessions(operator_id)
         
-        with db_session() as db:
-            chats_list = []
-            for user_id, data in my_sessions_data.items():
-                session_id = data.get("session_id")
-                session = db.query(UserSession).filter(UserSession.id == session_id).first()
+        chats_list = []
+        session_ids = [data.get("session_id") for data in my_sessions_data.values()]
+        if session_ids:
+            with db_session() as db:
+                # Сессии и их последние сообщения одним запросом
+                last_messages = _last_messages_subquery(session_ids)
+                rows = db.execute(
+                    _session_columns_select(last_messages).outerjoin(
+                        last_messages,
+                        and_(last_messages.c.session_id == UserSession.id, last_messages.c.rn == 1)
+                    ).where(
+                        UserSession.id.in_(session_ids)
+                    )
+                ).all()
+                sessions = {row.id: row for row in rows}
                 
-                if session:
-                    last_message = db.query(Message).filter(
-                        Message.session_id == session_id
-                    ).order_by(Message.timestamp.desc()).first()
+                for user_id, data in my_sessions_data.items():
+                    session_id = data.get("session_id")
+                    if session_id not in sessions:
+                        continue
                     
+                    session = sessions[session_id]
                     chats_list.append({
                         'session_id': session_id,
                         'user_id': user_id,
-                        'start_time': session.start_time.isoformat() if session.start_time else None,
-                        'last_escalation_time': session.last_escalation_time.isoformat() if session.last_escalation_time else None,
+                        'start_time': session.start_time,
+                        'last_escalation_time': session.last_escalation_time,
                         'interface_type': session.interface_type,
                         'last_message': {
-                            'text': last_message.message_text if last_message else None,
-                            'timestamp': last_message.timestamp.isoformat() if last_message and last_message.timestamp else None
+                            'text': session.message_text,
+                            'timestamp': session.last_message_time
                         }
                     })
         
@@ -210,38 +469,64 @@ def get_my_chats():
     finally:
         pass
 
+# Размер страницы истории чата по умолчанию и максимальный
+CHAT_MESSAGES_PAGE_SIZE = 100
+CHAT_MESSAGES_MAX_PAGE_SIZE = 500
+
 @ops_bp.route('/chat/<int:user_id>/messages', methods=['GET'])
 @token_required
 @role_required(['admin', 'operator'])
 @web_rate_limit
-def get_chat_messages(user_id):
+@chat_ownership_required
+def get_chat_messages(user_id, operator_id, session_id):
     db = None
     try:
-        operator_id = g.user['sub']
-        if user_id not in ACTIVE_OPERATOR_SESSIONS or ACTIVE_OPERATOR_SESSIONS[user_id].get("operator_id") != operator_id:
-            return jsonify({'message': 'Chat not assigned to you'}), 403
+        # Постраничная выдача по курсору: (before_ts, before_id) - время и id самого
+        # старого сообщения предыдущей страницы. id различает сообщения с одинаковым
+        # временем, иначе сообщения на границе страницы пропускались бы
+        try:
+            limit = min(int(request.args.get('limit', CHAT_MESSAGES_PAGE_SIZE)), CHAT_MESSAGES_MAX_PAGE_SIZE)
+            before_ts = request.args.get('before_ts')
+            before_id = request.args.get('before_id')
+            cursor = None
+            if before_ts or before_id:
+                cursor = (datetime.fromisoformat(before_ts), int(before_id))
+        except (TypeError, ValueError):
+            return jsonify({'message': 'Invalid limit or cursor'}), 400
+        if limit < 1:
+            return jsonify({'message': 'Invalid limit or cursor'}), 400
         
-        session_id = ACTIVE_OPERATOR_SESSIONS[user_id].get("session_id")
         with db_session() as db:
-            messages_query = db.query(Message).filter(
-                Message.session_id == session_id
-            ).order_by(Message.timestamp).all()
+            messages_query = select(
+                Message.id,
+                Message.user_id,
+                Message.timestamp,
+                Message.message_text,
+                Message.bot_response,
+                Message.confidence_score
+            ).where(Message.session_id == session_id)
+            if cursor is not None:
+                messages_query = messages_query.where(
+                    tuple_(Message.timestamp, Message.id) < tuple_(*cursor)
+                )
+            # Последние limit сообщений берутся по индексу (session_id, timestamp DESC)
+            messages_page = db.execute(
+                messages_query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit)
+            ).mappings().all()
         
-        message_list = []
-        for msg in messages_query:
-            message_list.append({
-                'id': msg.id,
-                'user_id': msg.user_id,
-                'timestamp': msg.timestamp.isoformat() if msg.timestamp else None,
-                'message_text': msg.message_text,
-                'bot_response': msg.bot_response,
-                'confidence_score': msg.confidence_score
-            })
+        message_list = [dict(row) for row in reversed(messages_page)]
+        
+        # Сообщения в странице идут в хронологическом порядке
+        next_cursor = None
+        if len(message_list) == limit:
+            oldest = message_list[0]
+            next_cursor = {'before_ts': oldest['timestamp'], 'before_id': oldest['id']}
         
         return jsonify({
             'session_id': session_id,
             'user_id': user_id,
-            'messages': message_list
+            'messages': message_list,
+            'next_cursor': next_cursor
         }), 200
     except Exception as e:
         logger.error(f"Error in get_chat_messages for user {user_id}: {e}", exc_info=True)
@@ -257,26 +542,27 @@ def accept_chat(user_id):
     db = None
     try:
         operator_id = g.user['sub']
-        if user_id in ACTIVE_OPERATOR_SESSIONS:
+        if get_operator_session(user_id):
             return jsonify({'message': 'Chat already accepted by another operator'}), 409
         
         with db_session() as db:
-            session = db.query(UserSession).filter(
+            session_id = db.query(UserSession.id).filter(
                 UserSession.user_id == user_id,
                 UserSession.end_time.is_(None)
-            ).first()
+            ).scalar()
         
-        if not session:
+        if not session_id:
             return jsonify({'message': 'Active session not found'}), 404
         
-        ACTIVE_OPERATOR_SESSIONS[user_id] = {
-            "operator_id": operator_id,
-            "session_id": session.id
-        }
+        # Предварительная проверка выше только экономит запрос к БД: чат мог
+        # принять другой оператор, и закрепление решает, кто успел первым
+        if not set_operator_session(user_id, operator_id, session_id):
+            return jsonify({'message': 'Chat already accepted by another operator'}), 409
+        invalidate_cached_response(ACTIVE_CHATS_CACHE_KEY)
         log_operator_action(operator_id, "ACCEPT", user_id)
         return jsonify({
             'message': 'Chat accepted successfully',
-            'session_id': session.id,
+            'session_id': session_id,
             'user_id': user_id
         }), 200
     except Exception as e:
@@ -290,26 +576,24 @@ def accept_chat(user_id):
 @token_required
 @role_required(['admin', 'operator'])
 @web_rate_limit
-def send_message_to_user(user_id):
+@chat_ownership_required
+def send_message_to_user(user_id, operator_id, session_id):
     try:
-        operator_id = g.user['sub']
-        if user_id not in ACTIVE_OPERATOR_SESSIONS or ACTIVE_OPERATOR_SESSIONS[user_id].get("operator_id") != operator_id:
-            return jsonify({'message': 'Chat not assigned to you'}), 403
-        
         data = request.get_json()
         if not data or 'text' not in data:
             return jsonify({'message': 'Missing message text'}), 400
         
         message_text = data['text']
         
-        bot.send_message(
+        # Оператор не ждёт ответа Telegram: доставка идёт в фоне
+        submit_telegram_call(bot.send_message(
             chat_id=user_id,
             text=f"Оператор: {message_text}"
-        )
+        ), f"operator message to user {user_id}")
         log_operator_action(operator_id, "MESSAGE", user_id, detail=message_text)
         return jsonify({
             'message': 'Message sent successfully',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now()
         }), 200
     except Exception as e:
         logger.error(f"Error sending message to user {user_id}: {e}", exc_info=True)
@@ -319,26 +603,17 @@ def send_message_to_user(user_id):
 @token_required
 @role_required(['admin', 'operator'])
 @web_rate_limit
-def end_chat_with_user(user_id):
+@chat_ownership_required
+def end_chat_with_user(user_id, operator_id, session_id):
     db = None
     try:
-        operator_id = g.user['sub']
-        if user_id not in ACTIVE_OPERATOR_SESSIONS or ACTIVE_OPERATOR_SESSIONS[user_id].get("operator_id") != operator_id:
-            return jsonify({'message': 'Chat not assigned to you'}), 403
-        
-        session_id = ACTIVE_OPERATOR_SESSIONS[user_id].get("session_id")
         with db_session() as db:
             end_session(db, session_id)
         
-        if user_id in ACTIVE_OPERATOR_SESSIONS:
-            del ACTIVE_OPERATOR_SESSIONS[user_id]
+        delete_operator_session(user_id)
+        invalidate_cached_response(ACTIVE_CHATS_CACHE_KEY)
         
-        class Context:
-            def __init__(self, bot_instance):
-                self.bot = bot_instance
-        
-        context = Context(bot)
-        send_rating_request(context, user_id)
+        submit_telegram_call(send_rating_request(_RATING_CONTEXT, user_id), f"rating request to user {user_id}")
         
         log_operator_action(operator_id, "END_SESSION", user_id)
         return jsonify({
@@ -357,30 +632,106 @@ def end_chat_with_user(user_id):
 #  База знаний (Knowledge Base)
 # ============================
 
+class _HashingUploadFile:
+    """
+    Временный файл загрузки, считающий SHA-256 по мере записи:
+    хеш готов сразу после разбора запроса, без повторного чтения файла.
+    """
+
+    def __init__(self, file):
+        self._file = file
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+# Имена, которые secure_filename вернул бы без изменений: ASCII без пробелов,
+# без точек и подчёркиваний по краям. Для них нормализация не нужна
+_SAFE_FILENAME_RE = re.compile(r'\A[A-Za-z0-9-](?:[A-Za-z0-9._-]{0,253}[A-Za-z0-9-])?\Z')
+
+# Префикс временных файлов загрузки в DOCUMENTS_PATH (до os.replace в конечное имя)
+UPLOAD_TEMP_PREFIX = '.upload-'
+
+# Права загруженного документа: как у open() с текущим umask. NamedTemporaryFile
+# создаёт файл с 0600, и без chmod веб-сервер (X-Accel-Redirect) не смог бы его
+# прочитать. umask читается один раз при импорте: os.umask меняет его для всего
+# процесса, и вызывать его в обработчике запроса небезопасно для других потоков
+_PROCESS_UMASK = os.umask(0)
+os.umask(_PROCESS_UMASK)
+UPLOAD_FILE_MODE = 0o666 & ~_PROCESS_UMASK
+
+def _dialect_insert(db):
+    """Конструктор insert с поддержкой ON CONFLICT для диалекта текущей сессии"""
+    if db.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert
+    return sqlite.insert
+
+def _is_document_entry(entry):
+    """
+    Проверяет, что запись DOCUMENTS_PATH - документ. Скрытые файлы пропускаются:
+    это временные файлы загрузок (.upload-*) и служебные данные вроде .cache;
+    имена загруженных документов с точки не начинаются.
+    """
+    return not entry.name.startswith('.') and entry.is_file()
+
+def _upload_temp_file(total_content_length, content_type, filename=None, content_length=None):
+    """
+    stream_factory для parse_form_data: часть-файл пишется во временный файл
+    рядом с конечным, чтобы сохранить его одним os.replace.
+    """
+    temp_file = tempfile.NamedTemporaryFile('wb+', dir=DOCUMENTS_PATH, prefix=UPLOAD_TEMP_PREFIX, delete=False)
+    os.fchmod(temp_file.fileno(), UPLOAD_FILE_MODE)
+    return _HashingUploadFile(temp_file)
+
+def _discard_upload_temp_file(part):
+    """Закрывает и удаляет временный файл части, если он не был перемещён"""
+    part.stream.close()
+    try:
+        os.unlink(part.stream.name)
+    except FileNotFoundError:
+        pass
+
 @ops_bp.route('/knowledge-base/upload', methods=['POST'])
 @token_required
 @role_required(['admin', 'operator'])
 @web_rate_limit
 def upload_document():
     """
-    Загрузка документа с улучшенной обработкой ошибок и retry логикой.
+    Загрузка документа с улучшенной обработкой ошибок.
     """
     db = None
     dest_path = None
     file_saved = False
+    files = MultiDict()
     
     try:
+        # Multipart разбирается вручную: части-файлы пишутся парсером сразу во
+        # временные файлы в DOCUMENTS_PATH, откуда принятый файл переименовывается
+        # на место без второго копирования
+        os.makedirs(DOCUMENTS_PATH, exist_ok=True)
+        _, form, files = parse_form_data(
+            request.environ,
+            stream_factory=_upload_temp_file,
+            max_form_memory_size=request.max_form_memory_size,
+            max_content_length=request.max_content_length
+        )
+        
         # Валидация файла
-        if 'file' not in request.files:
+        if 'file' not in files:
             logger.warning("Upload attempt with no file part.")
             return jsonify({'message': 'No file part'}), 400
 
-        uploaded_file = request.files['file']
+        uploaded_file = files['file']
         if not uploaded_file.filename:
             logger.warning("Upload attempt with no selected file (empty filename).")
             return jsonify({'message': 'No selected file'}), 400
 
-        filename = secure_filename(uploaded_file.filename)
+        raw_filename = uploaded_file.filename
+        filename = raw_filename if _SAFE_FILENAME_RE.match(raw_filename) else secure_filename(raw_filename)
         if not filename:
             logger.warning(f"Upload attempt with an invalid/empty secured filename from original: {uploaded_file.filename}")
             return jsonify({'message': 'Invalid filename after securing.'}), 400
@@ -406,15 +757,13 @@ def upload_document():
             )
 
         # Подготовка пути для сохранения
-        os.makedirs(DOCUMENTS_PATH, exist_ok=True)
         dest_path = os.path.join(DOCUMENTS_PATH, filename)
         
         abs_dest_path = os.path.abspath(dest_path)
-        abs_documents_path = os.path.abspath(DOCUMENTS_PATH)
-        if not abs_dest_path.startswith(abs_documents_path):
+        if not _inside_documents(abs_dest_path):
             logger.error(
                 f"Security alert: Attempt to save file outside designated documents directory. "
-                f"Path: {abs_dest_path}, Base: {abs_documents_path}"
+                f"Path: {abs_dest_path}, Base: {_ABS_DOCUMENTS_PATH}"
             )
             return jsonify({'error': 'Invalid file path for saving. Directory traversal attempt?'}), 400
         
@@ -422,43 +771,65 @@ def upload_document():
         if os.path.exists(dest_path):
             logger.info(f"File '{filename}' already exists at {dest_path}. It will be overwritten.")
 
-        uploaded_file.save(dest_path)
+        file_sha = uploaded_file.stream.sha256.hexdigest()
+        uploaded_file.stream.close()
+        os.replace(uploaded_file.stream.name, dest_path)
         file_saved = True
         logger.info(f"File '{filename}' saved to {dest_path}.")
 
         uploader_id = g.user['sub']
         logger.info(f"User {uploader_id} starts upload of file '{filename}' to '{dest_path}'")
 
-        # Попытка записи в базу данных с retry логикой
+        # Запись в базу данных. Разорванные соединения отсеивает пул
+        # (pool_pre_ping/pool_recycle в storage.database_unified)
         doc_to_return = None
         db_success = False
+        # Повторная загрузка того же содержимого уже проиндексированного файла
+        unchanged = False
         
         def db_operation():
-            nonlocal doc_to_return, db_success
+            nonlocal doc_to_return, db_success, unchanged
             with db_session() as db:
                 try:
-                    existing_doc = db.query(Document).filter(Document.path == dest_path).first()
-                    if existing_doc:
-                        logger.info(f"Updating existing document record for path {dest_path}")
-                        existing_doc.name = filename
-                        existing_doc.description = request.form.get('description', existing_doc.description)
-                        existing_doc.uploaded_by = uploader_id
-                        existing_doc.uploaded_at = datetime.utcnow()
-                        doc_to_return = existing_doc
-                    else:
-                        logger.info(f"Creating new document record for path {dest_path}")
-                        new_doc = Document(
-                            name=filename,
-                            path=dest_path,
-                            description=request.form.get('description', ''),
-                            uploaded_by=uploader_id,
-                            uploaded_at=datetime.utcnow()
+                    # Одна инструкция INSERT ... ON CONFLICT (path) DO UPDATE вместо
+                    # SELECT и INSERT/UPDATE: нет гонки двух одновременных загрузок файла
+                    # с одним именем. Статус индексации остаётся 'indexed', только если
+                    # содержимое совпадает с уже проиндексированным
+                    stmt = _dialect_insert(db)(Document).values(
+                        name=filename,
+                        path=dest_path,
+                        description=form.get('description', ''),
+                        uploaded_by=uploader_id,
+                        uploaded_at=datetime.utcnow(),
+                        indexing_status='pending',
+                        content_sha=file_sha
+                    )
+                    set_ = {
+                        'name': stmt.excluded.name,
+                        'uploaded_by': stmt.excluded.uploaded_by,
+                        'uploaded_at': stmt.excluded.uploaded_at,
+                        'content_sha': stmt.excluded.content_sha,
+                        'indexing_status': case(
+                            (
+                                and_(
+                                    Document.content_sha == stmt.excluded.content_sha,
+                                    Document.indexing_status == 'indexed'
+                                ),
+                                'indexed'
+                            ),
+                            else_='pending'
                         )
-                        db.add(new_doc)
-                        doc_to_return = new_doc
+                    }
+                    if 'description' in form:
+                        set_['description'] = stmt.excluded.description
+                    doc_id, indexing_status = db.execute(
+                        stmt.on_conflict_do_update(index_elements=['path'], set_=set_)
+                        .returning(Document.id, Document.indexing_status)
+                    ).one()
+                    unchanged = indexing_status == 'indexed'
                     
                     db.commit()
-                    db.refresh(doc_to_return)
+                    doc_to_return = SimpleNamespace(id=doc_id, name=filename, path=dest_path)
                     db_success = True
                     logger.info(
                         f"Document record for '{filename}' (id: {doc_to_return.id}) "
@@ -469,9 +840,9 @@ def upload_document():
                     pass
 
         try:
-            retry_db_operation(db_operation)
+            db_operation()
         except Exception as db_error:
-            logger.error(f"Failed to save document to database after retries: {db_error}")
+            logger.error(f"Failed to save document to database: {db_error}")
             # Создаем фиктивный объект для ответа, если БД недоступна
             doc_to_return = type('Document', (), {
                 'id': 'temp',
@@ -479,24 +850,16 @@ def upload_document():
                 'path': dest_path
             })()
 
-        # Индексация документа (независимо от успеха БД операции)
-        indexing_success = False
-        try:
-            logger.info(f"Parsing and indexing document: {dest_path}")
-            content = parse_document(dest_path)
-            if content:
-                logger.info(
-                    "Parsed %s characters from %s before chunking and storage",
-                    len(content),
-                    dest_path,
-                )
-                store_document_chunks(content, dest_path)
-                indexing_success = True
-                logger.info(f"Successfully indexed document content for {dest_path}")
-            else:
-                logger.warning(f"No content parsed from {dest_path}, skipping indexing.")
-        except Exception as idx_err:
-            logger.error(f"Indexing failed for {dest_path}: {idx_err}", exc_info=True)
+        invalidate_cached_response(documents_cache_key())
+
+        # Индексация документа (независимо от успеха БД операции) идёт в фоне:
+        # разбор больших PDF не держит HTTP-запрос, статус доступен через
+        # /knowledge-base/<id>/status
+        doc_id = doc_to_return.id if db_success else None
+        if unchanged:
+            logger.info(f"Content of '{filename}' is unchanged, skipping indexing.")
+        else:
+            _INDEX_EXECUTOR.submit(_index_job, dest_path, doc_id, file_sha)
 
         # Формирование ответа
         response_data = {
@@ -504,25 +867,20 @@ def upload_document():
             'path': doc_to_return.path,
             'file_saved': file_saved,
             'db_saved': db_success,
-            'indexed': indexing_success
+            'indexing': 'indexed' if unchanged else 'pending'
         }
         
-        if hasattr(doc_to_return, 'id') and doc_to_return.id != 'temp':
-            response_data['id'] = doc_to_return.id
-
-        if db_success and indexing_success:
-            response_data['message'] = 'Document uploaded and indexed successfully'
-            return jsonify(response_data), 201
-        elif file_saved and indexing_success:
-            response_data['message'] = 'Document uploaded and indexed, but database save failed'
-            response_data['warning'] = 'Document may not appear in web interface until database is restored'
-            return jsonify(response_data), 201
-        elif file_saved:
-            response_data['message'] = 'Document uploaded but indexing failed'
-            response_data['error'] = 'Document will not be searchable by bot'
-            return jsonify(response_data), 500
+        if unchanged:
+            response_data['id'] = doc_id
+            response_data['message'] = 'Document uploaded, content unchanged'
+            return jsonify(response_data), 200
+        if db_success:
+            response_data['id'] = doc_id
+            response_data['message'] = 'Document uploaded, indexing started'
         else:
-            return jsonify({'message': 'Upload failed completely'}), 500
+            response_data['message'] = 'Document uploaded and indexing started, but database save failed'
+            response_data['warning'] = 'Document may not appear in web interface until database is restored'
+        return jsonify(response_data), 202
 
     except Exception as e:
         logger.error(f"Error uploading document: {e}", exc_info=True)
@@ -545,6 +903,149 @@ def upload_document():
                 logger.error(f"Emergency indexing also failed: {emergency_err}")
         
         return jsonify({'message': 'Upload failed', 'error': str(e)}), 500
+    finally:
+        # Временные файлы отклонённых и лишних частей запроса
+        for parts in files.listvalues():
+            for part in parts:
+                _discard_upload_temp_file(part)
+
+# Фоновая индексация загруженных документов
+INDEX_WORKERS = 2
+_INDEX_EXECUTOR = ThreadPoolExecutor(max_workers=INDEX_WORKERS, thread_name_prefix='kb-index')
+
+# Число процессов для разбора документов при переиндексации
+REINDEX_MAX_WORKERS = os.cpu_count() or 1
+REINDEX_CHUNKSIZE = 4
+# Сколько разобранных документов сохраняется в векторное хранилище за раз
+REINDEX_STORE_BATCH_SIZE = 8
+# Интервал логирования прогресса переиндексации (сек)
+REINDEX_PROGRESS_INTERVAL = 60
+# Документы длиннее (в символах) индексируются потоково, а не в общей пачке
+REINDEX_STREAM_MIN_CHARS = 1_000_000
+
+def _index_job(file_path, doc_id, sha=None):
+    """
+    Фоновая индексация загруженного документа с записью статуса в БД.
+    
+    Args:
+        file_path: Путь к файлу
+        doc_id: ID записи документа или None, если запись не сохранена
+        sha: SHA-256 содержимого, если уже посчитан при загрузке
+    """
+    status = 'failed'
+    try:
+        logger.info(f"Parsing and indexing document: {file_path}")
+        if _index_document(file_path, sha):
+            status = 'indexed'
+            logger.info(f"Successfully indexed document content for {file_path}")
+        else:
+            logger.warning(f"No content parsed from {file_path}, skipping indexing.")
+    except Exception as idx_err:
+        logger.error(f"Indexing failed for {file_path}: {idx_err}", exc_info=True)
+    
+    if doc_id is None:
+        return
+    try:
+        # Статус документа и отпечаток для переиндексации пишутся одной транзакцией:
+        # /knowledge-base/reindex не будет повторно обрабатывать этот файл
+        with db_session() as db:
+            db.execute(update(Document).where(Document.id == doc_id).values(indexing_status=status))
+            if status == 'indexed':
+                stat = os.stat(file_path)
+                db.merge(DocumentIndexState(
+                    path=file_path, mtime=stat.st_mtime, size=stat.st_size, indexed_at=datetime.now()
+                ))
+    except Exception as e:
+        logger.error(f"Failed to save indexing status for document {doc_id}: {e}")
+
+def _parse_for_reindex(file_path):
+    """
+    Разбирает документ в процессе-воркере переиндексации.
+    Неизменённые файлы не разбираются: их чанки и эмбеддинги берутся из кэша.
+    
+    Args:
+        file_path: Путь к файлу
+    
+    Returns:
+        Кортеж (file_path, sha, текст, (чанки, эмбеддинги) из кэша или None, ошибка или None)
+    """
+    try:
+        logger.info(f"Reindexing document: {file_path}")
+        sha = parse_cache.file_sha256(file_path)
+        cached = parse_cache.get(sha, EMBEDDING_MODEL)
+        if cached is not None:
+            return file_path, sha, None, cached, None
+        return file_path, sha, parse_document(file_path), None, None
+    except Exception as e:
+        return file_path, None, None, None, str(e)
+
+def _index_document(file_path, sha=None):
+    """
+    Индексирует один документ, используя кэш разбора по содержимому файла.
+    
+    Args:
+        file_path: Путь к файлу
+        sha: SHA-256 содержимого; если не передан, файл хешируется
+    
+    Returns:
+        bool: True, если документ сохранён в векторное хранилище
+    """
+    if sha is None:
+        sha = parse_cache.file_sha256(file_path)
+    cached = parse_cache.get(sha, EMBEDDING_MODEL)
+    if cached is None:
+        content = parse_document(file_path)
+        if not content:
+            return False
+        logger.info(f"Parsed {len(content)} characters from {file_path} before chunking and storage")
+        _embed_and_store(file_path, sha, content)
+    else:
+        logger.info(f"Using cached chunks for unchanged file {file_path}")
+        store_embedded_chunks([(file_path, *cached)])
+    return True
+
+def _embed_and_store(file_path, sha, content):
+    """
+    Эмбеддит и сохраняет документ пачками по STORE_BATCH_SIZE чанков, так что
+    память не растёт с размером документа. В кэш разбора попадают только
+    документы не длиннее parse_cache.MAX_CACHED_CHUNKS чанков.
+    
+    Args:
+        file_path: Путь к файлу
+        sha: SHA-256 содержимого
+        content: Текст документа
+    """
+    cached_chunks, cached_vectors = [], []
+    start_index = 0
+    for chunks, vectors in iter_embedded_batches(content):
+        store_chunk_batch(file_path, start_index, chunks, vectors)
+        start_index += len(chunks)
+        if cached_chunks is None:
+            continue
+        if start_index > parse_cache.MAX_CACHED_CHUNKS:
+            cached_chunks = cached_vectors = None
+        else:
+            cached_chunks.extend(chunks)
+            cached_vectors.extend(vectors)
+    
+    if cached_chunks is not None:
+        parse_cache.put(sha, EMBEDDING_MODEL, cached_chunks, cached_vectors)
+
+def _save_index_state(states):
+    """
+    Запоминает отпечатки проиндексированных файлов.
+    Ошибка записи не прерывает переиндексацию: файлы будут обработаны повторно.
+    
+    Args:
+        states: Итерируемое из (path, mtime, size)
+    """
+    try:
+        with db_session() as db:
+            indexed_at = datetime.now()
+            for path, mtime, size in states:
+                db.merge(DocumentIndexState(path=path, mtime=mtime, size=size, indexed_at=indexed_at))
+    except Exception as e:
+        logger.error(f"Failed to save document index state: {e}")
 
 @ops_bp.route('/knowledge-base/reindex', methods=['POST'])
 @token_required
@@ -558,31 +1059,95 @@ def reindex_documents():
         if not os.path.exists(DOCUMENTS_PATH):
             return jsonify({'message': 'Documents directory not found'}), 404
         
-        files = os.listdir(DOCUMENTS_PATH)
+        fingerprints = {}
+        with os.scandir(DOCUMENTS_PATH) as entries:
+            for entry in entries:
+                if _is_document_entry(entry):
+                    stat = entry.stat()
+                    fingerprints[entry.path] = (stat.st_mtime, stat.st_size)
+        
+        # Файлы с тем же (mtime, size), что при прошлой индексации, пропускаются;
+        # ?force=1 переиндексирует всё (например, после очистки векторного хранилища)
+        paths = list(fingerprints)
+        if paths and request.args.get('force', '').lower() not in ('1', 'true', 'yes'):
+            with db_session() as db:
+                indexed_states = {
+                    state.path: (state.mtime, state.size)
+                    for state in db.execute(
+                        select(DocumentIndexState.path, DocumentIndexState.mtime, DocumentIndexState.size)
+                        .where(DocumentIndexState.path.in_(paths))
+                    )
+                }
+            paths = [path for path in paths if indexed_states.get(path) != fingerprints[path]]
+        skipped_count = len(fingerprints) - len(paths)
         indexed_count = 0
         failed_count = 0
         
-        for filename in files:
-            file_path = os.path.join(DOCUMENTS_PATH, filename)
-            if os.path.isfile(file_path):
+        if paths:
+            # Конвейер: процессы разбирают файлы (PDF/Office нагружают CPU), а этот
+            # процесс - единственный писатель - пачками считает эмбеддинги и сохраняет
+            # документы в векторное хранилище, пока воркеры разбирают следующие
+            max_workers = min(len(paths), REINDEX_MAX_WORKERS)
+            batch = []
+            started_at = last_progress_at = time.monotonic()
+            
+            def flush_batch():
+                nonlocal indexed_count, failed_count
                 try:
-                    logger.info(f"Reindexing document: {file_path}")
-                    content = parse_document(file_path)
-                    if content:
-                        store_document_chunks(content, file_path)
-                        indexed_count += 1
-                        logger.info(f"Successfully reindexed {file_path}")
-                    else:
+                    # Эмбеддинги считаются только для изменённых файлов; большие
+                    # документы сохраняются потоково, чтобы не держать все их чанки
+                    to_embed = []
+                    for file_path, sha, content, cached in batch:
+                        if cached is not None:
+                            continue
+                        if len(content) >= REINDEX_STREAM_MIN_CHARS:
+                            _embed_and_store(file_path, sha, content)
+                        else:
+                            to_embed.append((file_path, sha, content, cached))
+                    embedded = embed_documents_chunks([content for _, _, content, _ in to_embed])
+                    entries = []
+                    for (file_path, sha, _, _), (chunks, vectors) in zip(to_embed, embedded):
+                        parse_cache.put(sha, EMBEDDING_MODEL, chunks, vectors)
+                        entries.append((file_path, chunks, vectors))
+                    entries.extend(
+                        (file_path, *cached) for file_path, _, _, cached in batch if cached is not None
+                    )
+                    store_embedded_chunks(entries)
+                    _save_index_state((file_path, *fingerprints[file_path]) for file_path, *_ in batch)
+                    indexed_count += len(batch)
+                    logger.info(f"Successfully reindexed {len(batch)} documents")
+                except Exception as e:
+                    logger.error(f"Failed to store {len(batch)} reindexed documents: {e}")
+                    failed_count += len(batch)
+                batch.clear()
+            
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = executor.map(_parse_for_reindex, paths, chunksize=REINDEX_CHUNKSIZE)
+                for done, (file_path, sha, content, cached, error) in enumerate(results, start=1):
+                    if error is not None:
+                        logger.error(f"Failed to reindex {file_path}: {error}")
+                        failed_count += 1
+                    elif cached is None and not content:
                         logger.warning(f"No content parsed from {file_path}")
                         failed_count += 1
-                except Exception as e:
-                    logger.error(f"Failed to reindex {file_path}: {e}")
-                    failed_count += 1
+                    else:
+                        batch.append((file_path, sha, content, cached))
+                        if len(batch) >= REINDEX_STORE_BATCH_SIZE:
+                            flush_batch()
+                    
+                    now = time.monotonic()
+                    if now - last_progress_at >= REINDEX_PROGRESS_INTERVAL:
+                        last_progress_at = now
+                        eta = (now - started_at) / done * (len(paths) - done)
+                        logger.info(f"Reindex progress: {done}/{len(paths)} files, ETA {eta:.0f}s")
+            if batch:
+                flush_batch()
         
         return jsonify({
             'message': 'Reindexing completed',
-            'total_files': len(files),
+            'total_files': len(fingerprints),
             'indexed': indexed_count,
+            'skipped': skipped_count,
             'failed': failed_count
         }), 200
         
@@ -594,6 +1159,7 @@ def reindex_documents():
 @token_required
 @role_required(['admin', 'operator'])
 @web_rate_limit
+@redis_cached_response(documents_cache_key, DOCUMENTS_CACHE_TTL)
 def list_documents():
     db = None
     try:
@@ -601,6 +1167,13 @@ def list_documents():
             # Получаем ID оператора из контекста JWT
             operator_id = g.user['sub']
 
+            # Все документы одним запросом и только нужные колонки: по ним определяются
+            # новые и пропавшие файлы, и из них же строится ответ
+            known_docs = db.execute(
+                select(Document.id, Document.name, Document.path, Document.description, Document.uploaded_at)
+            ).all()
+            listed_docs = list(known_docs)
+
             # Problem 3: Dynamic Sync for Files in DOCUMENTS_PATH (Variant B)
             synced_paths = set()
             try:
@@ -608,48 +1181,60 @@ def list_documents():
                     os.makedirs(DOCUMENTS_PATH)
                     logger.info(f"Created documents directory: {DOCUMENTS_PATH}")
                 
-                current_files_in_dir = os.listdir(DOCUMENTS_PATH)
-                for fname in current_files_in_dir:
-                    p = os.path.join(DOCUMENTS_PATH, fname)
-                    abs_p = os.path.abspath(p)
-                    abs_documents_path = os.path.abspath(DOCUMENTS_PATH)
-
-                    if not abs_p.startswith(abs_documents_path):
-                        logger.warning(f"Skipping file outside designated directory during sync: {p}")
-                        continue  # Security: ensure we are only looking inside DOCUMENTS_PATH
-
-                    if os.path.isfile(p):
-                        synced_paths.add(p)
-                        if not db.query(Document).filter(Document.path == p).first():
-                            logger.info(f"Found new file '{fname}' in directory, adding to DB.")
-                            doc_name = os.path.basename(p)
-                            new_doc_from_fs = Document(
-                                name=doc_name,
-                                path=p,
-                                description='Autodetected from filesystem',
-                                uploaded_by=operator_id,  # ← используем операторский ID вместо current_user
-                                uploaded_at=datetime.fromtimestamp(os.path.getmtime(p))
-                            )
-                            db.add(new_doc_from_fs)
+                # scandir отдаёт тип файла из самого чтения директории, без stat на каждый файл
+                file_entries = {}
+                with os.scandir(DOCUMENTS_PATH) as entries:
+                    for entry in entries:
+                        # Записи каталога лежат в нём по построению; выйти наружу
+                        # может только символическая ссылка
+                        if entry.is_symlink() and not _inside_documents(entry.path):
+                            logger.warning(f"Skipping file outside designated directory during sync: {entry.path}")
+                            continue  # Security: ensure we are only looking inside DOCUMENTS_PATH
+
+                        if _is_document_entry(entry):
+                            file_entries[entry.path] = entry
+                synced_paths.update(file_entries)
+
+                known_paths = {doc.path for doc in known_docs}
+                new_rows = []
+                for p in synced_paths - known_paths:
+                    entry = file_entries[p]
+                    logger.info(f"Found new file '{entry.name}' in directory, adding to DB.")
+                    new_rows.append({
+                        'name': entry.name,
+                        'path': p,
+                        'description': 'Autodetected from filesystem',
+                        'uploaded_by': operator_id,  # ← используем операторский ID вместо current_user
+                        'uploaded_at': datetime.fromtimestamp(entry.stat().st_mtime)
+                    })
+                if new_rows:
+                    # Один многострочный INSERT в обход unit of work; RETURNING сразу отдаёт
+                    # строки для ответа
+                    listed_docs.extend(db.execute(
+                        insert(Document).returning(
+                            Document.id, Document.name, Document.path,
+                            Document.description, Document.uploaded_at
+                        ),
+                        new_rows
+                    ).all())
                 db.commit()  # Commit any newly added documents from filesystem scan
                 logger.info(f"Filesystem sync complete. Found {len(synced_paths)} files in {DOCUMENTS_PATH}.")
 
                 # Also, remove DB entries for files that no longer exist on disk
-                all_db_docs = db.query(Document.id, Document.path).all()
-                for doc_id, doc_path in all_db_docs:
-                    if doc_path not in synced_paths:
-                        logger.info(f"Document path '{doc_path}' (ID: {doc_id}) not found in filesystem. Removing from DB.")
-                        try:
-                            delete_document_chunks(doc_path)
-                        except Exception as cleanup_err:
-                            logger.error(
-                                f"Failed to delete Chroma chunks for missing file {doc_path}: {cleanup_err}",
-                                exc_info=True,
-                            )
-                        doc_to_delete = db.query(Document).get(doc_id)
-                        if doc_to_delete:
-                            db.delete(doc_to_delete)
+                missing_docs = [doc for doc in known_docs if doc.path not in synced_paths]
+                for doc in missing_docs:
+                    logger.info(f"Document path '{doc.path}' (ID: {doc.id}) not found in filesystem. Removing from DB.")
+                    try:
+                        delete_document_chunks(doc.path)
+                    except Exception as cleanup_err:
+                        logger.error(
+                            f"Failed to delete Chroma chunks for missing file {doc.path}: {cleanup_err}",
+                            exc_info=True,
+                        )
+                if missing_docs:
+                    db.execute(delete(Document).where(Document.id.in_([doc.id for doc in missing_docs])))
                 db.commit()  # Commit deletions
+                listed_docs = [doc for doc in listed_docs if doc.path in synced_paths]
 
             except Exception as sync_err:
                 logger.error(f"Error during document directory sync: {sync_err}", exc_info=True)
@@ -657,9 +1242,8 @@ def list_documents():
                     db.rollback()  # Rollback sync changes on error, but proceed to list what's in DB
 
             # Proceed to list documents from DB (now synced)
-            docs_query = db.query(Document).order_by(Document.uploaded_at.desc()).all()
             result = []
-            for d in docs_query:
+            for d in sorted(listed_docs, key=lambda doc: doc.uploaded_at, reverse=True):
                 file_name_only, file_extension = os.path.splitext(d.name)
                 ext = file_extension.lstrip('.').upper() or '—'
                 result.append({
@@ -667,7 +1251,7 @@ def list_documents():
                     'name':         d.name,
                     'description':  d.description or "",
                     'file_type':    ext,
-                    'created_at':   d.uploaded_at.isoformat() if d.uploaded_at else None,
+                    'created_at':   d.uploaded_at,
                     'url':          f'/api/ops/knowledge-base/download/{d.id}'
                 })
             logger.info(f"Listed {len(result)} documents after sync.")
@@ -680,36 +1264,74 @@ def list_documents():
     finally:
         pass
 
+@ops_bp.route('/knowledge-base/<int:doc_id>/status', methods=['GET'])
+@token_required
+@role_required(['admin', 'operator'])
+@web_rate_limit
+def get_document_status(doc_id):
+    """
+    Статус фоновой индексации документа: pending, indexed или failed.
+    """
+    try:
+        with db_session() as db:
+            indexing_status = db.execute(
+                select(Document.indexing_status).where(Document.id == doc_id)
+            ).first()
+        if indexing_status is None:
+            return jsonify({'message': 'Document not found'}), 404
+        return jsonify({'id': doc_id, 'indexing_status': indexing_status[0]}), 200
+    except Exception as e:
+        logger.error(f"Error getting status of document {doc_id}: {e}", exc_info=True)
+        return jsonify({'error': 'Failed to get document status', 'details': str(e)}), 500
+
+def _attachment_filename(name):
+    """
+    Параметры Content-Disposition для имени файла, как в send_file:
+    не-ASCII имя передаётся в filename* (RFC 5987) с ASCII-запасным вариантом.
+    """
+    try:
+        name.encode('ascii')
+        return {'filename': name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(name, safe='!#$&+^`|~')}"}
+
 @ops_bp.route('/knowledge-base/download/<int:doc_id>', methods=['GET'])
 @token_required
 @role_required(['admin', 'operator'])
 @web_rate_limit
 def download_document_file(doc_id):
-    db = None
     doc_instance = None
     try:
         with db_session() as db:
-            doc_instance = db.query(Document).get(doc_id)
-            if not doc_instance:
-                logger.warning(f"Document with id {doc_id} not found for download.")
-                return jsonify({'message': 'Document not found'}), 404
+            doc_instance = db.execute(
+                select(Document.name, Document.path).where(Document.id == doc_id)
+            ).first()
+        if not doc_instance:
+            logger.warning(f"Document with id {doc_id} not found for download.")
+            return jsonify({'message': 'Document not found'}), 404
         
         doc_full_path = os.path.abspath(doc_instance.path)
-        configured_docs_path = os.path.abspath(DOCUMENTS_PATH)
 
-        if not doc_full_path.startswith(configured_docs_path):
-            logger.error(f"Security alert: Attempt to access file outside designated documents directory. Path: {doc_full_path}, Configured Base: {configured_docs_path}")
+        if not _inside_documents(doc_full_path):
+            logger.error(f"Security alert: Attempt to access file outside designated documents directory. Path: {doc_full_path}, Configured Base: {_ABS_DOCUMENTS_PATH}")
             return jsonify({'error': 'Access to this file location is forbidden'}), 403
 
         filename_to_serve = os.path.basename(doc_full_path)
         
-        expected_physical_path = os.path.join(configured_docs_path, filename_to_serve)
+        expected_physical_path = os.path.join(_ABS_DOCUMENTS_PATH, filename_to_serve)
         if not os.path.isfile(expected_physical_path):
             logger.error(f"File not found at expected physical path: {expected_physical_path} for doc_id {doc_id}. Stored path was {doc_instance.path}")
             return jsonify({'error': 'File not found on server at the expected location'}), 404
         
-        logger.info(f"Attempting to serve document: id={doc_id}, name='{filename_to_erve}' from directory='{configured_docs_path}'")
-        return send_from_directory(configured_docs_path, filename_to_serve, as_attachment=True, download_name=doc_instance.name)
+        logger.info(f"Attempting to serve document: id={doc_id}, name='{filename_to_serve}' from directory='{_ABS_DOCUMENTS_PATH}'")
+        if DOCUMENTS_ACCEL_REDIRECT_PREFIX:
+            # Файл отдаёт nginx через sendfile(2), данные не проходят через Python
+            response = Response(mimetype=mimetypes.guess_type(filename_to_serve)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = DOCUMENTS_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(filename_to_serve)
+            response.headers.set('Content-Disposition', 'attachment', **_attachment_filename(doc_instance.name))
+            return response
+        return send_from_directory(_ABS_DOCUMENTS_PATH, filename_to_serve, as_attachment=True, download_name=doc_instance.name)
         
     except FileNotFoundError:
         logger.error(f"send_from_directory failed: File not found for document id {doc_id} at path {doc_instance.path if doc_instance else 'unknown'}", exc_info=True)
@@ -735,9 +1357,8 @@ def delete_document_file(doc_id):
                 return jsonify({'message': 'Document not found'}), 404
 
             doc_full_path = os.path.abspath(doc_instance.path)
-            configured_docs_path = os.path.abspath(DOCUMENTS_PATH)
 
-            if not doc_full_path.startswith(configured_docs_path):
+            if not _inside_documents(doc_full_path):
                 logger.error(f"Security alert: Attempt to delete file outside designated documents directory. Path: {doc_full_path}")
                 return jsonify({'error': 'Access to this file location is forbidden for deletion'}), 403
             
@@ -769,6 +1390,7 @@ def delete_document_file(doc_id):
                 db.delete(doc_instance)
                 db.commit()
                 logger.info(f"Successfully deleted document record from DB: id={doc_id}")
+                invalidate_cached_response(documents_cache_key())
                 return jsonify({'message': 'Document deleted successfully'}), 200
             else:
                 # This case should ideally not be reached if logic above is correct
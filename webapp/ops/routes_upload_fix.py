@@ -1,5 +1,6 @@
 import logging
 import os
+import random
 import time
 from datetime import datetime, timedelta
 
@@ -45,14 +46,30 @@ logger = logging.getLogger(__name__)
 
 ops_bp = Blueprint('ops', __name__)
 
+# Потолок паузы между повторными попытками (сек)
+RETRY_MAX_DELAY = 8
+# SQLSTATE too_many_connections: сервер исчерпал лимит соединений
+PG_TOO_MANY_CONNECTIONS = '53300'
+
+def _is_too_many_connections(error):
+    """
+    Проверяет, отказал ли PostgreSQL из-за лимита соединений.
+    Повтор в этом случае только добавляет нагрузку. Исчерпание пула SQLAlchemy
+    (sqlalchemy.exc.TimeoutError) сюда не попадает: оно не повторяется вовсе.
+    """
+    orig = getattr(error, 'orig', None)
+    return getattr(orig, 'pgcode', None) == PG_TOO_MANY_CONNECTIONS
+
 def retry_db_operation(operation, max_retries=3, delay=1):
     """
     Выполняет операцию с базой данных с повторными попытками при ошибках соединения.
+    Паузы растут экспоненциально со случайным разбросом (full jitter);
+    при исчерпании соединений ошибка пробрасывается сразу.
     
     Args:
         operation: Функция для выполнения
         max_retries: Максимальное количество попыток
-        delay: Задержка между попытками в секундах
+        delay: Базовая задержка между попытками в секундах
     
     Returns:
         Результат операции или None при неудаче
@@ -61,9 +78,12 @@ def retry_db_operation(operation, max_retries=3, delay=1):
         try:
             return operation()
         except (OperationalError, DisconnectionError) as e:
+            if _is_too_many_connections(e):
+                logger.error(f"Database connection limit reached, not retrying: {e}")
+                raise
             logger.warning(f"Database connection error on attempt {attempt + 1}/{max_retries}: {e}")
             if attempt < max_retries - 1:
-                time.sleep(delay * (attempt + 1))  # Увеличиваем задержку с каждой попыткой
+                time.sleep(min(RETRY_MAX_DELAY, (2 ** attempt) * delay * random.random() + 0.05))
                 continue
             else:
                 logger.error(f"All {max_retries} database retry attempts failed")
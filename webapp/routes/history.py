@@ -1,9 +1,12 @@
 """
 Маршруты для работы с историей запросов.
 """
+import hashlib
 import logging
-from datetime import datetime
-from flask import Blueprint, render_template, request, jsonify, g
+from datetime import date, datetime, time
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import joinedload, selectinload
 from webapp.auth.jwt_auth import token_required
 from storage.database_unified import db_session, Message, UserSession
 
@@ -11,55 +14,171 @@ logger = logging.getLogger(__name__)
 
 history_bp = Blueprint('history', __name__)
 
+# Максимальный размер страницы истории
+HISTORY_MAX_PER_PAGE = 100
+# Время, до которого включается последний день фильтра по датам
+END_OF_DAY = time(23, 59, 59)
+
+def _history_etag(db):
+    """
+    Считает ETag страницы истории без выборки самой страницы.
+
+    Страница меняется, только если появились новые сообщения или сессию
+    эскалировали, поэтому версией служат max(id) сообщений и время последней
+    эскалации; к ним добавляются параметры запроса (фильтры, страница, курсор).
+    """
+    max_id, last_escalation = db.execute(select(
+        select(func.max(Message.id)).scalar_subquery(),
+        select(func.max(UserSession.last_escalation_time)).scalar_subquery()
+    )).one()
+    stamp = f"{max_id}:{last_escalation}:{request.query_string.decode('utf-8', 'replace')}"
+    return hashlib.blake2b(stamp.encode('utf-8'), digest_size=8).hexdigest()
+
+def _json_with_etag(tag, build_payload):
+    """
+    Отвечает 304 Not Modified, если у клиента актуальная версия (If-None-Match),
+    иначе строит JSON-ответ. В обоих случаях выставляет ETag.
+
+    Args:
+        tag: ETag текущей версии данных
+        build_payload: Функция, возвращающая тело ответа
+    """
+    if request.if_none_match.contains(tag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build_payload())
+    response.set_etag(tag)
+    # Ответ зависит от токена: браузер может хранить его, но обязан перепроверять
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def get_message_history(db, start_date=None, end_date=None, interface=None, query=None,
+                        cursor=None, offset=0, per_page=10):
+    """
+    Возвращает страницу истории сообщений, от новых к старым.
+
+    Общее число сообщений не считается: запрашивается на одну строку больше
+    страницы, и по ней определяется, есть ли следующая. С курсором страница
+    выбирается по индексу (timestamp, id) без OFFSET.
+
+    Args:
+        db: Сессия базы данных
+        start_date: Начало периода
+        end_date: Конец периода
+        interface: Тип интерфейса ('telegram', 'web', ...)
+        query: Подстрока текста запроса
+        cursor: (timestamp, id) последнего сообщения предыдущей страницы
+        offset: Число пропускаемых сообщений, если курсор не задан
+        per_page: Размер страницы
+
+    Returns:
+        Кортеж (элементы страницы, курсор следующей страницы или None)
+    """
+    stmt = select(
+        Message.id,
+        Message.user_id,
+        Message.message_text,
+        Message.timestamp,
+        UserSession.interface_type,
+        UserSession.last_escalation_time
+    ).join(UserSession, Message.session_id == UserSession.id)
+
+    if start_date:
+        stmt = stmt.where(Message.timestamp >= start_date)
+    if end_date:
+        stmt = stmt.where(Message.timestamp <= end_date)
+    if interface:
+        stmt = stmt.where(UserSession.interface_type == interface)
+    if query:
+        stmt = stmt.where(Message.message_text.ilike(f"%{query}%"))
+
+    if cursor:
+        stmt = stmt.where(tuple_(Message.timestamp, Message.id) < tuple_(*cursor))
+    elif offset:
+        stmt = stmt.offset(offset)
+
+    rows = db.execute(
+        stmt.order_by(Message.timestamp.desc(), Message.id.desc()).limit(per_page + 1)
+    ).all()
+
+    items = [{
+        'id': row.id,
+        'user_id': row.user_id,
+        'query': row.message_text,
+        'timestamp': int(row.timestamp.timestamp()),
+        'interface': row.interface_type,
+        'status': 'escalated' if row.last_escalation_time else 'answered'
+    } for row in rows[:per_page]]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last = rows[per_page - 1]
+        next_cursor = {'after_ts': last.timestamp, 'after_id': last.id}
+    return items, next_cursor
+
 @history_bp.route('/api/history', methods=['GET'])
 @token_required
 def get_history():
     """
     Возвращает историю запросов с фильтрацией и пагинацией.
+
+    Страница задаётся номером (?page=) или курсором последнего сообщения
+    предыдущей страницы (?after_ts=&after_id=).
     """
-    with db_session() as db:
     try:
-        # Получаем параметры запроса
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 10))
-        start_date_str = request.args.get('start_date')
-        end_date_str = request.args.get('end_date')
-        interface = request.args.get('interface')
-        query = request.args.get('query')
-        
-        # Преобразуем строки дат в объекты datetime
-        start_date = None
-        end_date = None
-        
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        
-        if end_date_str:
-            # Устанавливаем конец дня для end_date
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-            end_date = end_date.replace(hour=23, minute=59, second=59)
-        
-        # Получаем историю сообщений
-        history_items, total = get_message_history(
-            db, 
-            start_date=start_date,
-            end_date=end_date,
-            interface=interface if interface and interface != 'all' else None,
-            query=query,
-            page=page,
-            per_page=per_page
-        )
-        
-        return jsonify({
-            'history': history_items,
-            'total': total,
-            'page': page,
-            'per_page': per_page
-        }), 200
+        with db_session() as db:
+            # Получаем параметры запроса
+            page = max(int(request.args.get('page', 1)), 1)
+            per_page = min(max(int(request.args.get('per_page', 10)), 1), HISTORY_MAX_PER_PAGE)
+            start_date_str = request.args.get('start_date')
+            end_date_str = request.args.get('end_date')
+            interface = request.args.get('interface')
+            query = request.args.get('query')
+            after_ts = request.args.get('after_ts')
+            after_id = request.args.get('after_id')
+
+            # Преобразуем строки дат в объекты datetime
+            start_date = None
+            end_date = None
+
+            if start_date_str:
+                start_date = datetime.fromisoformat(start_date_str)
+
+            if end_date_str:
+                # Устанавливаем конец дня для end_date
+                end_date = datetime.combine(date.fromisoformat(end_date_str), END_OF_DAY)
+
+            cursor = None
+            if after_ts and after_id:
+                cursor = (datetime.fromisoformat(after_ts), int(after_id))
+
+            def build_payload():
+                # Получаем историю сообщений
+                history_items, next_cursor = get_message_history(
+                    db,
+                    start_date=start_date,
+                    end_date=end_date,
+                    interface=interface if interface and interface != 'all' else None,
+                    query=query,
+                    cursor=cursor,
+                    offset=(page - 1) * per_page,
+                    per_page=per_page
+                )
+                return {
+                    'history': history_items,
+                    'page': page,
+                    'per_page': per_page,
+                    'has_next': next_cursor is not None,
+                    'has_prev': cursor is not None or page > 1,
+                    'next_cursor': next_cursor
+                }
+
+            # Если у клиента актуальная страница, основной запрос не выполняется
+            return _json_with_etag(_history_etag(db), build_payload)
     except Exception as e:
         logger.error(f"Ошибка при получении истории запросов: {e}")
         return jsonify({'message': 'Внутренняя ошибка сервера', 'code': 'server_error'}), 500
-    finally:
 
 @history_bp.route('/api/history/<int:message_id>', methods=['GET'])
 @token_required
@@ -67,43 +186,46 @@ def get_message_details(message_id):
     """
     Возвращает детальную информацию о сообщении.
     """
-    with db_session() as db:
     try:
-        # Получаем сообщение из базы данных
-        message = db.query(Message).filter_by(id=message_id).first()
-        
-        if not message:
-            return jsonify({'message': 'Сообщение не найдено', 'code': 'message_not_found'}), 404
-        
-        # Получаем связанную сессию
-        session = message.session
-        
-        # Получаем follow-up вопросы
-        followups = []
-        for followup in message.followups:
-            followups.append({
-                'id': followup.id,
-                'question_text': followup.question_text,
-                'was_clicked': followup.was_clicked,
-                'generated_by': followup.generated_by,
-                'timestamp': int(followup.timestamp.timestamp())
-            })
-        
-        # Формируем ответ
-        result = {
-            'id': message.id,
-            'user_id': message.user_id,
-            'query': message.message_text,
-            'response': message.bot_response,
-            'timestamp': int(message.timestamp.timestamp()),
-            'interface': session.interface_type,
-            'language': message.language,
-            'confidence_score': message.confidence_score,
-            'followups': followups
-        }
-        
-        return jsonify(result), 200
+        with db_session() as db:
+            # Сообщение вместе с сессией (JOIN) и follow-up вопросами (один SELECT ... IN),
+            # без ленивых запросов при обращении к связям
+            message = db.query(Message).options(
+                joinedload(Message.session),
+                selectinload(Message.followups)
+            ).filter_by(id=message_id).first()
+
+            if not message:
+                return jsonify({'message': 'Сообщение не найдено', 'code': 'message_not_found'}), 404
+
+            # Получаем связанную сессию
+            session = message.session
+
+            # Получаем follow-up вопросы
+            followups = []
+            for followup in message.followups:
+                followups.append({
+                    'id': followup.id,
+                    'question_text': followup.question_text,
+                    'was_clicked': followup.was_clicked,
+                    'generated_by': followup.generated_by,
+                    'timestamp': int(followup.timestamp.timestamp())
+                })
+
+            # Формируем ответ
+            result = {
+                'id': message.id,
+                'user_id': message.user_id,
+                'query': message.message_text,
+                'response': message.bot_response,
+                'timestamp': int(message.timestamp.timestamp()),
+                'interface': session.interface_type,
+                'language': message.language,
+                'confidence_score': message.confidence_score,
+                'followups': followups
+            }
+
+            return jsonify(result), 200
     except Exception as e:
         logger.error(f"Ошибка при получении деталей сообщения: {e}")
         return jsonify({'message': 'Внутренняя ошибка сервера', 'code': 'server_error'}), 500
-    finally:
@@ -1,21 +1,62 @@
 """
 Маршруты для работы с профилем пользователя.
 """
+import hashlib
 import logging
-from flask import Blueprint, render_template, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, current_app
 from webapp.auth.jwt_auth import token_required, check_password, generate_password_hash
 from storage.database_unified import db_session, WebUser
+from webapp.app import render_page
 
 logger = logging.getLogger(__name__)
 
 profile_bp = Blueprint('profile', __name__)
 
+def _serialize_user(user):
+    """
+    Формирует данные профиля для ответа API.
+    """
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'role': user.role,
+        'last_login': user.last_login,
+        'created_at': user.created_at
+    }
+
+def _profile_etag(user):
+    """
+    Считает ETag профиля по полям, которые попадают в ответ.
+    """
+    stamp = f"{user.id}:{user.username}:{user.email}:{user.role}:{user.last_login}:{user.created_at}"
+    return hashlib.blake2b(stamp.encode('utf-8'), digest_size=8).hexdigest()
+
+def _json_with_etag(tag, build_payload):
+    """
+    Отвечает 304 Not Modified, если у клиента актуальная версия (If-None-Match),
+    иначе строит JSON-ответ. В обоих случаях выставляет ETag.
+
+    Args:
+        tag: ETag текущей версии данных
+        build_payload: Функция, возвращающая тело ответа
+    """
+    if request.if_none_match.contains(tag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build_payload())
+    response.set_etag(tag)
+    # Ответ зависит от токена: браузер может хранить его, но обязан перепроверять
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 @profile_bp.route('/profile')
 def profile_page():
     """
     Отображает страницу профиля пользователя.
     """
-    return render_template('tailwind/profile.html')
+    return render_page('tailwind/profile.html')
 
 @profile_bp.route('/api/profile', methods=['GET'])
 @token_required
@@ -23,32 +64,22 @@ def get_profile():
     """
     Возвращает данные профиля пользователя.
     """
-    with db_session() as db:
     try:
-        # Получаем данные пользователя из базы данных
-        user_id = g.user['sub']
-        
-        # Запрос к базе данных для получения полных данных пользователя
-        user = db.query(WebUser).filter_by(id=user_id).first()
-        
-        if not user:
-            return jsonify({'message': 'Пользователь не найден', 'code': 'user_not_found'}), 404
-        
-        # Формируем ответ
-        user_data = {
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'role': user.role,
-            'last_login': user.last_login,
-            'created_at': user.created_at
-        }
-        
-        return jsonify({'user': user_data}), 200
+        with db_session() as db:
+            # Получаем данные пользователя из базы данных
+            user_id = g.user['sub']
+
+            # Запрос к базе данных для получения полных данных пользователя
+            user = db.query(WebUser).filter_by(id=user_id).first()
+
+            if not user:
+                return jsonify({'message': 'Пользователь не найден', 'code': 'user_not_found'}), 404
+
+            # Формируем ответ; если у клиента та же версия, тело не строится
+            return _json_with_etag(_profile_etag(user), lambda: {'user': _serialize_user(user)})
     except Exception as e:
         logger.error(f"Ошибка при получении данных профиля: {e}")
         return jsonify({'message': 'Внутренняя ошибка сервера', 'code': 'server_error'}), 500
-    finally:
 
 @profile_bp.route('/api/profile', methods=['PUT'])
 @token_required
@@ -56,38 +87,30 @@ def update_profile():
     """
     Обновляет данные профиля пользователя.
     """
-    with db_session() as db:
     try:
-        # Получаем данные из запроса
-        data = request.json
-        user_id = g.user['sub']
-        
-        # Проверяем наличие обязательных полей
-        if 'email' not in data:
-            return jsonify({'message': 'Отсутствуют обязательные поля', 'code': 'missing_fields'}), 400
-        
-        # Обновляем email пользователя
-        update_web_user_email(db, user_id, data['email'])
-        
-        # Получаем обновленные данные пользователя
-        user = db.query(WebUser).filter_by(id=user_id).first()
-        
-        # Формируем ответ
-        user_data = {
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'role': user.role,
-            'last_login': user.last_login,
-            'created_at': user.created_at
-        }
-        
-        return jsonify({'message': 'Профиль успешно обновлен', 'user': user_data}), 200
+        with db_session() as db:
+            # Получаем данные из запроса
+            data = request.json
+            user_id = g.user['sub']
+
+            # Проверяем наличие обязательных полей
+            if 'email' not in data:
+                return jsonify({'message': 'Отсутствуют обязательные поля', 'code': 'missing_fields'}), 400
+
+            user = db.query(WebUser).filter_by(id=user_id).first()
+
+            if not user:
+                return jsonify({'message': 'Пользователь не найден', 'code': 'user_not_found'}), 404
+
+            # Обновляем email у уже загруженного пользователя: ответ строится
+            # из него же, без повторного SELECT
+            user.email = data['email']
+            db.flush()
+
+            return jsonify({'message': 'Профиль успешно обновлен', 'user': _serialize_user(user)}), 200
     except Exception as e:
         logger.error(f"Ошибка при обновлении профиля: {e}")
-        db.rollback()
         return jsonify({'message': 'Внутренняя ошибка сервера', 'code': 'server_error'}), 500
-    finally:
 
 @profile_bp.route('/api/profile/password', methods=['PUT'])
 @token_required
@@ -95,32 +118,35 @@ def change_password():
     """
     Изменяет пароль пользователя.
     """
-    with db_session() as db:
     try:
-        # Получаем данные из запроса
-        data = request.json
-        user_id = g.user['sub']
-        
-        # Проверяем наличие обязательных полей
-        if 'current_password' not in data or 'new_password' not in data:
-            return jsonify({'message': 'Отсутствуют обязательные поля', 'code': 'missing_fields'}), 400
-        
-        # Получаем пользователя из базы данных
-        user = db.query(WebUser).filter_by(id=user_id).first()
-        
-        # Проверяем текущий пароль
-        if not check_password(data['current_password'], user.password_hash):
-            return jsonify({'message': 'Текущий пароль указан неверно', 'code': 'invalid_password'}), 401
-        
-        # Генерируем хеш нового пароля
-        new_password_hash = generate_password_hash(data['new_password'])
-        
-        # Обновляем пароль пользователя
-        update_web_user_password(db, user_id, new_password_hash)
-        
-        return jsonify({'message': 'Пароль успешно изменен'}), 200
+        with db_session() as db:
+            # Получаем данные из запроса
+            data = request.json
+            user_id = g.user['sub']
+
+            # Проверяем наличие обязательных полей
+            if 'current_password' not in data or 'new_password' not in data:
+                return jsonify({'message': 'Отсутствуют обязательные поля', 'code': 'missing_fields'}), 400
+
+            # Получаем пользователя из базы данных
+            user = db.query(WebUser).filter_by(id=user_id).first()
+
+            if not user:
+                return jsonify({'message': 'Пользователь не найден', 'code': 'user_not_found'}), 404
+
+            # Проверяем текущий пароль
+            if not check_password(data['current_password'], user.password_hash):
+                return jsonify({'message': 'Текущий пароль указан неверно', 'code': 'invalid_password'}), 401
+
+            # Генерируем хеш нового пароля
+            new_password_hash = generate_password_hash(data['new_password'])
+
+            # Обновляем пароль у уже загруженного пользователя; flush сбрасывает
+            # его из кэша login_user, и старый пароль сразу перестаёт приниматься
+            user.password_hash = new_password_hash
+            db.flush()
+
+            return jsonify({'message': 'Пароль успешно изменен'}), 200
     except Exception as e:
         logger.error(f"Ошибка при изменении пароля: {e}")
-        db.rollback()
         return jsonify({'message': 'Внутренняя ошибка сервера', 'code': 'server_error'}), 500
-    finally:
@@ -0,0 +1,24 @@
+// Общий fetch для страниц панели оператора.
+// Подставляет JWT из localStorage. Если сервер отвечает 401 с кодом
+// token_expired_refreshable, сохраняет выданный новый токен и повторяет запрос;
+// при любом другом 401 сбрасывает сессию и переводит на страницу входа.
+async function authFetch(url, options = {}) {
+  const headers = Object.assign({}, options.headers, {
+    'Authorization': `Bearer ${localStorage.getItem('token')}`
+  });
+  const response = await fetch(url, Object.assign({}, options, { headers }));
+  if (response.status !== 401) {
+    return response;
+  }
+
+  const data = await response.clone().json().catch(() => ({}));
+  if (data.code === 'token_expired_refreshable' && data.new_access_token) {
+    localStorage.setItem('token', data.new_access_token);
+    return authFetch(url, options);
+  }
+
+  localStorage.removeItem('token');
+  localStorage.removeItem('user');
+  window.location.href = '/login';
+  return response;
+}
@@ -2,87 +2,133 @@
 Маршруты для аналитики и экспорта данных в веб-интерфейсе.
 """
 import logging
-import json
+import threading
+import time
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify, send_file, Response
-import io
+from functools import wraps
+from typing import Dict, Tuple
+from flask import Blueprint, request, jsonify, send_file, Response, current_app
+import orjson
 
 from webapp.auth.jwt_auth import token_required, role_required
-from storage.database_unified import db_session, UserSession, Message, Rating, Feedback
-from sqlalchemy import func, and_
+from storage.database_unified import db_session, UserSession, Message, MessageUser, Rating, Feedback
+from sqlalchemy import Date, func, and_, select
 
 logger = logging.getLogger(__name__)
 
 # Создаем blueprint
 stats_bp = Blueprint('stats', __name__)
 
+# Кэш агрегатов дашборда в памяти процесса: (endpoint, query string) ->
+# (срок жизни записи, тело ответа). Дашборд опрашивают каждые несколько секунд
+# несколько операторов, а цифры, отстающие на полминуты, для него допустимы
+DASHBOARD_CACHE_SIZE = 32
+DASHBOARD_CACHE_TTL_SECONDS = 30
+DASHBOARD_STALE_WHILE_REVALIDATE_SECONDS = 60
+_DASHBOARD_CACHE: Dict[Tuple[str, bytes], Tuple[float, bytes]] = {}
+_DASHBOARD_CACHE_LOCK = threading.Lock()
+
+# Длина превью текста в списке последних запросов дашборда
+RECENT_PREVIEW_LENGTH = 50
+
+# Экспорт и выборка отзывов читают строки из БД порциями этого размера
+STREAM_BATCH_SIZE = 500
+
+def cached_dashboard_response(f):
+    """
+    Декоратор: кэширует успешный JSON-ответ на DASHBOARD_CACHE_TTL_SECONDS секунд,
+    добавляет ETag и Cache-Control и отвечает 304 Not Modified на совпадающий If-None-Match.
+    Ставится после проверки прав, поэтому кэш не отдаётся без авторизации.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        cache_key = (request.endpoint, request.query_string)
+        with _DASHBOARD_CACHE_LOCK:
+            cached = _DASHBOARD_CACHE.get(cache_key)
+        if cached is not None and time.monotonic() < cached[0]:
+            response = current_app.response_class(cached[1], mimetype='application/json')
+        else:
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            with _DASHBOARD_CACHE_LOCK:
+                if len(_DASHBOARD_CACHE) >= DASHBOARD_CACHE_SIZE:
+                    _DASHBOARD_CACHE.clear()
+                _DASHBOARD_CACHE[cache_key] = (
+                    time.monotonic() + DASHBOARD_CACHE_TTL_SECONDS, response.get_data()
+                )
+
+        response.add_etag()
+        # Ответ зависит от токена, поэтому кэшировать его может только браузер
+        response.cache_control.private = True
+        response.cache_control.max_age = DASHBOARD_CACHE_TTL_SECONDS
+        response.cache_control.stale_while_revalidate = DASHBOARD_STALE_WHILE_REVALIDATE_SECONDS
+        return response.make_conditional(request)
+    return decorated
+
 @stats_bp.route('/dashboard')
 @token_required
 @role_required(['admin', 'operator'])
+@cached_dashboard_response
 def get_dashboard_stats():
     """
     Получение статистики для дашборда.
     """
     try:
         with db_session() as db:
-            # Общее количество запросов
-            total_requests = db.query(func.count(Message.id)).filter(Message.role == 'user').scalar() or 0
-
-            # Запросы за сегодня
             today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_timestamp = int(today.timestamp())
-            today_requests = db.query(func.count(Message.id)).filter(
-                Message.role == 'user',
-                Message.timestamp >= today_timestamp
-            ).scalar() or 0
+            week_start = today - timedelta(days=6)
 
-            # Уникальные пользователи
-            unique_users = db.query(func.count(func.distinct(Message.user_id))).filter(
-                Message.role == 'user'
-            ).scalar() or 0
+            # Каждая строка messages - запрос пользователя вместе с ответом бота,
+            # поэтому счётчики запросов считаются по одной таблице одним запросом.
+            # Уникальные пользователи берутся из message_users, которую ведёт
+            # save_message, - без COUNT(DISTINCT) по всем сообщениям
+            total_requests, today_requests, unique_users = db.query(
+                func.count(Message.id),
+                func.count(Message.id).filter(Message.timestamp >= today),
+                select(func.count()).select_from(MessageUser).scalar_subquery()
+            ).one()
 
             # Среднее время ответа (в секундах)
             avg_response_time = 2.5  # Заглушка, в реальности нужно вычислять
 
-            # Последние запросы
-            recent_messages = db.query(Message).filter(
-                Message.role == 'user'
+            # Последние запросы: ответ хранится в той же строке, отдельные
+            # запросы на проверку ответа не нужны. Текст обрезается и ответ
+            # проверяется на стороне БД, полные тексты не передаются
+            recent_messages = db.query(
+                Message.id,
+                Message.user_id,
+                func.substr(Message.message_text, 1, RECENT_PREVIEW_LENGTH).label('preview'),
+                (func.length(Message.message_text) > RECENT_PREVIEW_LENGTH).label('truncated'),
+                (func.length(Message.bot_response) > 0).label('answered'),
+                Message.timestamp
             ).order_by(Message.timestamp.desc()).limit(10).all()
 
             recent_requests = []
             for msg in recent_messages:
-                # Проверяем, есть ли ответ на этот запрос
-                has_answer = db.query(Message).filter(
-                    Message.chat_id == msg.chat_id,
-                    Message.role == 'assistant',
-                    Message.timestamp > msg.timestamp
-                ).first() is not None
-
                 recent_requests.append({
                     'id': msg.id,
                     'user_id': msg.user_id,
-                    'text': msg.message_text[:50] + ('...' if len(msg.message_text) > 50 else ''),
-                    'timestamp': msg.timestamp,
-                    'status': 'answered' if has_answer else 'processing'
+                    'text': msg.preview + ('...' if msg.truncated else ''),
+                    'timestamp': int(msg.timestamp.timestamp()),
+                    'status': 'answered' if msg.answered else 'processing'
                 })
 
-            # Статистика по дням (за последние 7 дней)
+            # Статистика по дням (за последние 7 дней) одним GROUP BY,
+            # дни без запросов заполняются нулями
+            day_column = func.date(Message.timestamp, type_=Date)
+            counts_by_day = dict(
+                db.query(day_column, func.count(Message.id))
+                .filter(Message.timestamp >= week_start)
+                .group_by(day_column)
+                .all()
+            )
             daily_stats = []
             for i in range(6, -1, -1):
-                day = today - timedelta(days=i)
-                day_end = day + timedelta(days=1)
-                day_start_ts = int(day.timestamp())
-                day_end_ts = int(day_end.timestamp())
-
-                count = db.query(func.count(Message.id)).filter(
-                    Message.role == 'user',
-                    Message.timestamp >= day_start_ts,
-                    Message.timestamp < day_end_ts
-                ).scalar() or 0
-
+                day = (today - timedelta(days=i)).date()
                 daily_stats.append({
-                    'date': day.strftime('%d.%m'),
-                    'count': count
+                    'date': f"{day.day:02d}.{day.month:02d}",
+                    'count': counts_by_day.get(day, 0)
                 })
 
             # Популярные темы (заглушка)
@@ -110,6 +156,7 @@ def get_dashboard_stats():
 @stats_bp.route('/dashboard', methods=['GET'])
 @token_required
 @role_required(['admin', 'operator', 'viewer'])
+@cached_dashboard_response
 def get_dashboard():
     """
     Получение основных метрик для дашборда.
@@ -117,45 +164,40 @@ def get_dashboard():
     # Получаем параметры запроса
     days = request.args.get('days', default=7, type=int)
     
-    # Вычисляем дату начала периода
-    start_date = datetime.now() - timedelta(days=days)
+    # Вычисляем дату начала периода; текущее время берётся один раз на запрос
+    now = datetime.now()
+    start_date = now - timedelta(days=days)
     
     try:
         with db_session() as db:
-            # Общее количество сессий за период
-            total_sessions = db.query(func.count(UserSession.id)).filter(
-                UserSession.start_time >= start_date
-            ).scalar() or 0
-            
-            # Количество завершенных сессий
-            completed_sessions = db.query(func.count(UserSession.id)).filter(
-                UserSession.start_time >= start_date,
-                UserSession.end_time.isnot(None)
-            ).scalar() or 0
-            
-            # Количество эскалаций к оператору
-            escalations = db.query(func.count(UserSession.id)).filter(
-                UserSession.start_time >= start_date,
-                UserSession.last_escalation_time.isnot(None)
-            ).scalar() or 0
-            
-            # Процент эскалаций
-            escalation_rate = (escalations / total_sessions * 100) if total_sessions > 0 else 0
-            
-            # Средняя оценка
-            avg_rating = db.query(func.avg(Rating.rating)).join(
+            period_filter = UserSession.start_time >= start_date
+
+            # Средние по оценкам и уверенности - скалярные подзапросы: при JOIN обеих
+            # таблиц к сессиям строки перемножались бы и искажали средние
+            avg_rating_subquery = select(func.avg(Rating.rating)).join(
                 UserSession, Rating.session_id == UserSession.id
-            ).filter(
-                UserSession.start_time >= start_date
-            ).scalar() or 0
-            
-            # Средняя уверенность в ответах
-            avg_confidence = db.query(func.avg(Message.confidence_score)).join(
+            ).where(period_filter).scalar_subquery()
+            avg_confidence_subquery = select(func.avg(Message.confidence_score)).join(
                 UserSession, Message.session_id == UserSession.id
-            ).filter(
-                UserSession.start_time >= start_date,
+            ).where(
+                period_filter,
                 Message.confidence_score.isnot(None)
-            ).scalar() or 0
+            ).scalar_subquery()
+
+            # Все метрики периода одним запросом; COUNT по колонке не учитывает NULL,
+            # поэтому завершённые сессии и эскалации считаются без отдельных фильтров
+            total_sessions, completed_sessions, escalations, avg_rating, avg_confidence = db.query(
+                func.count(UserSession.id),
+                func.count(UserSession.end_time),
+                func.count(UserSession.last_escalation_time),
+                avg_rating_subquery,
+                avg_confidence_subquery
+            ).filter(period_filter).one()
+            avg_rating = avg_rating or 0
+            avg_confidence = avg_confidence or 0
+            
+            # Процент эскалаций
+            escalation_rate = (escalations / total_sessions * 100) if total_sessions > 0 else 0
             
             # Количество сессий по типу интерфейса
             interface_counts = {}
@@ -171,7 +213,7 @@ def get_dashboard():
                 'period': {
                     'days': days,
                     'start_date': start_date.isoformat(),
-                    'end_date': datetime.now().isoformat()
+                    'end_date': now.isoformat()
                 },
                 'metrics': {
                     'total_sessions': total_sessions,
@@ -197,42 +239,37 @@ def get_daily_stats():
     # Получаем параметры запроса
     days = request.args.get('days', default=30, type=int)
     
-    # Вычисляем дату начала периода
-    start_date = datetime.now() - timedelta(days=days)
+    # Вычисляем дату начала периода; текущее время берётся один раз на запрос
+    now = datetime.now()
+    start_date = now - timedelta(days=days)
     
     with db_session() as db:
         try:
-            # Получаем данные по дням
-            daily_stats = []
-            
             current_date = start_date.date()
-            end_date = datetime.now().date()
-            
-            while current_date <= end_date:
-                day_start = datetime.combine(current_date, datetime.min.time())
-                day_end = datetime.combine(current_date, datetime.max.time())
-                
-                # Количество сессий за день
-                sessions_count = db.query(func.count(UserSession.id)).filter(
-                    UserSession.start_time >= day_start,
-                    UserSession.start_time <= day_end
-                ).scalar() or 0
-                
-                # Количество эскалаций за день
-                escalations_count = db.query(func.count(UserSession.id)).filter(
-                    UserSession.start_time >= day_start,
-                    UserSession.start_time <= day_end,
+            end_date = now.date()
+
+            # Все дни периода одним GROUP BY. Оценки присоединяются к сессиям,
+            # поэтому сессии считаются через DISTINCT, чтобы сессия с несколькими
+            # оценками не учитывалась дважды
+            day_column = func.date(UserSession.start_time, type_=Date)
+            rows = db.query(
+                day_column,
+                func.count(func.distinct(UserSession.id)),
+                func.count(func.distinct(UserSession.id)).filter(
                     UserSession.last_escalation_time.isnot(None)
-                ).scalar() or 0
-                
-                # Средняя оценка за день
-                avg_rating = db.query(func.avg(Rating.rating)).join(
-                    UserSession, Rating.session_id == UserSession.id
-                ).filter(
-                    UserSession.start_time >= day_start,
-                    UserSession.start_time <= day_end
-                ).scalar()
-                
+                ),
+                func.avg(Rating.rating)
+            ).outerjoin(
+                Rating, Rating.session_id == UserSession.id
+            ).filter(
+                UserSession.start_time >= datetime.combine(current_date, datetime.min.time())
+            ).group_by(day_column).all()
+            stats_by_day = {day: (sessions, escalations, avg_rating) for day, sessions, escalations, avg_rating in rows}
+
+            # Дни без сессий заполняются нулями
+            daily_stats = []
+            while current_date <= end_date:
+                sessions_count, escalations_count, avg_rating = stats_by_day.get(current_date, (0, 0, None))
                 daily_stats.append({
                     'date': current_date.isoformat(),
                     'sessions': sessions_count,
@@ -246,13 +283,74 @@ def get_daily_stats():
                 'period': {
                     'days': days,
                     'start_date': start_date.isoformat(),
-                    'end_date': datetime.now().isoformat()
+                    'end_date': now.isoformat()
                 },
                 'daily_stats': daily_stats
             }), 200
         finally:
             pass
 
+def iter_dialogs(db, start_date, end_date, interface_type=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Выдаёт диалоги (сессии с сообщениями) за период по одному.
+
+    Сообщения читаются одним запросом, упорядоченным по сессии, порциями
+    по batch_size строк и собираются в диалоги по мере чтения.
+
+    Args:
+        db: Сессия базы данных
+        start_date: Начало периода
+        end_date: Конец периода
+        interface_type: Тип интерфейса ('telegram', 'web') или None для всех
+        batch_size: Размер порции строк
+
+    Yields:
+        Dict[str, Any]: Диалог с полями сессии и списком сообщений
+    """
+    stmt = select(
+        UserSession.id,
+        UserSession.user_id,
+        UserSession.interface_type,
+        UserSession.language,
+        UserSession.start_time,
+        UserSession.end_time,
+        Message.timestamp,
+        Message.message_text,
+        Message.bot_response,
+        Message.confidence_score
+    ).join(
+        UserSession, Message.session_id == UserSession.id
+    ).where(
+        Message.timestamp >= start_date,
+        Message.timestamp <= end_date
+    )
+    if interface_type:
+        stmt = stmt.where(UserSession.interface_type == interface_type)
+    stmt = stmt.order_by(Message.session_id, Message.timestamp, Message.id)
+
+    dialog = None
+    for row in db.execute(stmt.execution_options(yield_per=batch_size)):
+        if dialog is None or dialog['session_id'] != row.id:
+            if dialog is not None:
+                yield dialog
+            dialog = {
+                'session_id': row.id,
+                'user_id': row.user_id,
+                'interface_type': row.interface_type,
+                'language': row.language,
+                'start_time': row.start_time,
+                'end_time': row.end_time,
+                'messages': []
+            }
+        dialog['messages'].append({
+            'timestamp': row.timestamp,
+            'query': row.message_text,
+            'response': row.bot_response,
+            'confidence_score': row.confidence_score
+        })
+    if dialog is not None:
+        yield dialog
+
 @stats_bp.route('/export/json', methods=['GET'])
 @token_required
 @role_required(['admin', 'viewer'])
@@ -279,30 +377,28 @@ def export_json():
     except ValueError:
         return jsonify({'message': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}), 400
     
-    with db_session() as db:
-        try:
-            # Экспортируем диалоги
-            from storage.database_sqlalchemy import export_dialogs
-            dialogs = export_dialogs(db, start_date, end_date, interface_type)
-            
-            # Формируем имя файла
-            filename = f"dialogs_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}"
-            if interface_type:
-                filename += f"_{interface_type}"
-            filename += ".json"
-            
-            # Создаем JSON-файл в памяти
-            json_data = json.dumps(dialogs, indent=2, ensure_ascii=False)
-            json_bytes = json_data.encode('utf-8')
-            
-            # Отправляем файл
-            return Response(
-                io.BytesIO(json_bytes),
-                mimetype='application/json',
-                headers={'Content-Disposition': f'attachment;filename={filename}'}
-            )
-        finally:
-            pass
+    # Формируем имя файла
+    filename = f"dialogs_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}"
+    if interface_type:
+        filename += f"_{interface_type}"
+    filename += ".json"
+
+    def generate():
+        # Массив отдаётся по одному диалогу, поэтому в памяти не бывает больше
+        # одного диалога и порции строк из БД
+        yield b'['
+        separator = b''
+        with db_session() as db:
+            for dialog in iter_dialogs(db, start_date, end_date, interface_type):
+                yield separator + orjson.dumps(dialog)
+                separator = b','
+        yield b']'
+
+    return Response(
+        generate(),
+        mimetype='application/json',
+        headers={'Content-Disposition': f'attachment;filename={filename}'}
+    )
 
 @stats_bp.route('/feedback', methods=['GET'])
 @token_required
@@ -316,8 +412,9 @@ def get_feedback():
     min_rating = request.args.get('min_rating', default=1, type=int)
     max_rating = request.args.get('max_rating', default=5, type=int)
     
-    # Вычисляем дату начала периода
-    start_date = datetime.now() - timedelta(days=days)
+    # Вычисляем дату начала периода; текущее время берётся один раз на запрос
+    now = datetime.now()
+    start_date = now - timedelta(days=days)
     
     with db_session() as db:
         try:
@@ -339,8 +436,10 @@ def get_feedback():
                 Rating.rating <= max_rating
             ).order_by(Rating.timestamp.desc())
             
+            # Строки читаются порциями, а не списком целиком:
+            # при большом периоде в памяти не держатся одновременно все строки и все словари
             feedback_list = []
-            for rating_id, rating, timestamp, feedback_text, user_id, interface_type in feedback_query.all():
+            for rating_id, rating, timestamp, feedback_text, user_id, interface_type in feedback_query.yield_per(STREAM_BATCH_SIZE):
                 feedback_list.append({
                     'rating_id': rating_id,
                     'rating': rating,
@@ -354,7 +453,7 @@ def get_feedback():
                 'period': {
                     'days': days,
                     'start_date': start_date.isoformat(),
-                    'end_date': datetime.now().isoformat()
+                    'end_date': now.isoformat()
                 },
                 'filters': {
                     'min_rating': min_rating,
@@ -4,7 +4,7 @@
 import os
 import logging
 from webapp.app import create_app
-from config import WEB_HOST, WEB_PORT, WEB_DEBUG, RUN_MODE
+from config import WEB_HOST, WEB_PORT, WEB_DEBUG, WEB_THREADS, RUN_MODE
 
 # Настройка логирования
 logging.basicConfig(
@@ -14,6 +14,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Максимум одновременных соединений waitress; остальные ждут в очереди accept
+WEB_CONNECTION_LIMIT = 1000
+
 def main():
     """
     Основная функция для запуска веб-интерфейса.
@@ -26,9 +29,16 @@ def main():
     # Создаем приложение
     app = create_app()
     
-    # Запускаем приложение
-    logger.info(f"Starting web interface on {WEB_HOST}:{WEB_PORT}")
-    app.run(host=WEB_HOST, port=WEB_PORT, debug=WEB_DEBUG)
+    # Запускаем приложение: в отладке - сервер разработки Flask с перезагрузкой,
+    # иначе многопоточный WSGI-сервер waitress
+    if WEB_DEBUG:
+        logger.info(f"Starting web interface (debug) on {WEB_HOST}:{WEB_PORT}")
+        app.run(host=WEB_HOST, port=WEB_PORT, debug=True)
+        return
+    
+    from waitress import serve
+    logger.info(f"Starting web interface on {WEB_HOST}:{WEB_PORT} with {WEB_THREADS} threads")
+    serve(app, host=WEB_HOST, port=WEB_PORT, threads=WEB_THREADS, connection_limit=WEB_CONNECTION_LIMIT)
 
 if __name__ == '__main__':
     main()